@@ -8,6 +8,7 @@ import os
 import math
 
 from services.email_service import send_email
+from services.indexes import IndexSpec
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -22,6 +23,17 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("admin_users", ["id"], unique=True),
+    IndexSpec("admin_users", ["email"], unique=True),
+    IndexSpec("app_users", ["id"], unique=True),
+    IndexSpec("app_users", ["status"]),
+    IndexSpec("staff_members", [("userId", 1), ("status", 1)]),
+    IndexSpec("activity_logs", [("timestamp", -1)]),
+]
+
+
 def create_token(data: dict, expires_hours: int = 24):
     to_encode = data.copy()
     to_encode["exp"] = datetime.now(timezone.utc) + timedelta(hours=expires_hours)
@@ -6,6 +6,7 @@ import uuid
 import asyncio
 
 from services.email_service import send_email, build_tournament_alert_email
+from services.indexes import IndexSpec
 
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
 
@@ -16,6 +17,14 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("alerts", ["id"], unique=True),
+    IndexSpec("alerts", [("createdAt", -1)]),
+    IndexSpec("alerts", [("read", 1), ("dismissed", 1), ("createdAt", -1)]),
+]
+
+
 class CreateAlertRequest(BaseModel):
     type: str  # flight_missing, hotel_missing, registration_pending, observation_new, slot_suggestion, reminder
     priority: str = "medium"  # high, medium, low
@@ -3,26 +3,60 @@ Routes pour la gestion des documents (OCR + CRUD + Export PDF)
 Collection MongoDB: documents
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timezone, timedelta
 from bson import ObjectId
+from pymongo import UpdateOne
+import os
 import base64
+import hashlib
+import time
 import io
 
 # Import OCR service
 from services.ocr_service import analyze_document, analyze_document_with_ai, suggest_category_from_text
+from services.indexes import IndexSpec
+from services import merchant_index, blob_store
+from services.job_queue import JobQueue, TERMINAL_STATUSES
 
 router = APIRouter(prefix="/api")
 
 # MongoDB reference (will be set by init_db)
 db = None
 
+# Asynchronous invoice analysis (?async=true); workers started in the app lifespan
+invoice_jobs = JobQueue("invoice_jobs")
+
+# How long an SSE job stream stays open, and its keep-alive interval
+JOB_STREAM_MAX_SECONDS = 600
+JOB_STREAM_KEEPALIVE_SECONDS = 15
+
+# Formats accepted for dateFacture and the startDate / endDate filters
+INVOICE_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y")
+INVOICE_DATE_BACKFILL_BATCH_SIZE = int(os.getenv("INVOICE_DATE_BACKFILL_BATCH_SIZE", "500"))
+
+# Cache-Control max-age of document files; revalidated with If-None-Match afterwards (304)
+DOCUMENT_FILE_MAX_AGE_SECONDS = int(os.getenv("DOCUMENT_FILE_MAX_AGE_SECONDS", "3600"))
+
 def init_db(database):
     global db
     db = database
+    invoice_jobs.init_db(database)
+
+
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("documents", [("createdAt", -1)]),
+    # Listing (newest first), all or by category
+    IndexSpec("documents", [("userId", 1), ("createdAt", -1)]),
+    IndexSpec("documents", [("userId", 1), ("category", 1), ("createdAt", -1)]),
+    # Date range filters: invoiceDate is the typed dateFacture
+    # Stats and export (no category; the export sorts on invoiceDate)
+    IndexSpec("documents", [("userId", 1), ("invoiceDate", -1)]),
+] + invoice_jobs.indexes
 
 
 # ============ MODELS ============
@@ -49,7 +83,7 @@ class DocumentCreate(BaseModel):
     confidence: float = 0.0
     description: Optional[str] = None
     fileType: str = "image"
-    fileBase64: Optional[str] = None  # Store original file
+    fileBase64: Optional[str] = None  # Original file, kept in the blob store (services/blob_store.py)
     userId: Optional[str] = None
 
 
@@ -79,8 +113,11 @@ class DocumentResponse(BaseModel):
     lignes: Optional[List[InvoiceLineItem]] = []
     confidence: float = 0.0
     description: Optional[str] = None
+    invoiceDate: Optional[str] = None  # dateFacture as YYYY-MM-DD
     fileType: str = "image"
     hasFile: bool = False
+    fileSize: Optional[int] = None
+    fileMimeType: Optional[str] = None
     userId: Optional[str] = None
     createdAt: Optional[str] = None
     updatedAt: Optional[str] = None
@@ -89,6 +126,7 @@ class DocumentResponse(BaseModel):
 class AnalyzeDocumentRequest(BaseModel):
     image_base64: str
     filename: Optional[str] = None
+    userId: Optional[str] = None  # Learned supplier categories of this user (services/merchant_index.py)
 
 
 class AnalyzeDocumentResponse(BaseModel):
@@ -119,6 +157,10 @@ class InvoiceData(BaseModel):
     description: Optional[str] = None
     fileType: Optional[str] = None
     pageCount: Optional[int] = None
+    pagesAnalyzed: Optional[int] = None  # ?multipage=true: pages extraites
+    totalPage: Optional[int] = None  # ?multipage=true: page d'où viennent les montants
+    extractionPath: Optional[str] = None  # text (couche texte PDF) | local (Tesseract) | vision | fallback (modèle indisponible)
+    categorySource: Optional[str] = None  # merchant_index: catégorie apprise des corrections pour ce fournisseur
     warnings: Optional[List[str]] = None
 
 
@@ -127,10 +169,180 @@ class InvoiceUploadResponse(BaseModel):
     data: Optional[InvoiceData] = None
     documentId: Optional[str] = None
     error: Optional[str] = None
+    jobId: Optional[str] = None  # Set in async mode
+    status: Optional[str] = None  # Job status in async mode
+    retake: Optional[bool] = None  # Photo refused by the quality gate: ask for a new one
+    quality: Optional[Dict[str, Any]] = None  # Quality gate measurements and problems
+    timings: Optional[Dict[str, Any]] = None  # ?debug=true: per-stage durations (services/timing.py)
+
+
+class InvoiceJobResponse(BaseModel):
+    jobId: str
+    status: str  # queued, running, done, failed
+    attempts: int = 0
+    createdAt: Optional[datetime] = None
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Optional[InvoiceUploadResponse] = None
 
 
 # ============ HELPER FUNCTIONS ============
 
+def invoice_upload_response(result: Dict[str, Any]) -> InvoiceUploadResponse:
+    """Convert an analyze_document result to the API response"""
+    if not result.get('success'):
+        return InvoiceUploadResponse(
+            success=False,
+            error=result.get('error', 'Erreur inconnue'),
+            retake=result.get('retake'),
+            quality=result.get('quality'),
+            timings=result.get('timings')
+        )
+    
+    data = result.get('data', {})
+    
+    lignes = []
+    for ligne in data.get('lignes', []):
+        if isinstance(ligne, dict):
+            lignes.append(InvoiceLineItem(**ligne))
+    
+    invoice_data = InvoiceData(
+        montantTotal=data.get('montantTotal'),
+        montantHT=data.get('montantHT'),
+        montantTVA=data.get('montantTVA'),
+        currency=data.get('currency', 'EUR'),
+        numeroFacture=data.get('numeroFacture'),
+        dateFacture=data.get('dateFacture'),
+        fournisseur=data.get('fournisseur'),
+        adresse=data.get('adresse'),
+        categorie=data.get('categorie', 'Autre'),
+        lignes=lignes,
+        confidence=data.get('confidence', 0.5),
+        needsReview=data.get('needsReview', True),
+        description=data.get('description'),
+        fileType=data.get('fileType'),
+        pageCount=data.get('pageCount'),
+        pagesAnalyzed=data.get('pagesAnalyzed'),
+        totalPage=data.get('totalPage'),
+        extractionPath=data.get('extractionPath'),
+        categorySource=data.get('categorySource'),
+        warnings=data.get('warnings')
+    )
+    
+    return InvoiceUploadResponse(success=True, data=invoice_data, timings=result.get('timings'))
+
+
+def serialize_invoice_job(job: dict) -> InvoiceJobResponse:
+    """Convert an invoice_jobs document to the API response"""
+    return InvoiceJobResponse(
+        jobId=job["_id"],
+        status=job["status"],
+        attempts=job.get("attempts", 0),
+        createdAt=job.get("createdAt"),
+        startedAt=job.get("startedAt"),
+        finishedAt=job.get("finishedAt"),
+        error=job.get("error"),
+        result=job.get("result")
+    )
+
+
+def parse_invoice_date(value: Optional[str]) -> Optional[datetime]:
+    """dateFacture (DD/MM/YYYY, or YYYY-MM-DD) as a UTC midnight datetime; None if not a date"""
+    if not value:
+        return None
+    for date_format in INVOICE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def invoice_date_query(startDate: Optional[str], endDate: Optional[str]) -> Optional[Dict[str, datetime]]:
+    """invoiceDate range (inclusive) of the startDate / endDate filters; 400 if a bound is not a date"""
+    date_query = {}
+    for operator, value in (("$gte", startDate), ("$lte", endDate)):
+        if value:
+            bound = parse_invoice_date(value)
+            if bound is None:
+                raise HTTPException(status_code=400, detail=f"Invalid date: {value} (DD/MM/YYYY or YYYY-MM-DD)")
+            date_query[operator] = bound
+    return date_query or None
+
+
+async def backfill_invoice_dates(batch_size: int = INVOICE_DATE_BACKFILL_BATCH_SIZE) -> int:
+    """
+    Set invoiceDate on documents saved before it existed (null if dateFacture is not a date)
+    Started in the background from the app lifespan; returns the number of documents updated
+    Walks the collection once in _id order (resuming after the last _id of each batch)
+    and writes each batch with one bulk_write
+    """
+    updated = 0
+    last_id = None
+    try:
+        while True:
+            query: Dict[str, Any] = {"invoiceDate": {"$exists": False}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            docs = await db.documents.find(query, {"dateFacture": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            result = await db.documents.bulk_write([
+                UpdateOne(
+                    {"_id": doc["_id"], "invoiceDate": {"$exists": False}},
+                    {"$set": {"invoiceDate": parse_invoice_date(doc.get("dateFacture"))}}
+                )
+                for doc in docs
+            ], ordered=False)
+            updated += result.modified_count
+    except Exception as e:
+        # Resumes at next startup
+        print(f"[documents] invoiceDate backfill stopped after {updated} documents: {e}")
+    return updated
+
+
+class RangeNotSatisfiable(Exception):
+    """Range header outside the file (416)"""
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte (inclusive) of a single "bytes=" range
+    None for a header to ignore (other unit, several ranges, malformed): the whole file is sent
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first or last) or not (first + last).isdigit():
+        return None
+    
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - int(last)), size - 1
+    
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match against an ETag (weak comparison, as RFC 9110 asks for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
 def serialize_document(doc: dict) -> dict:
     """Convert MongoDB document to API response format"""
     return {
@@ -143,13 +355,16 @@ def serialize_document(doc: dict) -> dict:
         "currency": doc.get("currency", "EUR"),
         "numeroFacture": doc.get("numeroFacture"),
         "dateFacture": doc.get("dateFacture"),
+        "invoiceDate": doc["invoiceDate"].strftime("%Y-%m-%d") if doc.get("invoiceDate") else None,
         "fournisseur": doc.get("fournisseur"),
         "adresse": doc.get("adresse"),
         "lignes": doc.get("lignes", []),
         "confidence": doc.get("confidence", 0.0),
         "description": doc.get("description"),
         "fileType": doc.get("fileType", "image"),
-        "hasFile": bool(doc.get("fileBase64")),
+        "hasFile": bool(doc.get("fileId") or doc.get("fileBase64")),
+        "fileSize": doc.get("fileSize"),
+        "fileMimeType": doc.get("fileMimeType"),
         "userId": doc.get("userId"),
         "createdAt": doc.get("createdAt").isoformat() if doc.get("createdAt") else None,
         "updatedAt": doc.get("updatedAt").isoformat() if doc.get("updatedAt") else None,
@@ -164,6 +379,15 @@ async def create_document(doc: DocumentCreate):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
+    # Original file stored once per content; the record keeps its reference
+    file_ref = {}
+    if doc.fileBase64:
+        try:
+            file_bytes = base64.b64decode(doc.fileBase64, validate=True)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid fileBase64")
+        file_ref = await blob_store.put(file_bytes, blob_store.sniff_mime_type(file_bytes, doc.fileType))
+    
     now = datetime.now(timezone.utc)
     
     document = {
@@ -175,13 +399,14 @@ async def create_document(doc: DocumentCreate):
         "currency": doc.currency,
         "numeroFacture": doc.numeroFacture,
         "dateFacture": doc.dateFacture,
+        "invoiceDate": parse_invoice_date(doc.dateFacture),
         "fournisseur": doc.fournisseur,
         "adresse": doc.adresse,
         "lignes": [l.dict() for l in doc.lignes] if doc.lignes else [],
         "confidence": doc.confidence,
         "description": doc.description,
         "fileType": doc.fileType,
-        "fileBase64": doc.fileBase64,
+        **file_ref,
         "userId": doc.userId,
         "createdAt": now,
         "updatedAt": now,
@@ -190,6 +415,9 @@ async def create_document(doc: DocumentCreate):
     result = await db.documents.insert_one(document)
     document["_id"] = result.inserted_id
     
+    # Category confirmed by the user for this supplier: used by the next analyses
+    await merchant_index.learn(doc.userId, doc.fournisseur, doc.category, doc.adresse)
+    
     return serialize_document(document)
 
 
@@ -209,21 +437,15 @@ async def get_documents(
     query = {}
     
     if userId:
-        # Support both userId and user_id field names for flexibility
-        query["user_id"] = userId
+        query["userId"] = userId
     
     if category:
         query["category"] = category
     
     # Date filtering
-    if startDate or endDate:
-        date_query = {}
-        if startDate:
-            date_query["$gte"] = startDate
-        if endDate:
-            date_query["$lte"] = endDate
-        if date_query:
-            query["dateFacture"] = date_query
+    date_query = invoice_date_query(startDate, endDate)
+    if date_query:
+        query["invoiceDate"] = date_query
     
     print(f"[DEBUG] Documents query: {query}")
     cursor = db.documents.find(query, {"fileBase64": 0}).sort("createdAt", -1).skip(skip).limit(limit)
@@ -246,14 +468,9 @@ async def get_documents_stats(
     query = {}
     if userId:
         query["userId"] = userId
-    if startDate or endDate:
-        date_query = {}
-        if startDate:
-            date_query["$gte"] = startDate
-        if endDate:
-            date_query["$lte"] = endDate
-        if date_query:
-            query["dateFacture"] = date_query
+    date_query = invoice_date_query(startDate, endDate)
+    if date_query:
+        query["invoiceDate"] = date_query
     
     pipeline = [
         {"$match": query},
@@ -318,34 +535,70 @@ async def get_document(document_id: str):
 
 
 @router.get("/documents/{document_id}/file")
-async def get_document_file(document_id: str):
-    """Get the original file (image/PDF) of a document"""
+async def get_document_file(document_id: str, request: Request):
+    """
+    Get the original file (image/PDF) of a document
+    Streamed from the blob store; strong ETag (SHA-256 of the file): If-None-Match -> 304,
+    single byte Range -> 206 (If-Range honored)
+    """
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
     try:
-        doc = await db.documents.find_one({"_id": ObjectId(document_id)}, {"fileBase64": 1, "fileType": 1, "name": 1})
+        doc = await db.documents.find_one(
+            {"_id": ObjectId(document_id)},
+            {"fileId": 1, "fileBase64": 1, "fileType": 1, "name": 1}
+        )
     except:
         raise HTTPException(status_code=400, detail="Invalid document ID")
     
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    if not doc.get("fileBase64"):
+    blob = await blob_store.stat(doc["fileId"]) if doc.get("fileId") else None
+    if blob is not None:
+        digest, size, media_type = blob["_id"], blob["size"], blob["mimeType"]
+        
+        def body(start: int, length: int):
+            return blob_store.stream(digest, start, length)
+    elif doc.get("fileBase64"):
+        # Not migrated to the blob store yet: already in memory
+        file_bytes = base64.b64decode(doc["fileBase64"])
+        digest, size = hashlib.sha256(file_bytes).hexdigest(), len(file_bytes)
+        media_type = blob_store.sniff_mime_type(file_bytes, doc.get("fileType", "image"))
+        
+        def body(start: int, length: int):
+            return iter([file_bytes[start:start + length]])
+    else:
         raise HTTPException(status_code=404, detail="No file attached to this document")
     
-    file_bytes = base64.b64decode(doc["fileBase64"])
-    file_type = doc.get("fileType", "image")
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={DOCUMENT_FILE_MAX_AGE_SECONDS}",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{doc.get("name", "document")}"',
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
     
-    if file_type == "pdf":
-        media_type = "application/pdf"
-    else:
-        media_type = "image/png"
+    byte_range = None
+    if request.headers.get("range") and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(request.headers["range"], size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
     
     return StreamingResponse(
-        io.BytesIO(file_bytes),
+        body(start, end - start + 1),
+        status_code=206 if byte_range else 200,
         media_type=media_type,
-        headers={"Content-Disposition": f'attachment; filename="{doc.get("name", "document")}"'}
+        headers=headers
     )
 
 
@@ -366,6 +619,9 @@ async def update_document(document_id: str, update: DocumentUpdate):
     if update_dict.get("lignes"):
         update_dict["lignes"] = [l.dict() if hasattr(l, 'dict') else l for l in update_dict["lignes"]]
     
+    if "dateFacture" in update_dict:
+        update_dict["invoiceDate"] = parse_invoice_date(update_dict["dateFacture"])
+    
     update_dict["updatedAt"] = datetime.now(timezone.utc)
     
     result = await db.documents.update_one(
@@ -377,6 +633,12 @@ async def update_document(document_id: str, update: DocumentUpdate):
         raise HTTPException(status_code=404, detail="Document not found")
     
     doc = await db.documents.find_one({"_id": object_id}, {"fileBase64": 0})
+    
+    # Category or supplier corrected: remember it for this supplier
+    if "category" in update_dict or "fournisseur" in update_dict:
+        await merchant_index.learn(doc.get("userId") or doc.get("user_id"), doc.get("fournisseur"),
+                                   doc.get("category"), doc.get("adresse"))
+    
     return serialize_document(doc)
 
 
@@ -391,11 +653,13 @@ async def delete_document(document_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid document ID")
     
-    result = await db.documents.delete_one({"_id": object_id})
+    doc = await db.documents.find_one_and_delete({"_id": object_id}, {"fileId": 1})
     
-    if result.deleted_count == 0:
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    await blob_store.release(doc.get("fileId"))
+    
     return {"success": True, "message": "Document deleted"}
 
 
@@ -435,8 +699,20 @@ async def analyze_document_endpoint(request: AnalyzeDocumentRequest):
 
 
 @router.post("/invoices/upload", response_model=InvoiceUploadResponse)
-async def upload_invoice(file: UploadFile = File(...)):
-    """Upload and analyze an invoice (image or PDF)"""
+async def upload_invoice(
+    response: Response,
+    file: UploadFile = File(...),
+    async_mode: bool = Query(False, alias="async"),
+    debug: bool = Query(False),
+    userId: Optional[str] = Query(None),
+    multipage: bool = Query(False)
+):
+    """
+    Upload and analyze an invoice (image or PDF)
+    ?async=true: return a job id at once (202); result via /invoices/jobs/{jobId}
+    ?debug=true: per-stage durations in "timings"
+    ?multipage=true: scanned PDF pages extracted concurrently and merged (totals on a later page)
+    """
     try:
         # Validate file type
         allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'application/pdf']
@@ -460,38 +736,13 @@ async def upload_invoice(file: UploadFile = File(...)):
             return InvoiceUploadResponse(success=False, error="Fichier trop volumineux (max 20MB)")
         
         file_type = 'pdf' if content_type == 'application/pdf' or file_extension == 'pdf' else 'image'
-        result = await analyze_document(file_bytes, filename, file_type)
         
-        if result.get('success'):
-            data = result.get('data', {})
-            
-            lignes = []
-            for ligne in data.get('lignes', []):
-                if isinstance(ligne, dict):
-                    lignes.append(InvoiceLineItem(**ligne))
-            
-            invoice_data = InvoiceData(
-                montantTotal=data.get('montantTotal'),
-                montantHT=data.get('montantHT'),
-                montantTVA=data.get('montantTVA'),
-                currency=data.get('currency', 'EUR'),
-                numeroFacture=data.get('numeroFacture'),
-                dateFacture=data.get('dateFacture'),
-                fournisseur=data.get('fournisseur'),
-                adresse=data.get('adresse'),
-                categorie=data.get('categorie', 'Autre'),
-                lignes=lignes,
-                confidence=data.get('confidence', 0.5),
-                needsReview=data.get('needsReview', True),
-                description=data.get('description'),
-                fileType=data.get('fileType'),
-                pageCount=data.get('pageCount'),
-                warnings=data.get('warnings')
-            )
-            
-            return InvoiceUploadResponse(success=True, data=invoice_data)
-        else:
-            return InvoiceUploadResponse(success=False, error=result.get('error', 'Erreur inconnue'))
+        if async_mode:
+            return await submit_invoice_job(response, file_bytes, filename, file_type, debug, userId, multipage)
+        
+        result = await analyze_document(file_bytes, filename, file_type, debug=debug, user_id=userId,
+                                        multipage=multipage)
+        return invoice_upload_response(result)
             
     except Exception as e:
         import traceback
@@ -500,8 +751,19 @@ async def upload_invoice(file: UploadFile = File(...)):
 
 
 @router.post("/invoices/analyze-base64", response_model=InvoiceUploadResponse)
-async def analyze_invoice_base64(request: AnalyzeDocumentRequest):
-    """Analyze a document from base64"""
+async def analyze_invoice_base64(
+    request: AnalyzeDocumentRequest,
+    response: Response,
+    async_mode: bool = Query(False, alias="async"),
+    debug: bool = Query(False),
+    multipage: bool = Query(False)
+):
+    """
+    Analyze a document from base64
+    ?async=true: return a job id at once (202); result via /invoices/jobs/{jobId}
+    ?debug=true: per-stage durations in "timings"
+    ?multipage=true: scanned PDF pages extracted concurrently and merged
+    """
     try:
         try:
             file_bytes = base64.b64decode(request.image_base64)
@@ -511,38 +773,13 @@ async def analyze_invoice_base64(request: AnalyzeDocumentRequest):
         is_pdf = file_bytes[:4] == b'%PDF'
         file_type = 'pdf' if is_pdf else 'image'
         
-        result = await analyze_document(file_bytes, request.filename or '', file_type)
+        if async_mode:
+            return await submit_invoice_job(response, file_bytes, request.filename or '', file_type, debug,
+                                            request.userId, multipage)
         
-        if result.get('success'):
-            data = result.get('data', {})
-            
-            lignes = []
-            for ligne in data.get('lignes', []):
-                if isinstance(ligne, dict):
-                    lignes.append(InvoiceLineItem(**ligne))
-            
-            invoice_data = InvoiceData(
-                montantTotal=data.get('montantTotal'),
-                montantHT=data.get('montantHT'),
-                montantTVA=data.get('montantTVA'),
-                currency=data.get('currency', 'EUR'),
-                numeroFacture=data.get('numeroFacture'),
-                dateFacture=data.get('dateFacture'),
-                fournisseur=data.get('fournisseur'),
-                adresse=data.get('adresse'),
-                categorie=data.get('categorie', 'Autre'),
-                lignes=lignes,
-                confidence=data.get('confidence', 0.5),
-                needsReview=data.get('needsReview', True),
-                description=data.get('description'),
-                fileType=data.get('fileType'),
-                pageCount=data.get('pageCount'),
-                warnings=data.get('warnings')
-            )
-            
-            return InvoiceUploadResponse(success=True, data=invoice_data)
-        else:
-            return InvoiceUploadResponse(success=False, error=result.get('error', 'Erreur inconnue'))
+        result = await analyze_document(file_bytes, request.filename or '', file_type, debug=debug,
+                                        user_id=request.userId, multipage=multipage)
+        return invoice_upload_response(result)
             
     except Exception as e:
         import traceback
@@ -550,6 +787,74 @@ async def analyze_invoice_base64(request: AnalyzeDocumentRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============ INVOICE JOBS (async mode) ============
+
+@invoice_jobs.job_handler
+async def process_invoice_job(file_bytes: bytes, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run by the job workers: same analysis and response as the synchronous endpoints"""
+    result = await analyze_document(file_bytes, params.get('filename', ''), params.get('fileType', 'image'),
+                                    debug=params.get('debug', False), user_id=params.get('userId'),
+                                    multipage=params.get('multipage', False))
+    return invoice_upload_response(result).dict()
+
+
+async def submit_invoice_job(response: Response, file_bytes: bytes, filename: str, file_type: str,
+                             debug: bool = False, user_id: Optional[str] = None,
+                             multipage: bool = False) -> InvoiceUploadResponse:
+    job_id = await invoice_jobs.submit(file_bytes, {"filename": filename, "fileType": file_type, "debug": debug,
+                                                    "userId": user_id, "multipage": multipage})
+    response.status_code = 202
+    return InvoiceUploadResponse(success=True, jobId=job_id, status="queued")
+
+
+@router.get("/invoices/jobs/{job_id}", response_model=InvoiceJobResponse)
+async def get_invoice_job(job_id: str):
+    """Status of an invoice analysis job, with its result once done"""
+    job = await invoice_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return serialize_invoice_job(job)
+
+
+@router.get("/invoices/jobs/{job_id}/events")
+async def stream_invoice_job(job_id: str, request: Request):
+    """
+    Server-Sent Events for an invoice analysis job: one "status" event per
+    status change, the last one (done/failed) carries the result
+    """
+    if not await invoice_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    
+    async def events():
+        last_status = None
+        last_sent = time.monotonic()
+        deadline = last_sent + JOB_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            job = await invoice_jobs.get(job_id)
+            if not job:
+                break
+            if job["status"] != last_status:
+                last_status = job["status"]
+                last_sent = time.monotonic()
+                payload = serialize_invoice_job(job).json()
+                yield f"event: status\ndata: {payload}\n\n"
+                if last_status in TERMINAL_STATUSES:
+                    break
+            elif time.monotonic() - last_sent >= JOB_STREAM_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if await request.is_disconnected():
+                break
+            # Woken at once by a local worker; re-read periodically for other processes
+            await invoice_jobs.wait_for_update(job_id, invoice_jobs.poll_seconds)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============ EXPORT PDF ENDPOINT ============
 
 @router.get("/documents/export/pdf")
@@ -582,25 +887,18 @@ async def export_documents_pdf(
     today = date.today()
     if period == "month":
         startDate = today.replace(day=1).strftime("%d/%m/%Y")
-        if today.month == 12:
-            endDate = today.replace(year=today.year + 1, month=1, day=1).strftime("%d/%m/%Y")
-        else:
-            endDate = today.replace(month=today.month + 1, day=1).strftime("%d/%m/%Y")
+        next_month = today.replace(year=today.year + 1, month=1, day=1) if today.month == 12 else today.replace(month=today.month + 1, day=1)
+        endDate = (next_month - timedelta(days=1)).strftime("%d/%m/%Y")
     elif period == "year":
         startDate = f"01/01/{today.year}"
         endDate = f"31/12/{today.year}"
     
-    if startDate or endDate:
-        date_query = {}
-        if startDate:
-            date_query["$gte"] = startDate
-        if endDate:
-            date_query["$lte"] = endDate
-        if date_query:
-            query["dateFacture"] = date_query
+    date_query = invoice_date_query(startDate, endDate)
+    if date_query:
+        query["invoiceDate"] = date_query
     
     # Fetch documents
-    cursor = db.documents.find(query, {"fileBase64": 0}).sort("dateFacture", -1)
+    cursor = db.documents.find(query, {"fileBase64": 0}).sort("invoiceDate", -1)
     documents = await cursor.to_list(length=1000)
     
     # Generate PDF
@@ -4,6 +4,8 @@ from typing import Optional, List
 from datetime import datetime, timezone
 import uuid
 
+from services.indexes import IndexSpec
+
 router = APIRouter(prefix="/api/events", tags=["events"])
 
 db = None
@@ -13,6 +15,13 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("events", ["id"], unique=True),
+    IndexSpec("events", ["date"]),
+]
+
+
 class CreateEventRequest(BaseModel):
     type: str
     title: str
@@ -7,9 +7,12 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
+import os
 import secrets
 import string
 
+from services.indexes import IndexSpec
+
 router = APIRouter(prefix="/api/invitations")
 
 # MongoDB reference
@@ -20,6 +23,26 @@ def init_db(database):
     db = database
 
 
+# Expired invitations stay listed (and resendable) for this long, then the TTL index purges them;
+# accepted and cancelled ones are purged the same time after acceptedAt / cancelledAt
+INVITATION_RETENTION_DAYS = int(os.getenv("INVITATION_RETENTION_DAYS", "30"))
+INVITATION_RETENTION_SECONDS = INVITATION_RETENTION_DAYS * 24 * 60 * 60
+
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("invitations", ["token"], unique=True, sparse=True),
+    IndexSpec("invitations", ["expiresAt"], expire_after_seconds=INVITATION_RETENTION_SECONDS,
+              partial_filter={"status": "pending"}),
+    IndexSpec("invitations", ["acceptedAt"], expire_after_seconds=INVITATION_RETENTION_SECONDS),
+    IndexSpec("invitations", ["cancelledAt"], expire_after_seconds=INVITATION_RETENTION_SECONDS),
+    IndexSpec("staff_tokens", ["expiresAt"], expire_after_seconds=0),
+    IndexSpec("invitations", [("playerId", 1), ("createdAt", -1)]),
+    IndexSpec("invitations", [("playerId", 1), ("inviteeEmail", 1), ("status", 1)]),
+    IndexSpec("staff_members", [("playerId", 1), ("email", 1), ("status", 1)]),
+    IndexSpec("staff_members", [("playerId", 1), ("joinedAt", -1)]),
+]
+
+
 # ============ MODELS ============
 
 class CreateInvitationRequest(BaseModel):
@@ -73,6 +96,15 @@ def make_aware(dt):
     return dt
 
 
+def effective_invitation_status(inv: dict) -> str:
+    """Stored status, with pending invitations past expiresAt reported as expired"""
+    status = inv.get("status", "pending")
+    expires_at = make_aware(inv.get("expiresAt"))
+    if status == "pending" and expires_at and expires_at < datetime.now(timezone.utc):
+        return "expired"
+    return status
+
+
 def serialize_invitation(inv: dict) -> dict:
     """Convert MongoDB invitation to API response"""
     return {
@@ -84,7 +116,7 @@ def serialize_invitation(inv: dict) -> dict:
         "inviteeName": inv.get("inviteeName"),
         "role": inv.get("role", "other"),
         "roleCustom": inv.get("roleCustom"),
-        "status": inv.get("status", "pending"),
+        "status": effective_invitation_status(inv),
         "createdAt": inv.get("createdAt").isoformat() if inv.get("createdAt") else None,
         "sentAt": inv.get("sentAt").isoformat() if inv.get("sentAt") else None,
         "expiresAt": inv.get("expiresAt").isoformat() if inv.get("expiresAt") else None,
@@ -253,17 +285,7 @@ async def get_invitation_by_token(token: str):
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation non trouvée")
     
-    # Check if expired
-    now = datetime.now(timezone.utc)
-    expires_at = make_aware(invitation.get("expiresAt"))
-    if expires_at and expires_at < now:
-        if invitation.get("status") == "pending":
-            await db.invitations.update_one(
-                {"_id": invitation["_id"]},
-                {"$set": {"status": "expired"}}
-            )
-            invitation["status"] = "expired"
-    
+    # Expiry is reported by serialize_invitation, no write needed
     return serialize_invitation(invitation)
 
 
@@ -289,17 +311,6 @@ async def get_player_invitations(player_id: str):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
-    # Update expired invitations
-    now = datetime.now(timezone.utc)
-    await db.invitations.update_many(
-        {
-            "playerId": player_id,
-            "status": "pending",
-            "expiresAt": {"$lt": now}
-        },
-        {"$set": {"status": "expired"}}
-    )
-    
     cursor = db.invitations.find({"playerId": player_id}).sort("createdAt", -1)
     invitations = await cursor.to_list(length=100)
     
@@ -348,9 +359,11 @@ async def cancel_invitation(invitation_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid invitation ID")
     
+    # An expired invitation is no longer pending (effective_invitation_status)
+    now = datetime.now(timezone.utc)
     result = await db.invitations.update_one(
-        {"_id": object_id, "status": "pending"},
-        {"$set": {"status": "cancelled"}}
+        {"_id": object_id, "status": "pending", "expiresAt": {"$gt": now}},
+        {"$set": {"status": "cancelled", "cancelledAt": now}}
     )
     
     if result.matched_count == 0:
@@ -3,6 +3,8 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone
 
+from services.indexes import IndexSpec
+
 router = APIRouter(prefix="/api/preferences", tags=["preferences"])
 
 db = None
@@ -12,6 +14,12 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("user_preferences", ["userId"], unique=True),
+]
+
+
 class VoyagePreferences(BaseModel):
     travelClass: Optional[str] = None
     airlines: List[str] = []
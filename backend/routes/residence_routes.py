@@ -9,6 +9,8 @@ from typing import Optional, List
 from datetime import datetime, timezone
 import uuid
 
+from services.indexes import IndexSpec
+
 router = APIRouter(prefix="/api/residence", tags=["residence"])
 db = None
 
@@ -17,6 +19,12 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("day_presences", ["date"], unique=True),
+]
+
+
 # ── Models ──
 
 class DayPresenceCreate(BaseModel):
@@ -4,6 +4,8 @@ from typing import Optional, List
 from datetime import datetime, timezone
 import uuid
 
+from services.indexes import IndexSpec
+
 router = APIRouter(prefix="/api/tournaments", tags=["tournaments"])
 
 db = None
@@ -13,6 +15,20 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("tournaments", ["id"], unique=True),
+    IndexSpec("tournaments", [("circuit", 1), ("startDate", 1)]),
+    IndexSpec("tournaments", ["circuit"]),
+    IndexSpec("tournaments", ["startDate"]),
+    IndexSpec("tournaments", ["week"]),
+    IndexSpec("tournaments", ["category"]),
+    IndexSpec("tournament_registrations", ["tournamentId"], unique=True),
+    IndexSpec("tournament_registrations", ["status"]),
+    IndexSpec("tournament_hidden", ["tournamentId"], unique=True),
+]
+
+
 class RegisterTournamentRequest(BaseModel):
     tournamentId: str
     status: str  # interested, pending, accepted, participating, declined
@@ -4,10 +4,13 @@ Routes pour l'onboarding utilisateur et la gestion du profil
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Any
 from datetime import datetime, timezone
 from bson import ObjectId
 
+from services.indexes import IndexSpec
+from services.session_cache import session_cache
+
 router = APIRouter(prefix="/api/users")
 
 # MongoDB reference
@@ -18,6 +21,18 @@ def init_db(database):
     db = database
 
 
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("users", ["email"]),
+]
+
+
+def invalidate_cached_sessions(user: Optional[Dict[str, Any]]):
+    """Drop the cached sessions of an updated user, so the next request reads the new document"""
+    if user and user.get("user_id"):
+        session_cache.invalidate_user(user["user_id"])
+
+
 # ============ MODELS ============
 
 class TravelPreferences(BaseModel):
@@ -157,6 +172,7 @@ async def create_or_update_onboarding(data: OnboardingData):
             {"_id": existing["_id"]},
             {"$set": user_data}
         )
+        invalidate_cached_sessions(existing)
         user_data["_id"] = existing["_id"]
         user_data["createdAt"] = existing.get("createdAt", now)
     else:
@@ -199,6 +215,7 @@ async def update_onboarding(user_id: str, data: OnboardingUpdate):
         raise HTTPException(status_code=404, detail="User not found")
     
     user = await db.users.find_one({"_id": object_id})
+    invalidate_cached_sessions(user)
     return serialize_user(user)
 
 
@@ -240,6 +257,7 @@ async def update_profile(user_id: str, data: ProfileUpdate):
         raise HTTPException(status_code=404, detail="User not found")
     
     user = await db.users.find_one({"_id": object_id})
+    invalidate_cached_sessions(user)
     return serialize_user(user)
 
 
@@ -287,17 +305,20 @@ async def complete_onboarding(user_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid user ID")
     
-    result = await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {"_id": object_id},
         {"$set": {
             "onboardingCompleted": True,
             "updatedAt": datetime.now(timezone.utc)
-        }}
+        }},
+        projection={"user_id": 1}
     )
     
-    if result.matched_count == 0:
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_cached_sessions(user)
+    
     return {"success": True, "message": "Onboarding completed"}
 
 
@@ -315,15 +336,18 @@ async def update_onboarding_step(user_id: str, step: int):
     if step < 1 or step > 10:
         raise HTTPException(status_code=400, detail="Step must be between 1 and 10")
     
-    result = await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {"_id": object_id},
         {"$set": {
             "onboardingStep": step,
             "updatedAt": datetime.now(timezone.utc)
-        }}
+        }},
+        projection={"user_id": 1}
     )
     
-    if result.matched_count == 0:
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_cached_sessions(user)
+    
     return {"success": True, "step": step}
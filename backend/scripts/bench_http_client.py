@@ -0,0 +1,127 @@
+"""
+Benchmark: new httpx.AsyncClient per request vs the shared pooled client
+(services/http_client.py) against a local stub upstream.
+
+Usage (from backend/):
+    python scripts/bench_http_client.py [--requests 500] [--concurrency 10] [--tls]
+
+--tls serves the stub over HTTPS with a throwaway self-signed certificate
+(needs the openssl CLI), which is closest to the real auth/LLM upstreams
+where the per-request TLS handshake dominates.
+"""
+
+import os
+import sys
+import ssl
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import http_client  # noqa: E402
+
+
+async def stub_app(scope, receive, send):
+    """Minimal ASGI upstream returning a small JSON body"""
+    if scope["type"] != "http":
+        return
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b'{"ok": true}'})
+
+
+def start_stub(port: int, certfile: str = None, keyfile: str = None) -> uvicorn.Server:
+    config = uvicorn.Config(stub_app, host="127.0.0.1", port=port, log_level="error",
+                            ssl_certfile=certfile, ssl_keyfile=keyfile)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def make_certificate(directory: str):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True
+    )
+    return certfile, keyfile
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(label, send_one, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await send_one()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} p50={percentile(latencies, 50):7.2f} ms  p99={percentile(latencies, 99):7.2f} ms  "
+          f"mean={statistics.mean(latencies):7.2f} ms  throughput={total / elapsed:8.1f} req/s")
+    return latencies
+
+
+async def main(args):
+    verify = False
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.tls:
+            certfile, keyfile = make_certificate(tmp)
+            server = start_stub(args.port, certfile, keyfile)
+            url = f"https://127.0.0.1:{args.port}/session-data"
+            verify = ssl.create_default_context()
+            verify.check_hostname = False
+            verify.verify_mode = ssl.CERT_NONE
+        else:
+            server = start_stub(args.port)
+            url = f"http://127.0.0.1:{args.port}/session-data"
+
+        async def per_request_client():
+            async with httpx.AsyncClient(verify=verify) as client:
+                (await client.get(url)).raise_for_status()
+
+        pooled = http_client.build_client(verify=verify)
+
+        async def shared_client():
+            (await pooled.get(url)).raise_for_status()
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, {'HTTPS' if args.tls else 'HTTP'} stub\n")
+        # Warm-up
+        await run("warm-up", shared_client, min(50, args.requests), args.concurrency)
+        before = await run("client per request", per_request_client, args.requests, args.concurrency)
+        after = await run("shared pooled client", shared_client, args.requests, args.concurrency)
+        await pooled.aclose()
+
+        print(f"\np50 gain: {percentile(before, 50) / percentile(after, 50):.1f}x   "
+              f"p99 gain: {percentile(before, 99) / percentile(after, 99):.1f}x")
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--port", type=int, default=18555)
+    parser.add_argument("--tls", action="store_true")
+    asyncio.run(main(parser.parse_args()))
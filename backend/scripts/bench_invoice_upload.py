@@ -0,0 +1,127 @@
+"""
+Benchmark: throughput and latency of POST /api/invoices/upload, offline
+
+Runs the FastAPI app in-process (httpx ASGI transport, no server, no
+network) with the extraction backend chosen by --backend
+(services/ocr_backends.py): "stub" answers after --latency-ms, "local"
+runs Tesseract. The whole pipeline is measured: upload parsing, quality
+gate, crop, Vision payload encoding, the LLM guard (concurrency cap,
+LLM_PROVIDER_MAX_CONCURRENCY) and response validation. The OCR cache is
+disabled so every upload is analyzed.
+
+Inputs are synthetic receipt photos (JPEG) rendered from the OCR corpus in
+scripts/data/receipt_ocr_samples.txt.
+
+Usage (from backend/):
+    python scripts/bench_invoice_upload.py [--requests 200] [--concurrency 20]
+        [--backend stub] [--latency-ms 800] [--jitter-ms 200] [--error-rate 0]
+        [--size 2016x1512] [--local-tier]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(args):
+    """Environment read by the services at import time: set before importing the app"""
+    os.environ["OCR_BACKEND"] = args.backend
+    os.environ["OCR_STUB_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["OCR_STUB_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["OCR_STUB_ERROR_RATE"] = str(args.error_rate)
+    os.environ["OCR_CACHE_ENABLED"] = "0"
+    os.environ["OCR_LOCAL_TIER_ENABLED"] = "1" if args.local_tier else "0"
+
+
+def render_uploads(count: int, size):
+    import io
+    from bench_receipt_crop import render_photo, load_corpus, DEFAULT_CORPUS
+    corpus = load_corpus(DEFAULT_CORPUS)
+    uploads = []
+    for i in range(count):
+        photo = render_photo(corpus[i % len(corpus)], angle=(i % 7) - 3.0, seed=i).resize(size)
+        buffer = io.BytesIO()
+        photo.save(buffer, format="JPEG", quality=88)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def main(args):
+    import httpx
+    from server import app
+    from services import http_client, metrics, receipt_ocr
+    from services.llm_guard import llm_guard
+
+    width, height = (int(v) for v in args.size.split("x"))
+    uploads = render_uploads(args.distinct, (width, height))
+    if args.local_tier or args.backend == "local":
+        receipt_ocr.receipt_ocr_pool.start()
+
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, outcomes = [], {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/invoices/upload",
+                                             files={"file": (f"ticket-{i}.jpg", uploads[i % len(uploads)], "image/jpeg")})
+                latencies.append((time.perf_counter() - started) * 1000)
+                body = response.json()
+                if response.status_code != 200:
+                    outcome = f"http_{response.status_code}"
+                elif body.get("success"):
+                    outcome = (body.get("data") or {}).get("extractionPath") or "ok"
+                else:
+                    outcome = "retake" if body.get("retake") else "failed"
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    await http_client.close()
+    if args.local_tier or args.backend == "local":
+        receipt_ocr.receipt_ocr_pool.shutdown()
+
+    print(f"backend={args.backend} latency={args.latency_ms:.0f}±{args.jitter_ms:.0f} ms "
+          f"error_rate={args.error_rate} size={width}x{height} "
+          f"guard_concurrency={llm_guard.max_concurrency} client_concurrency={args.concurrency}")
+    print(f"{args.requests} uploads in {elapsed:.2f} s: {args.requests / elapsed:.1f} req/s")
+    print(f"latency ms: p50 {percentile(latencies, 50):.0f}  p95 {percentile(latencies, 95):.0f}  "
+          f"p99 {percentile(latencies, 99):.0f}  mean {statistics.mean(latencies):.0f}")
+    print(f"outcomes: {outcomes}")
+    # Where the time goes: mean duration of each analyze_document stage (services/timing.py)
+    print("stage means (ms):")
+    for entry in metrics.snapshot().get("pipeline_stage_seconds", []):
+        if entry["labels"]["pipeline"] == "analyze_document":
+            print(f"  {entry['labels']['stage']:<14} {entry['sum'] / entry['count'] * 1000:8.1f}  (n={entry['count']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--backend", default="stub")
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--size", default="2016x1512", help="photo size (WxH)")
+    parser.add_argument("--distinct", type=int, default=16, help="distinct photos rendered")
+    parser.add_argument("--local-tier", action="store_true", help="run the Tesseract tier first")
+    arguments = parser.parse_args()
+    configure(arguments)
+    asyncio.run(main(arguments))
@@ -0,0 +1,101 @@
+"""
+Benchmark: receipt auto-crop and deskew (services/receipt_crop.py)
+Phone photos (4032x3024) of synthetic receipts rendered from the OCR corpus
+in scripts/data/receipt_ocr_samples.txt, rotated by a known angle on a
+table with uneven light and sensor noise.
+
+Reports per photo: angle error, crop time, and the Vision payload with and
+without the crop stage (OCR_AUTO_CROP toggled in-process).
+
+Usage (from backend/):
+    python scripts/bench_receipt_crop.py [--samples 8] [--rounds 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import receipt_crop  # noqa: E402
+from services.receipt_crop import crop_receipt, detect_receipt  # noqa: E402
+from services.ocr_service import prepare_vision_payload  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "receipt_ocr_samples.txt")
+ANGLES = (0.0, 2.0, -4.0, 7.0, -12.0, 20.0, -25.0, 1.5)
+TABLE = (120, 86, 60)
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [s.strip("\n") for s in f.read().split("=====") if s.strip()]
+
+
+def render_photo(text: str, angle: float, seed: int) -> Image.Image:
+    """Receipt rotated by angle (counterclockwise) on a table: uneven light, noise"""
+    rng = np.random.default_rng(seed)
+    lines = text.splitlines()
+    receipt = Image.new("RGB", (1100, 160 + 64 * len(lines)), (246, 243, 236))
+    draw = ImageDraw.Draw(receipt)
+    font = ImageFont.load_default(size=40)
+    for i, line in enumerate(lines):
+        draw.text((60, 80 + i * 64), line, fill=(40, 40, 48), font=font)
+    receipt = receipt.rotate(angle, Image.Resampling.BICUBIC, expand=True, fillcolor=TABLE)
+
+    photo = Image.new("RGB", (4032, 3024), TABLE)
+    scale = 2700 / receipt.height
+    receipt = receipt.resize((int(receipt.width * scale), 2700), Image.Resampling.BICUBIC)
+    photo.paste(receipt, ((4032 - receipt.width) // 2, 160))
+
+    pixels = np.asarray(photo, dtype=np.float32)
+    light = np.linspace(1.05, 0.7, photo.width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 6, pixels.shape).astype(np.float32)
+    return Image.fromarray(np.clip(pixels * light + noise, 0, 255).astype(np.uint8))
+
+
+def timed(fn, rounds):
+    best, result = None, None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(args):
+    corpus = load_corpus(args.corpus)[:args.samples]
+    errors, crop_seconds, sizes, payloads = [], [], [], {True: [], False: []}
+
+    print(f"{'angle':>6} {'found':>6} {'crop ms':>8} {'cropped to':>11} {'payload KB':>11} {'no crop KB':>11}")
+    for i, text in enumerate(corpus):
+        angle = ANGLES[i % len(ANGLES)]
+        photo = render_photo(text, angle, i)
+        found = detect_receipt(photo.convert("L")).angle
+        seconds, cropped = timed(lambda: crop_receipt(photo, max_size=2000), args.rounds)
+        errors.append(abs(found + angle))
+        crop_seconds.append(seconds)
+        sizes.append(cropped.size)
+        for enabled in (True, False):
+            receipt_crop.AUTO_CROP_ENABLED = enabled
+            payloads[enabled].append(len(prepare_vision_payload(photo).data))
+        receipt_crop.AUTO_CROP_ENABLED = True
+        print(f"{angle:6.1f} {-found:6.2f} {seconds * 1000:8.0f} {cropped.width:>5}x{cropped.height:<5} "
+              f"{payloads[True][-1] / 1024:11.0f} {payloads[False][-1] / 1024:11.0f}")
+
+    print(f"\n{len(corpus)} photos: angle error mean {statistics.mean(errors):.2f} max {max(errors):.2f} degrees, "
+          f"crop {statistics.mean(crop_seconds) * 1000:.0f} ms, Vision payload "
+          f"{statistics.mean(payloads[True]) / 1024:.0f} KB (no crop: {statistics.mean(payloads[False]) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    main(parser.parse_args())
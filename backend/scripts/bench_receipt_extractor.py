@@ -0,0 +1,193 @@
+"""
+Micro-benchmark: receipt field extraction on OCR text
+Previous per-field functions (copied below from server.py, unchanged) vs
+the single-pass extractor (services/receipt_extractor.py), over the sample
+OCR corpus in scripts/data/receipt_ocr_samples.txt. Also reports receipts
+where the two disagree.
+
+Usage (from backend/):
+    python scripts/bench_receipt_extractor.py [--rounds 2000] [--corpus PATH]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.receipt_extractor import extract_receipt_fields  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "receipt_ocr_samples.txt")
+
+
+# ---- Previous implementation (server.py) ----
+
+def extract_amount_from_text(text: str) -> Optional[float]:
+    """Extract the total amount from OCR text using regex patterns"""
+    # Common patterns for totals in receipts (French and English)
+    amount_patterns = [
+        # French patterns
+        r'(?:total|montant|solde|net\s*[àa]\s*payer|somme)\s*[:=]?\s*\$?\s*(\d+[\.,]\d{2})',
+        r'(?:total|montant)\s*[:=]?\s*(\d+[\.,]\d{2})\s*\$',
+        # Currency with $ sign
+        r'(\d+[\.,]\d{2})\s*\$',
+        r'\$\s*(\d+[\.,]\d{2})',
+        # Amount patterns at end of line (common for totals)
+        r'(?:total|ttc|tva\s*incluse|net).*?(\d+[\.,]\d{2})',
+        # Generic large amounts (likely totals)
+        r'(\d{2,}[\.,]\d{2})',
+    ]
+    
+    amounts = []
+    for pattern in amount_patterns:
+        matches = re.findall(pattern, text.lower(), re.IGNORECASE | re.MULTILINE)
+        for match in matches:
+            try:
+                # Convert comma to dot for float parsing
+                amount = float(match.replace(',', '.'))
+                if 0.01 <= amount <= 100000:  # Reasonable receipt amount range
+                    amounts.append(amount)
+            except ValueError:
+                continue
+    
+    # Return the largest amount found (likely the total)
+    if amounts:
+        return max(amounts)
+    return None
+
+def extract_date_from_text(text: str) -> Optional[str]:
+    """Extract date from OCR text"""
+    # Various date patterns
+    date_patterns = [
+        # DD/MM/YYYY or DD-MM-YYYY
+        r'(\d{1,2})[/\-](\d{1,2})[/\-](20\d{2})',
+        # YYYY-MM-DD
+        r'(20\d{2})[/\-](\d{1,2})[/\-](\d{1,2})',
+        # Month names in French
+        r'(\d{1,2})\s+(janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre)\s+(20\d{2})',
+        # Abbreviated months
+        r'(\d{1,2})\s+(jan|fev|fév|mar|avr|mai|jun|jui|juil|aou|aoû|sep|oct|nov|dec|déc)\.?\s+(20\d{2})',
+    ]
+    
+    month_map = {
+        'janvier': '01', 'février': '02', 'mars': '03', 'avril': '04',
+        'mai': '05', 'juin': '06', 'juillet': '07', 'août': '08',
+        'septembre': '09', 'octobre': '10', 'novembre': '11', 'décembre': '12',
+        'jan': '01', 'fev': '02', 'fév': '02', 'mar': '03', 'avr': '04',
+        'jun': '06', 'jui': '07', 'juil': '07', 'aou': '08', 'aoû': '08',
+        'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12', 'déc': '12'
+    }
+    
+    for pattern in date_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            groups = match.groups()
+            if len(groups) == 3:
+                if groups[0].isdigit() and len(groups[0]) == 4:  # YYYY-MM-DD
+                    return f"{groups[2].zfill(2)}/{groups[1].zfill(2)}/{groups[0]}"
+                elif groups[1] in month_map:  # DD Month YYYY
+                    return f"{groups[0].zfill(2)}/{month_map[groups[1]]}/{groups[2]}"
+                else:  # DD/MM/YYYY
+                    day = groups[0].zfill(2)
+                    month = groups[1].zfill(2)
+                    year = groups[2]
+                    if int(month) <= 12:
+                        return f"{day}/{month}/{year}"
+    
+    return None
+
+def extract_merchant_from_text(text: str) -> Optional[str]:
+    """Extract merchant name from first lines of OCR text"""
+    lines = [l.strip() for l in text.split('\n') if l.strip()]
+    
+    # Usually merchant name is in the first few lines
+    for line in lines[:5]:
+        # Skip lines that are just numbers, dates, or common header text
+        if re.match(r'^[\d\s\-/\.]+$', line):
+            continue
+        if any(skip in line.lower() for skip in ['facture', 'reçu', 'ticket', 'date', 'heure', 'www.', 'http']):
+            continue
+        if len(line) >= 3 and len(line) <= 50:
+            return line.title()
+    
+    return None
+
+def categorize_receipt(text: str, merchant: Optional[str]) -> str:
+    """Categorize the receipt based on text content"""
+    text_lower = text.lower()
+    merchant_lower = (merchant or '').lower()
+    
+    # Travel keywords
+    travel_keywords = ['avion', 'flight', 'airline', 'train', 'sncf', 'hotel', 'hôtel', 
+                      'taxi', 'uber', 'lyft', 'péage', 'carburant', 'essence', 'parking',
+                      'aeroport', 'aéroport', 'airport', 'baggage', 'voyage', 'air france',
+                      'booking', 'expedia', 'airbnb']
+    
+    # Medical keywords
+    medical_keywords = ['pharmacie', 'pharmacy', 'médecin', 'doctor', 'clinique', 'clinic',
+                       'hôpital', 'hospital', 'kiné', 'physio', 'dentiste', 'dentist',
+                       'ordonnance', 'prescription', 'laboratoire', 'analyse', 'santé']
+    
+    # Check for travel
+    if any(kw in text_lower or kw in merchant_lower for kw in travel_keywords):
+        return 'travel'
+    
+    # Check for medical
+    if any(kw in text_lower or kw in merchant_lower for kw in medical_keywords):
+        return 'medical'
+    
+    # Default to invoices (general expenses)
+    return 'invoices'
+
+
+def previous_extract(text: str) -> dict:
+    merchant = extract_merchant_from_text(text)
+    return {
+        "amount": extract_amount_from_text(text),
+        "date": extract_date_from_text(text),
+        "merchant": merchant,
+        "category": categorize_receipt(text, merchant),
+    }
+
+
+# ---- Benchmark ----
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [sample.strip("\n") for sample in f.read().split("=====") if sample.strip()]
+
+
+def timed(fn, corpus, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in corpus:
+            fn(text)
+    return (time.perf_counter() - started) / (rounds * len(corpus))
+
+
+def main(args):
+    corpus = load_corpus(args.corpus)
+
+    mismatches = 0
+    for i, text in enumerate(corpus):
+        before, after = previous_extract(text), extract_receipt_fields(text)
+        if before != after:
+            mismatches += 1
+            print(f"sample {i}: previous={before} single-pass={after}")
+    print(f"{len(corpus)} samples, {mismatches} with different results")
+
+    previous = timed(previous_extract, corpus, args.rounds)
+    single_pass = timed(extract_receipt_fields, corpus, args.rounds)
+    print(f"previous functions : {previous * 1e6:8.1f} us/receipt")
+    print(f"single-pass        : {single_pass * 1e6:8.1f} us/receipt")
+    print(f"speedup            : {previous / single_pass:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    main(parser.parse_args())
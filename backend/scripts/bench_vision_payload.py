@@ -0,0 +1,193 @@
+"""
+Benchmark: image payload sent to GPT-4o Vision by analyze_document
+Previous encoding (preprocess up to 2500px + PNG optimize, copied below from
+services/ocr_service.py, unchanged) vs services/vision_payload.py, on
+synthetic invoices rendered from the OCR corpus in
+scripts/data/receipt_ocr_samples.txt, as two kinds of input:
+- document: A4 page rendered at 300 DPI (digital or scanned PDF)
+- photo: phone photo (4032x3024) of the receipt on a table, uneven light, sensor noise
+
+Reports per kind: preprocessing + encoding time, base64 payload size, and
+PSNR of the decoded payload against the preprocessed image at the
+resolution the model uses (2048px box, 768px short side): the encoding
+loss the model actually sees.
+
+--accuracy also sends both payloads to the Vision model and compares the
+extracted montantTotal with the sample's total (needs EMERGENT_LLM_KEY and
+network access; one call per sample and variant).
+
+Usage (from backend/):
+    python scripts/bench_vision_payload.py [--samples 8] [--rounds 3] [--accuracy]
+"""
+
+import io
+import os
+import sys
+import time
+import base64
+import asyncio
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ocr_service import preprocess_image_for_ocr, prepare_vision_payload  # noqa: E402
+from services.receipt_extractor import extract_receipt_fields  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "receipt_ocr_samples.txt")
+
+
+# ---- Previous implementation (services/ocr_service.py) ----
+
+def previous_preprocess(image: Image.Image) -> Image.Image:
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    min_dimension = 800
+    max_dimension = 2500
+
+    width, height = image.size
+
+    if max(width, height) < min_dimension:
+        scale = min_dimension / max(width, height)
+        new_size = (int(width * scale), int(height * scale))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    elif max(width, height) > max_dimension:
+        scale = max_dimension / max(width, height)
+        new_size = (int(width * scale), int(height * scale))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(1.3)
+    enhancer = ImageEnhance.Sharpness(image)
+    image = enhancer.enhance(1.5)
+    return image
+
+
+def previous_image_to_base64(image: Image.Image) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    buffer.seek(0)
+    return base64.b64encode(buffer.read()).decode('utf-8')
+
+
+def previous_payload(image: Image.Image) -> str:
+    return previous_image_to_base64(previous_preprocess(image))
+
+
+def new_payload(image: Image.Image) -> str:
+    return prepare_vision_payload(image).base64()
+
+
+# ---- Synthetic corpus ----
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [s.strip("\n") for s in f.read().split("=====") if s.strip()]
+
+
+def render_document(text: str) -> Image.Image:
+    """A4 page at 300 DPI, black text on white"""
+    page = Image.new("RGB", (2480, 3508), "white")
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=44)
+    for i, line in enumerate(text.splitlines()):
+        draw.text((220, 300 + i * 70), line, fill="black", font=font)
+    return page
+
+
+def render_photo(text: str, seed: int) -> Image.Image:
+    """Receipt on a table, phone camera: uneven light, slight rotation, noise"""
+    rng = np.random.default_rng(seed)
+    lines = text.splitlines()
+    receipt = Image.new("RGB", (1100, 160 + 64 * len(lines)), (246, 243, 236))
+    draw = ImageDraw.Draw(receipt)
+    font = ImageFont.load_default(size=40)
+    for i, line in enumerate(lines):
+        draw.text((60, 80 + i * 64), line, fill=(40, 40, 48), font=font)
+    receipt = receipt.rotate(float(rng.uniform(-3, 3)), expand=True, fillcolor=(120, 86, 60))
+
+    photo = Image.new("RGB", (4032, 3024), (120, 86, 60))
+    scale = 2800 / receipt.height
+    receipt = receipt.resize((int(receipt.width * scale), 2800), Image.Resampling.BICUBIC)
+    photo.paste(receipt, ((4032 - receipt.width) // 2, 112))
+
+    pixels = np.asarray(photo, dtype=np.float32)
+    light = np.linspace(1.05, 0.7, photo.width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 6, pixels.shape).astype(np.float32)
+    return Image.fromarray(np.clip(pixels * light + noise, 0, 255).astype(np.uint8))
+
+
+# ---- Measurements ----
+
+def decode(payload_b64: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(payload_b64))).convert("L")
+
+
+def psnr(reference: Image.Image, payload_b64: str) -> float:
+    decoded = decode(payload_b64)
+    if decoded.size != reference.size:
+        decoded = decoded.resize(reference.size, Image.Resampling.LANCZOS)
+    a = np.asarray(reference, dtype=np.float64)
+    b = np.asarray(decoded, dtype=np.float64)
+    mse = float(np.mean((a - b) ** 2))
+    return 99.0 if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def timed(fn, image, rounds):
+    best, result = None, None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(image)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+async def extracted_total(payload_b64: str):
+    from services.ocr_service import extract_invoice_data_with_openai
+    result = await extract_invoice_data_with_openai(payload_b64)
+    return (result.get("data") or {}).get("montantTotal")
+
+
+def main(args):
+    corpus = load_corpus(args.corpus)[:args.samples]
+    variants = [("previous", previous_payload), ("optimized", new_payload)]
+
+    for kind, render in (("document", lambda t, i: render_document(t)), ("photo", render_photo)):
+        stats = {name: {"seconds": [], "bytes": [], "psnr": [], "correct": 0} for name, _ in variants}
+        for i, text in enumerate(corpus):
+            image = render(text, i)
+            # What the model sees at best: preprocessed image at its working resolution
+            reference = preprocess_image_for_ocr(image).convert("L")
+            expected = extract_receipt_fields(text)["amount"]
+            for name, fn in variants:
+                seconds, payload = timed(fn, image, args.rounds)
+                stats[name]["seconds"].append(seconds)
+                stats[name]["bytes"].append(len(payload))
+                stats[name]["psnr"].append(psnr(reference, payload))
+                if args.accuracy:
+                    total = asyncio.run(extracted_total(payload))
+                    stats[name]["correct"] += int(total is not None and abs(total - expected) < 0.01)
+
+        print(f"\n{kind} ({len(corpus)} samples, {image.width}x{image.height})")
+        print(f"{'':10} {'encode ms':>10} {'base64 KB':>10} {'PSNR dB':>8}" + (f" {'total ok':>9}" if args.accuracy else ""))
+        for name, _ in variants:
+            s = stats[name]
+            line = (f"{name:10} {statistics.mean(s['seconds']) * 1000:10.0f} "
+                    f"{statistics.mean(s['bytes']) / 1024:10.0f} {statistics.mean(s['psnr']):8.1f}")
+            if args.accuracy:
+                line += f" {s['correct']:>5}/{len(corpus)}"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--accuracy", action="store_true")
+    main(parser.parse_args())
@@ -1,24 +1,64 @@
 from fastapi import FastAPI, HTTPException, Depends, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 import uuid
-import httpx
 import secrets
 import base64
 import json
-import re
-import io
-import pytesseract
-from PIL import Image
 
 load_dotenv()
 
-app = FastAPI(title="Central Court API")
+from contextlib import asynccontextmanager
+import asyncio
+
+from services import metrics
+from services import timing
+from services import http_client
+from services import session_tokens
+from services import indexes
+from services.indexes import IndexSpec, reconcile_indexes
+from services.session_cache import session_cache
+from services.single_flight import SingleFlight
+from services import ocr_cache
+from services import merchant_index
+from services import blob_store
+from services.receipt_ocr import receipt_ocr_pool, OCRPoolBusy, PIPELINE_VERSION as RECEIPT_PIPELINE_VERSION
+from services.receipt_extractor import extract_receipt_fields
+from services.uploads import receive_upload, UploadError, UploadTooLarge
+from services.llm_guard import llm_guard, PermanentLlmError
+from services.ocr_backends import get_backend as get_ocr_backend
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Unknown OCR_BACKEND: fail at startup rather than on the first upload
+    get_ocr_backend()
+    await http_client.start()
+    receipt_ocr_pool.start()
+    documents.invoice_jobs.start()
+    background_tasks = [asyncio.create_task(reconcile_indexes(db, ALL_INDEXES))]
+    if session_tokens.signing_configured():
+        await session_tokens.sync_revocations(db)
+        background_tasks.append(asyncio.create_task(session_tokens.run_revocation_sync(db)))
+    # Typed invoiceDate for documents saved before it existed (date range filters)
+    background_tasks.append(asyncio.create_task(documents.backfill_invoice_dates()))
+    if blob_store.BLOB_MIGRATION_ENABLED:
+        # Documents still holding fileBase64 moved to the blob store while serving
+        background_tasks.append(asyncio.create_task(blob_store.run_migration()))
+    
+    yield
+    
+    for task in background_tasks:
+        task.cancel()
+    await documents.invoice_jobs.stop()
+    await http_client.close()
+    receipt_ocr_pool.shutdown()
+
+app = FastAPI(title="Central Court API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -157,6 +197,9 @@ init_documents_db(db)
 init_user_db(db)
 init_invitation_db(db)
 init_residence_db(db)
+ocr_cache.init_db(db)
+merchant_index.init_db(db)
+blob_store.init_db(db)
 
 app.include_router(email_router)
 app.include_router(event_router)
@@ -169,6 +212,38 @@ app.include_router(user_router)
 app.include_router(invitation_router)
 app.include_router(residence_router)
 
+from routes import (
+    admin_routes, alert_routes, documents, event_routes, invitation_routes,
+    preference_routes, residence_routes, tournament_routes, user_routes,
+)
+
+# Indexes used by server.py queries; route modules declare theirs next to init_db
+INDEXES = [
+    IndexSpec("user_sessions", ["session_token"], unique=True),
+    IndexSpec("user_sessions", ["expires_at"], expire_after_seconds=0),
+    IndexSpec("users", ["user_id"], unique=True, sparse=True),
+    IndexSpec("users", ["player_id"]),
+    IndexSpec("invitations", ["code"], unique=True, sparse=True),
+    IndexSpec("invitations", [("player_id", 1), ("created_at", -1)]),
+    IndexSpec("invitations", ["expires_at"], expire_after_seconds=invitation_routes.INVITATION_RETENTION_DAYS * 24 * 60 * 60),
+]
+
+ALL_INDEXES = (
+    INDEXES
+    + session_tokens.INDEXES
+    + event_routes.INDEXES
+    + tournament_routes.INDEXES
+    + alert_routes.INDEXES
+    + preference_routes.INDEXES
+    + admin_routes.INDEXES
+    + documents.INDEXES
+    + user_routes.INDEXES
+    + invitation_routes.INDEXES
+    + residence_routes.INDEXES
+    + ocr_cache.INDEXES
+    + merchant_index.INDEXES
+)
+
 # ============ MODELS ============
 
 class User(BaseModel):
@@ -178,7 +253,7 @@ class User(BaseModel):
     picture: Optional[str] = None
     role: str = "player"  # player, agent, medical, technical, logistics
     player_id: Optional[str] = None  # For staff: which player they belong to
-    created_at: datetime
+    created_at: Optional[datetime] = None  # Not carried by signed session tokens
 
 class UserResponse(BaseModel):
     user_id: str
@@ -217,35 +292,69 @@ class RegisterWithInvitationRequest(BaseModel):
 
 # ============ AUTH HELPERS ============
 
+# Mobile retries can send the same session_id several times within milliseconds
+emergent_session_flight = SingleFlight("emergent_session")
+exchange_session_flight = SingleFlight("exchange_session")
+
 async def get_session_from_emergent(session_id: str) -> Optional[SessionDataResponse]:
-    """Exchange session_id for user data from Emergent Auth"""
+    """Exchange session_id for user data from Emergent Auth (coalesced per session_id)"""
+    return await emergent_session_flight.do(session_id, _fetch_session_from_emergent, session_id)
+
+async def _fetch_session_from_emergent(session_id: str) -> Optional[SessionDataResponse]:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return SessionDataResponse(**data)
+        response = await http_client.request(
+            "emergent_auth", "GET",
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id}
+        )
+        if response.status_code == 200:
+            data = response.json()
+            return SessionDataResponse(**data)
     except Exception as e:
         print(f"Error exchanging session: {e}")
     return None
 
-async def get_current_user(request: Request) -> Optional[User]:
-    """Get current user from session token (cookie or header)"""
-    # Check cookie first
+def get_session_token(request: Request) -> Optional[str]:
+    """Read the session token from the cookie, falling back to the Authorization header"""
     session_token = request.cookies.get("session_token")
     
-    # Fallback to Authorization header
     if not session_token:
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             session_token = auth_header.split(" ")[1]
     
+    return session_token
+
+async def get_current_user(request: Request) -> Optional[User]:
+    """Get current user from session token (cookie or header)"""
+    session_token = get_session_token(request)
+    
     if not session_token:
         return None
     
+    # Signed session token: validated with CPU work only
+    if session_tokens.is_signed_token(session_token):
+        request.state.session_cache = "stateless"
+        claims = session_tokens.verify_token(session_token)
+        if not claims or session_tokens.revocations.is_revoked(claims):
+            return None
+        return User(
+            user_id=claims["uid"],
+            email=claims["email"],
+            name=claims["name"],
+            picture=claims.get("pic"),
+            role=claims["role"],
+            player_id=claims.get("pid")
+        )
+    
+    # Cached session: no database round trip
+    cached_user = session_cache.get(session_token)
+    if cached_user is not None:
+        request.state.session_cache = "hit"
+        return User(**cached_user)
+    
+    request.state.session_cache = "miss"
+    
     # Find session
     session = await db.user_sessions.find_one(
         {"session_token": session_token},
@@ -270,29 +379,83 @@ async def get_current_user(request: Request) -> Optional[User]:
     )
     
     if user_doc:
+        session_cache.put(session_token, user_doc, expires_at)
         return User(**user_doc)
     return None
 
-async def require_auth(request: Request) -> User:
-    """Require authentication"""
+def report_session_cache(request: Request, dependency: str):
+    """Record whether an auth dependency was served from the session cache"""
+    result = getattr(request.state, "session_cache", None)
+    if result:
+        metrics.increment("session_cache_lookups_total", dependency=dependency, result=result)
+
+async def _authenticate(request: Request) -> User:
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+async def require_auth(request: Request) -> User:
+    """Require authentication"""
+    try:
+        return await _authenticate(request)
+    finally:
+        report_session_cache(request, "require_auth")
+
 async def require_player(request: Request) -> User:
     """Require player role"""
-    user = await require_auth(request)
+    try:
+        user = await _authenticate(request)
+    finally:
+        report_session_cache(request, "require_player")
     if user.role != "player":
         raise HTTPException(status_code=403, detail="Player role required")
     return user
 
+async def create_session(user_doc: dict) -> str:
+    """Create a 7-day session and return its token (signed or opaque)"""
+    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+    
+    if session_tokens.signed_tokens_enabled():
+        session_token = session_tokens.issue_token(user_doc, expires_at)
+    else:
+        session_token = f"session_{secrets.token_urlsafe(32)}"
+    
+    await db.user_sessions.insert_one({
+        "user_id": user_doc["user_id"],
+        "session_token": session_token,
+        "expires_at": expires_at,
+        "created_at": datetime.now(timezone.utc)
+    })
+    
+    return session_token
+
 # ============ AUTH ENDPOINTS ============
 
 @app.post("/api/auth/exchange-session")
 async def exchange_session(req: ExchangeSessionRequest, response: Response):
     """Exchange session_id for session_token and create/get user"""
-    session_data = await get_session_from_emergent(req.session_id)
+    # Concurrent retries share one user lookup/creation and one session
+    session_token, user = await exchange_session_flight.do(req.session_id, _exchange_session, req.session_id)
+    
+    # Set cookie
+    response.set_cookie(
+        key="session_token",
+        value=session_token,
+        httponly=True,
+        secure=True,
+        samesite="none",
+        path="/",
+        max_age=7*24*60*60
+    )
+    
+    return {
+        "session_token": session_token,
+        "user": UserResponse(**user)
+    }
+
+async def _exchange_session(session_id: str):
+    session_data = await get_session_from_emergent(session_id)
     
     if not session_data:
         raise HTTPException(status_code=401, detail="Invalid session")
@@ -318,35 +481,13 @@ async def exchange_session(req: ExchangeSessionRequest, response: Response):
             "created_at": datetime.now(timezone.utc)
         })
     
-    # Create session
-    session_token = f"session_{secrets.token_urlsafe(32)}"
-    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-    
-    await db.user_sessions.insert_one({
-        "user_id": user_id,
-        "session_token": session_token,
-        "expires_at": expires_at,
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    # Set cookie
-    response.set_cookie(
-        key="session_token",
-        value=session_token,
-        httponly=True,
-        secure=True,
-        samesite="none",
-        path="/",
-        max_age=7*24*60*60
-    )
-    
     # Get user data
     user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
     
-    return {
-        "session_token": session_token,
-        "user": UserResponse(**user)
-    }
+    # Create session
+    session_token = await create_session(user)
+    
+    return session_token, user
 
 @app.post("/api/auth/register-with-invitation")
 async def register_with_invitation(req: RegisterWithInvitationRequest, response: Response):
@@ -389,6 +530,8 @@ async def register_with_invitation(req: RegisterWithInvitationRequest, response:
                 "player_id": invitation["player_id"]
             }}
         )
+        session_cache.invalidate_user(user_id)
+        await session_tokens.revoke_user(db, user_id)
     else:
         # Create new staff user
         user_id = f"user_{uuid.uuid4().hex[:12]}"
@@ -408,16 +551,11 @@ async def register_with_invitation(req: RegisterWithInvitationRequest, response:
         {"$inc": {"used_count": 1}}
     )
     
-    # Create session
-    session_token = f"session_{secrets.token_urlsafe(32)}"
-    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+    # Get user data
+    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
     
-    await db.user_sessions.insert_one({
-        "user_id": user_id,
-        "session_token": session_token,
-        "expires_at": expires_at,
-        "created_at": datetime.now(timezone.utc)
-    })
+    # Create session
+    session_token = await create_session(user)
     
     # Set cookie
     response.set_cookie(
@@ -430,9 +568,6 @@ async def register_with_invitation(req: RegisterWithInvitationRequest, response:
         max_age=7*24*60*60
     )
     
-    # Get user data
-    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    
     return {
         "session_token": session_token,
         "user": UserResponse(**user),
@@ -454,8 +589,12 @@ async def get_me(user: User = Depends(require_auth)):
 @app.post("/api/auth/logout")
 async def logout(request: Request, response: Response):
     """Logout current user"""
-    session_token = request.cookies.get("session_token")
+    session_token = get_session_token(request)
     if session_token:
+        session_cache.invalidate(session_token)
+        claims = session_tokens.verify_token(session_token)
+        if claims:
+            await session_tokens.revoke_token(db, claims)
         await db.user_sessions.delete_one({"session_token": session_token})
     
     response.delete_cookie(key="session_token", path="/")
@@ -570,6 +709,10 @@ async def remove_team_member(user_id: str, user: User = Depends(require_player))
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Team member not found")
     
+    # Role changed: cached sessions and signed tokens of that member are stale
+    session_cache.invalidate_user(user_id)
+    await session_tokens.revoke_user(db, user_id)
+    
     return {"success": True}
 
 # ============ OCR RECEIPT ANALYSIS ============
@@ -583,187 +726,107 @@ class OCRResult(BaseModel):
     confidence: str = "low"
     error: Optional[str] = None
     raw_text: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None  # ?debug=true: per-stage durations (services/timing.py)
 
 class OCRRequest(BaseModel):
     image_base64: str
 
-def extract_amount_from_text(text: str) -> Optional[float]:
-    """Extract the total amount from OCR text using regex patterns"""
-    # Common patterns for totals in receipts (French and English)
-    amount_patterns = [
-        # French patterns
-        r'(?:total|montant|solde|net\s*[àa]\s*payer|somme)\s*[:=]?\s*\$?\s*(\d+[\.,]\d{2})',
-        r'(?:total|montant)\s*[:=]?\s*(\d+[\.,]\d{2})\s*\$',
-        # Currency with $ sign
-        r'(\d+[\.,]\d{2})\s*\$',
-        r'\$\s*(\d+[\.,]\d{2})',
-        # Amount patterns at end of line (common for totals)
-        r'(?:total|ttc|tva\s*incluse|net).*?(\d+[\.,]\d{2})',
-        # Generic large amounts (likely totals)
-        r'(\d{2,}[\.,]\d{2})',
-    ]
-    
-    amounts = []
-    for pattern in amount_patterns:
-        matches = re.findall(pattern, text.lower(), re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            try:
-                # Convert comma to dot for float parsing
-                amount = float(match.replace(',', '.'))
-                if 0.01 <= amount <= 100000:  # Reasonable receipt amount range
-                    amounts.append(amount)
-            except ValueError:
-                continue
-    
-    # Return the largest amount found (likely the total)
-    if amounts:
-        return max(amounts)
-    return None
-
-def extract_date_from_text(text: str) -> Optional[str]:
-    """Extract date from OCR text"""
-    # Various date patterns
-    date_patterns = [
-        # DD/MM/YYYY or DD-MM-YYYY
-        r'(\d{1,2})[/\-](\d{1,2})[/\-](20\d{2})',
-        # YYYY-MM-DD
-        r'(20\d{2})[/\-](\d{1,2})[/\-](\d{1,2})',
-        # Month names in French
-        r'(\d{1,2})\s+(janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre)\s+(20\d{2})',
-        # Abbreviated months
-        r'(\d{1,2})\s+(jan|fev|fév|mar|avr|mai|jun|jui|juil|aou|aoû|sep|oct|nov|dec|déc)\.?\s+(20\d{2})',
-    ]
-    
-    month_map = {
-        'janvier': '01', 'février': '02', 'mars': '03', 'avril': '04',
-        'mai': '05', 'juin': '06', 'juillet': '07', 'août': '08',
-        'septembre': '09', 'octobre': '10', 'novembre': '11', 'décembre': '12',
-        'jan': '01', 'fev': '02', 'fév': '02', 'mar': '03', 'avr': '04',
-        'jun': '06', 'jui': '07', 'juil': '07', 'aou': '08', 'aoû': '08',
-        'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12', 'déc': '12'
-    }
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text.lower())
-        if match:
-            groups = match.groups()
-            if len(groups) == 3:
-                if groups[0].isdigit() and len(groups[0]) == 4:  # YYYY-MM-DD
-                    return f"{groups[2].zfill(2)}/{groups[1].zfill(2)}/{groups[0]}"
-                elif groups[1] in month_map:  # DD Month YYYY
-                    return f"{groups[0].zfill(2)}/{month_map[groups[1]]}/{groups[2]}"
-                else:  # DD/MM/YYYY
-                    day = groups[0].zfill(2)
-                    month = groups[1].zfill(2)
-                    year = groups[2]
-                    if int(month) <= 12:
-                        return f"{day}/{month}/{year}"
-    
-    return None
-
-def extract_merchant_from_text(text: str) -> Optional[str]:
-    """Extract merchant name from first lines of OCR text"""
-    lines = [l.strip() for l in text.split('\n') if l.strip()]
-    
-    # Usually merchant name is in the first few lines
-    for line in lines[:5]:
-        # Skip lines that are just numbers, dates, or common header text
-        if re.match(r'^[\d\s\-/\.]+$', line):
-            continue
-        if any(skip in line.lower() for skip in ['facture', 'reçu', 'ticket', 'date', 'heure', 'www.', 'http']):
-            continue
-        if len(line) >= 3 and len(line) <= 50:
-            return line.title()
-    
-    return None
-
-def categorize_receipt(text: str, merchant: Optional[str]) -> str:
-    """Categorize the receipt based on text content"""
-    text_lower = text.lower()
-    merchant_lower = (merchant or '').lower()
-    
-    # Travel keywords
-    travel_keywords = ['avion', 'flight', 'airline', 'train', 'sncf', 'hotel', 'hôtel', 
-                      'taxi', 'uber', 'lyft', 'péage', 'carburant', 'essence', 'parking',
-                      'aeroport', 'aéroport', 'airport', 'baggage', 'voyage', 'air france',
-                      'booking', 'expedia', 'airbnb']
-    
-    # Medical keywords
-    medical_keywords = ['pharmacie', 'pharmacy', 'médecin', 'doctor', 'clinique', 'clinic',
-                       'hôpital', 'hospital', 'kiné', 'physio', 'dentiste', 'dentist',
-                       'ordonnance', 'prescription', 'laboratoire', 'analyse', 'santé']
-    
-    # Check for travel
-    if any(kw in text_lower or kw in merchant_lower for kw in travel_keywords):
-        return 'travel'
-    
-    # Check for medical
-    if any(kw in text_lower or kw in merchant_lower for kw in medical_keywords):
-        return 'medical'
-    
-    # Default to invoices (general expenses)
-    return 'invoices'
+# Cap for binary uploads on /api/ocr/analyze-receipt/upload
+OCR_UPLOAD_MAX_BYTES = int(os.getenv("OCR_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
 
 @app.post("/api/ocr/analyze-receipt", response_model=OCRResult)
-async def analyze_receipt(request: OCRRequest):
+async def analyze_receipt(request: OCRRequest, debug: bool = False):
     """Analyze a receipt image or PDF using Tesseract OCR to extract date, amount, and category"""
-    try:
+    with timing.trace("analyze_receipt") as trace:
         # Decode base64 data
         try:
-            file_data = base64.b64decode(request.image_base64)
+            with timing.stage("base64_decode"):
+                file_data = base64.b64decode(request.image_base64)
         except Exception as e:
+            trace.outcome = "failed"
             return OCRResult(
                 success=False,
                 error=f"Failed to decode base64: {str(e)}"
             )
         
-        # Check if it's a PDF
-        is_pdf = file_data[:4] == b'%PDF'
+        return await run_receipt_analysis(file_data, debug)
+
+@app.post("/api/ocr/analyze-receipt/upload", response_model=OCRResult)
+async def analyze_receipt_upload(request: Request, debug: bool = False):
+    """
+    Binary variant of /api/ocr/analyze-receipt: multipart/form-data with a "file"
+    field, or the raw image/PDF as the request body. The upload is streamed into
+    a spooled temporary file (capped at OCR_UPLOAD_MAX_BYTES) and decoded from there.
+    """
+    try:
+        upload = await receive_upload(request, OCR_UPLOAD_MAX_BYTES)
+    except UploadTooLarge:
+        return OCRResult(
+            success=False,
+            error=f"File too large (max {OCR_UPLOAD_MAX_BYTES // (1024 * 1024)}MB)"
+        )
+    except UploadError as e:
+        return OCRResult(
+            success=False,
+            error=str(e)
+        )
+    
+    with upload:
+        if upload.size == 0:
+            return OCRResult(
+                success=False,
+                error="Empty file"
+            )
+        return await run_receipt_analysis(upload.source(), debug)
+
+async def run_receipt_analysis(source, debug: bool = False) -> OCRResult:
+    """
+    OCR a receipt (bytes or path of an uploaded file) and extract its fields
+    Stage durations go to pipeline_stage_seconds{pipeline="analyze_receipt"}; debug: also in the response
+    """
+    with timing.trace("analyze_receipt") as trace:
+        result = await analyze_receipt_source(source)
+        trace.outcome = trace.outcome or ("success" if result.success else "failed")
+    
+    if debug:
+        result.timings = trace.to_dict()
+    return result
+
+async def analyze_receipt_source(source) -> OCRResult:
+    try:
+        # Same file already OCRed: reuse its text (fields are re-extracted, it's cheap)
+        with timing.stage("cache_lookup"):
+            digest = await ocr_cache.file_digest(source)
+            cached = await ocr_cache.get(RECEIPT_PIPELINE_VERSION, digest)
         
-        if is_pdf:
-            # Handle PDF - convert first page to image
+        if cached is not None:
+            timing.current().outcome = "cached"
+            ocr_text = cached["text"]
+        else:
+            # Decode, rasterize, resize and OCR in the process pool
             try:
-                from pdf2image import convert_from_bytes
-                pages = convert_from_bytes(file_data, dpi=150, first_page=1, last_page=1)
-                if not pages:
-                    return OCRResult(
-                        success=False,
-                        error="Could not convert PDF to image"
-                    )
-                image = pages[0]
-            except Exception as e:
+                with timing.stage("ocr"):
+                    ocr = await receipt_ocr_pool.run(source)
+            except OCRPoolBusy:
                 return OCRResult(
                     success=False,
-                    error=f"Failed to process PDF: {str(e)}"
+                    error="OCR service busy, please retry in a few seconds"
                 )
-        else:
-            # Handle image
-            try:
-                image = Image.open(io.BytesIO(file_data))
-            except Exception as e:
+            except asyncio.TimeoutError:
                 return OCRResult(
                     success=False,
-                    error=f"Failed to open image: {str(e)}"
+                    error="OCR timed out"
                 )
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Preprocess image for better OCR
-        # Resize if too large
-        max_size = 2000
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Run Tesseract OCR with French language
-        try:
-            ocr_text = pytesseract.image_to_string(image, lang='fra+eng')
-        except Exception as e:
-            # Fallback to English only
-            ocr_text = pytesseract.image_to_string(image, lang='eng')
+            
+            if ocr["error"]:
+                return OCRResult(
+                    success=False,
+                    error=ocr["error"]
+                )
+            
+            ocr_text = ocr["text"]
+            with timing.stage("cache_store"):
+                await ocr_cache.put(RECEIPT_PIPELINE_VERSION, digest, {"text": ocr_text})
         
         if not ocr_text or len(ocr_text.strip()) < 10:
             return OCRResult(
@@ -774,11 +837,13 @@ async def analyze_receipt(request: OCRRequest):
         
         print(f"OCR Raw Text:\n{ocr_text[:500]}...")  # Log for debugging
         
-        # Extract information
-        amount = extract_amount_from_text(ocr_text)
-        date = extract_date_from_text(ocr_text)
-        merchant = extract_merchant_from_text(ocr_text)
-        category = categorize_receipt(ocr_text, merchant)
+        # Extract information (single scan of the text)
+        with timing.stage("extract_fields"):
+            fields = extract_receipt_fields(ocr_text)
+        amount = fields["amount"]
+        date = fields["date"]
+        merchant = fields["merchant"]
+        category = fields["category"]
         
         # Calculate confidence based on what was found
         found_count = sum([amount is not None, date is not None, merchant is not None])
@@ -815,6 +880,9 @@ class QuickReply(BaseModel):
     text: str
     tone: str
 
+# Interactive: fewer attempts than document analysis, the fallback replies are good enough
+QUICK_REPLY_ATTEMPTS = int(os.getenv("QUICK_REPLY_ATTEMPTS", "2"))
+
 @app.post("/api/ai/quick-replies")
 async def generate_quick_replies(context: QuickReplyContext):
     """Generate AI-powered quick reply suggestions using OpenAI via Emergent LLM Key"""
@@ -842,8 +910,9 @@ Format de réponse JSON:
 [{{"id": "1", "text": "...", "tone": "brief"}}, {{"id": "2", "text": "...", "tone": "friendly"}}, {{"id": "3", "text": "...", "tone": "formal"}}]"""
 
         # Call OpenAI via Emergent integration
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
+        async def ask_model() -> str:
+            response = await http_client.request(
+                "openai", "POST",
                 "https://api.openai.com/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {emergent_key}",
@@ -854,25 +923,33 @@ Format de réponse JSON:
                     "messages": [{"role": "user", "content": prompt}],
                     "max_tokens": 300,
                     "temperature": 0.7
-                },
-                timeout=10.0
+                }
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                
-                # Parse JSON from response
-                import json
-                try:
-                    # Extract JSON array from response
-                    start = content.find('[')
-                    end = content.rfind(']') + 1
-                    if start >= 0 and end > start:
-                        replies = json.loads(content[start:end])
-                        return {"replies": replies}
-                except json.JSONDecodeError:
-                    pass
+            if response.status_code == 429 or response.status_code >= 500:
+                # Provider overloaded or failing: retried, counts towards the circuit breaker
+                raise RuntimeError(f"OpenAI HTTP {response.status_code}")
+            if response.status_code != 200:
+                raise PermanentLlmError(f"OpenAI HTTP {response.status_code}")
+            return response.json()["choices"][0]["message"]["content"]
+        
+        # Shared LLM guard: concurrency cap, retries, fail fast while the provider is down
+        try:
+            content = await llm_guard.call("quick_replies", ask_model, attempts=QUICK_REPLY_ATTEMPTS)
+        except Exception as e:
+            print(f"AI reply unavailable: {e!r}")
+            return {"replies": get_fallback_replies(context)}
+        
+        # Parse JSON from response
+        import json
+        try:
+            # Extract JSON array from response
+            start = content.find('[')
+            end = content.rfind(']') + 1
+            if start >= 0 and end > start:
+                replies = json.loads(content[start:end])
+                return {"replies": replies}
+        except json.JSONDecodeError:
+            pass
         
         # Fallback if AI fails
         return {"replies": get_fallback_replies(context)}
@@ -911,6 +988,17 @@ def get_fallback_replies(context: QuickReplyContext) -> List[dict]:
 async def health_check():
     return {"status": "healthy", "service": "central-court-api"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """In-process counters and histograms"""
+    return {
+        "metrics": metrics.snapshot(),
+        "session_cache": {"entries": len(session_cache)},
+        "ocr_cache": {"memory_entries": len(ocr_cache.memory)},
+        "revoked_sessions": len(session_tokens.revocations),
+        "indexes": indexes.last_report
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,355 @@
+"""
+Content-addressed store for document files
+
+Original files (invoice photos, PDFs) are stored once per content, keyed
+by their SHA-256, instead of as a fileBase64 string inside each documents
+record: the record only keeps fileId (the digest), fileSize and
+fileMimeType. Uploading the same file again adds a reference to the
+existing blob.
+
+The bytes live in GridFS (bucket blob_content, file _id = digest) or, with
+BLOB_STORE_BACKEND=local, in BLOB_STORE_PATH/<2 hex>/<digest>. The blobs
+collection holds one entry per digest: size, MIME type and refCount; a
+blob is deleted when its last document is. The entry is flagged "deleting"
+while its bytes are removed: a put() of the same content waits for the
+deletion to finish, then stores the bytes again.
+
+stream() reads a blob (or a byte range of it) chunk by chunk, for the
+file download endpoint: a 20 MB PDF is never held in memory at once.
+
+migrate_inline_files() moves records that still carry fileBase64, in
+batches, while the app is serving (reads accept both forms meanwhile);
+the app lifespan runs it in the background (BLOB_MIGRATION_ENABLED).
+
+Metrics: blob_store_puts_total{result=stored|deduplicated},
+blob_store_deletes_total, blob_migration_documents_total{result}.
+"""
+
+import os
+import base64
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services import metrics
+from services.ocr_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "gridfs")
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blobs"))
+BLOB_MIGRATION_ENABLED = os.getenv("BLOB_MIGRATION_ENABLED", "1") == "1"
+BLOB_MIGRATION_BATCH_SIZE = int(os.getenv("BLOB_MIGRATION_BATCH_SIZE", "50"))
+# Pause between migration batches, to leave room for the live traffic
+BLOB_MIGRATION_PAUSE_SECONDS = float(os.getenv("BLOB_MIGRATION_PAUSE_SECONDS", "1"))
+
+# put() retries while the same blob is being deleted
+PUT_ATTEMPTS = 5
+# Read size of stream()
+BLOB_CHUNK_BYTES = int(os.getenv("BLOB_CHUNK_BYTES", str(256 * 1024)))
+
+# MongoDB reference (will be set by init_db)
+db = None
+
+def init_db(database):
+    global db, _backend
+    db = database
+    _backend = None
+
+
+class GridFSBackend:
+    """Blob bytes in the GridFS bucket blob_content"""
+
+    name = "gridfs"
+
+    def __init__(self, database):
+        self.db = database
+        self.bucket = None
+
+    def _bucket(self):
+        if self.bucket is None:
+            # Created lazily so it binds to the running event loop
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            self.bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name="blob_content")
+        return self.bucket
+
+    async def exists(self, digest: str) -> bool:
+        return await self.db["blob_content.files"].find_one({"_id": digest}, {"_id": 1}) is not None
+
+    async def write(self, digest: str, data: bytes):
+        try:
+            await self._bucket().upload_from_stream_with_id(digest, digest, data)
+        except DuplicateKeyError:
+            # Same content written concurrently by another upload
+            pass
+
+    async def read(self, digest: str) -> bytes:
+        grid_out = await self._bucket().open_download_stream(digest)
+        return await grid_out.read()
+
+    async def stream(self, digest: str, start: int, length: int, chunk_size: int) -> AsyncIterator[bytes]:
+        grid_out = await self._bucket().open_download_stream(digest)
+        grid_out.seek(start)
+        while length > 0:
+            chunk = await grid_out.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+    async def delete(self, digest: str):
+        from gridfs.errors import NoFile
+        try:
+            await self._bucket().delete(digest)
+        except NoFile:
+            pass
+
+
+class LocalBackend:
+    """Blob bytes in files under a directory (root/ab/abcdef...)"""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self.path(digest))
+
+    def _write(self, digest: str, data: bytes):
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside then renamed: a reader never sees a partial blob
+        partial = f"{path}.{os.getpid()}.partial"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+
+    async def write(self, digest: str, data: bytes):
+        await asyncio.to_thread(self._write, digest, data)
+
+    def _read(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    async def read(self, digest: str) -> bytes:
+        return await asyncio.to_thread(self._read, digest)
+
+    async def stream(self, digest: str, start: int, length: int, chunk_size: int) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.path(digest), "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            while length > 0:
+                chunk = await asyncio.to_thread(f.read, min(chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    async def delete(self, digest: str):
+        try:
+            await asyncio.to_thread(os.remove, self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+_backend = None
+
+
+def get_backend():
+    """Configured storage backend (BLOB_STORE_BACKEND), created on first use"""
+    global _backend
+    if _backend is None:
+        if BLOB_STORE_BACKEND == "local":
+            _backend = LocalBackend(BLOB_STORE_PATH)
+        elif BLOB_STORE_BACKEND == "gridfs":
+            _backend = GridFSBackend(db)
+        else:
+            raise ValueError(f"Unknown BLOB_STORE_BACKEND: {BLOB_STORE_BACKEND}")
+    return _backend
+
+
+def sniff_mime_type(data: bytes, file_type: Optional[str] = None) -> str:
+    """MIME type from the file signature, else from the document fileType"""
+    if data[:4] == b"%PDF":
+        return "application/pdf"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/pdf" if file_type == "pdf" else "image/png"
+
+
+async def put(data: bytes, mime_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Store file bytes (or reference the identical blob already stored)
+    Returns the fields a document keeps: fileId, fileSize, fileMimeType
+    """
+    digest = await file_digest(data)
+    mime_type = mime_type or sniff_mime_type(data)
+    for attempt in range(PUT_ATTEMPTS):
+        now = datetime.now(timezone.utc)
+        try:
+            entry = await db.blobs.find_one_and_update(
+                {"_id": digest, "deleting": {"$ne": True}},
+                {
+                    "$inc": {"refCount": 1},
+                    "$set": {"updatedAt": now},
+                    "$setOnInsert": {"size": len(data), "mimeType": mime_type, "createdAt": now},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # Entry flagged "deleting" by release(): wait until it is gone
+            if attempt == PUT_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(0.05 * (attempt + 1))
+
+    backend = get_backend()
+    try:
+        if not await backend.exists(digest):
+            await backend.write(digest, data)
+    except Exception:
+        # Bytes not stored: drop the reference taken above rather than leave it orphaned
+        await release(digest)
+        raise
+    metrics.increment("blob_store_puts_total", result="deduplicated" if entry["refCount"] > 1 else "stored")
+    return {"fileId": digest, "fileSize": entry["size"], "fileMimeType": entry["mimeType"]}
+
+
+async def get(file_id: str) -> Optional[bytes]:
+    """Bytes of a blob, None if it is not stored"""
+    if await db.blobs.find_one({"_id": file_id}, {"_id": 1}) is None:
+        return None
+    try:
+        return await get_backend().read(file_id)
+    except Exception as e:
+        logger.warning(f"Blob {file_id} unreadable: {e}")
+        return None
+
+
+async def stat(file_id: str) -> Optional[Dict[str, Any]]:
+    """Entry of a stored blob (size, mimeType), None if missing or being deleted"""
+    entry = await db.blobs.find_one({"_id": file_id})
+    if entry is None or entry.get("deleting"):
+        return None
+    return entry
+
+
+async def stream(file_id: str, start: int = 0, length: Optional[int] = None,
+                 chunk_size: int = BLOB_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """Bytes [start, start + length) of a blob (to its end by default), chunk_size at a time"""
+    if length is None:
+        entry = await stat(file_id)
+        length = entry["size"] - start if entry else 0
+    async for chunk in get_backend().stream(file_id, start, length, chunk_size):
+        yield chunk
+
+
+async def release(file_id: Optional[str]):
+    """Drop a document's reference to a blob; the last one deletes it"""
+    if not file_id:
+        return
+    entry = await db.blobs.find_one_and_update(
+        {"_id": file_id}, {"$inc": {"refCount": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if entry is None or entry["refCount"] > 0:
+        return
+    flagged = await db.blobs.update_one({"_id": file_id, "refCount": {"$lte": 0}, "deleting": {"$ne": True}},
+                                        {"$set": {"deleting": True}})
+    if flagged.matched_count == 0:
+        return
+    await get_backend().delete(file_id)
+    await db.blobs.delete_one({"_id": file_id})
+    metrics.increment("blob_store_deletes_total")
+
+
+async def migrate_inline_files(batch_size: int = BLOB_MIGRATION_BATCH_SIZE, pause_seconds: float = 0.0,
+                               max_batches: Optional[int] = None) -> Dict[str, int]:
+    """
+    Move documents.fileBase64 into the store, batch_size records at a time
+    Walks the collection once in _id order (a batch reads ids only); each file is then
+    loaded, stored and unset one document at a time
+    Safe to run from several processes: a record already moved is left alone
+    Returns counts per outcome: migrated, empty (no file), invalid (not base64), skipped
+    """
+    counts = {"migrated": 0, "empty": 0, "invalid": 0, "skipped": 0}
+    batches = 0
+    last_id = None
+    while max_batches is None or batches < max_batches:
+        query: Dict[str, Any] = {"fileBase64": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        ids = await db.documents.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not ids:
+            break
+        batches += 1
+        last_id = ids[-1]["_id"]
+
+        for entry in ids:
+            counts[await _migrate_document(entry["_id"])] += 1
+
+        if pause_seconds:
+            await asyncio.sleep(pause_seconds)
+    return counts
+
+
+async def _migrate_document(document_id) -> str:
+    """Move one document's fileBase64 into the store; returns the outcome"""
+    doc = await db.documents.find_one({"_id": document_id, "fileBase64": {"$exists": True}},
+                                      {"fileBase64": 1, "fileType": 1})
+    if doc is None:
+        # Moved (or deleted) meanwhile by another process
+        metrics.increment("blob_migration_documents_total", result="skipped")
+        return "skipped"
+
+    encoded = doc.get("fileBase64")
+    result = "migrated"
+    update: Dict[str, Any] = {"$unset": {"fileBase64": ""}}
+    ref = None
+    if not encoded:
+        result = "empty"
+    else:
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except Exception:
+            # Kept aside rather than lost: fileBase64Invalid
+            result = "invalid"
+            update["$set"] = {"fileBase64Invalid": encoded}
+        else:
+            ref = await put(data, sniff_mime_type(data, doc.get("fileType")))
+            update["$set"] = ref
+
+    outcome = await db.documents.update_one({"_id": document_id, "fileBase64": {"$exists": True}}, update)
+    if outcome.matched_count == 0:
+        result = "skipped"
+        if ref is not None:
+            await release(ref["fileId"])
+    metrics.increment("blob_migration_documents_total", result=result)
+    return result
+
+
+async def run_migration():
+    """Background migration started from the app lifespan"""
+    try:
+        counts = await migrate_inline_files(pause_seconds=BLOB_MIGRATION_PAUSE_SECONDS)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Blob migration failed (resumes at next startup): {e}")
+        return
+    if any(counts.values()):
+        logger.info(f"Blob migration: {counts}")
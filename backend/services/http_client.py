@@ -0,0 +1,120 @@
+"""
+Shared pooled HTTP client for outbound calls
+
+One httpx.AsyncClient for the whole app (created/closed in the lifespan) so
+connections to the auth and LLM providers are reused: keep-alive, HTTP/2
+when the h2 package is installed, and a per-upstream cap on concurrent
+requests. Timeouts are configured per upstream and every call records its
+latency in the metrics registry (upstream_request_seconds).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Dict
+
+import httpx
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP2_ENABLED = os.getenv("HTTP_CLIENT_HTTP2", "1") == "1"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30"))
+
+
+class Upstream:
+    """Per-upstream settings: timeouts and max concurrent requests"""
+
+    def __init__(self, name: str, timeout: float, connect_timeout: float = 5.0, max_connections: int = 20):
+        prefix = f"HTTP_{name.upper()}"
+        self.name = name
+        self.timeout = float(os.getenv(f"{prefix}_TIMEOUT", timeout))
+        self.connect_timeout = float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", connect_timeout))
+        self.max_connections = int(os.getenv(f"{prefix}_MAX_CONNECTIONS", max_connections))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._semaphore
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    "emergent_auth": Upstream("emergent_auth", timeout=10.0),
+    "openai": Upstream("openai", timeout=10.0),
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("h2 not installed, outbound HTTP client falls back to HTTP/1.1")
+        return False
+
+
+def build_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        **kwargs
+    )
+
+
+async def start():
+    """Create the shared client (app lifespan startup)"""
+    global _client
+    if _client is None:
+        _client = build_client()
+
+
+async def close():
+    """Close the shared client (app lifespan shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        # Used outside the app lifespan (scripts, tests)
+        _client = build_client()
+    return _client
+
+
+async def request(upstream: str, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """Send a request through the shared client with the upstream's timeout and concurrency cap"""
+    config = UPSTREAMS[upstream]
+    status = "error"
+    started = time.perf_counter()
+    try:
+        async with config.semaphore:
+            response = await get_client().request(
+                method, url,
+                timeout=httpx.Timeout(timeout) if timeout is not None else config.httpx_timeout(),
+                **kwargs
+            )
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.observe("upstream_request_seconds", time.perf_counter() - started, upstream=upstream, status=status)
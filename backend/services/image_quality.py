@@ -0,0 +1,185 @@
+"""
+Image quality gate, before any OCR (Tesseract or Vision)
+
+Blurry, dark or far-away photos end in a low-confidence result after
+several paid Vision calls. A few NumPy measurements on a reduced copy
+(JPEG decoded at 1/2..1/8 scale with draft) reject them first, with an
+actionable "retake the photo" message:
+
+- too_small: the image itself is smaller than MIN_SIDE pixels
+- too_dark: even the brightest pixels (99th percentile) stay dark
+- low_contrast: ink barely darker than the paper (washed out, glare, fog)
+- blurry: variance of the Laplacian within the receipt, after stretching
+  its levels to 0..255 (dim but sharp photos pass), below MIN_BLUR
+- text_too_small: text lines (rows of ink) lower than MIN_TEXT_HEIGHT
+  pixels in the original image: receipt photographed from too far
+
+Measurements are taken on the receipt region (paper box, as in
+services/receipt_crop.py) when one is found, else on the whole frame.
+"""
+
+import io
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from services import metrics
+from services.receipt_crop import ink_mask, otsu_threshold, paper_box
+
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "1") == "1"
+QUALITY_MIN_SIDE = int(os.getenv("QUALITY_MIN_SIDE", "400"))
+QUALITY_MIN_BLUR = float(os.getenv("QUALITY_MIN_BLUR", "200"))
+QUALITY_DARK_LEVEL = int(os.getenv("QUALITY_DARK_LEVEL", "70"))
+QUALITY_MIN_CONTRAST = int(os.getenv("QUALITY_MIN_CONTRAST", "50"))
+QUALITY_MIN_TEXT_HEIGHT = float(os.getenv("QUALITY_MIN_TEXT_HEIGHT", "10"))
+
+# Long side of the analysis copy: blur scores are only comparable at a fixed size
+WORK_SIZE = 1000
+# Paper region smaller than this (analysis pixels): measure the whole frame
+MIN_REGION_PIXELS = 32 * 32
+# A row is a text row when this share of it is ink
+TEXT_ROW_SHARE = 0.02
+# Fewer ink pixels than this: contrast from the 1st percentile instead
+MIN_INK_PIXELS = 200
+
+# Order matters: the first problem found gives the message
+MESSAGES = {
+    "too_small": "Image trop petite: utilisez la résolution maximale de l'appareil.",
+    "too_dark": "Photo trop sombre: ajoutez de la lumière ou utilisez le flash.",
+    "low_contrast": "Photo délavée ou avec reflets: évitez les reflets, ticket bien éclairé.",
+    "blurry": "Photo floue: tenez l'appareil immobile et faites la mise au point sur le ticket.",
+    "text_too_small": "Texte trop petit: rapprochez-vous pour que le ticket remplisse la photo.",
+}
+
+
+class QualityReport:
+    """Measurements of one image and the problems found (empty: good enough for OCR)"""
+
+    def __init__(self, problems: List[str], blur: float, brightness: float, contrast: float,
+                 text_height: Optional[float], size: tuple, seconds: float = 0.0):
+        self.problems = problems
+        self.blur = blur
+        self.brightness = brightness
+        self.contrast = contrast
+        self.text_height = text_height
+        self.size = size
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return (f"QualityReport(problems={self.problems}, blur={self.blur:.0f}, brightness={self.brightness:.0f}, "
+                f"contrast={self.contrast:.0f}, text_height={self.text_height}, size={self.size})")
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    @property
+    def message(self) -> Optional[str]:
+        return MESSAGES[self.problems[0]] if self.problems else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "problems": self.problems,
+            "blur": round(self.blur, 1),
+            "brightness": round(self.brightness, 1),
+            "contrast": round(self.contrast, 1),
+            "textHeight": None if self.text_height is None else round(self.text_height, 1),
+        }
+
+
+def laplacian_variance(pixels: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian: low when edges are soft"""
+    p = pixels.astype(np.float32)
+    laplacian = p[1:-1, :-2] + p[1:-1, 2:] + p[:-2, 1:-1] + p[2:, 1:-1] - 4 * p[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+def text_line_height(ink: np.ndarray) -> Optional[float]:
+    """Median height (rows) of the runs of rows holding ink; None without text"""
+    rows = ink.mean(axis=1) > TEXT_ROW_SHARE
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    heights = edges[1::2] - edges[0::2]
+    # Single rows are noise or rules, not text
+    heights = heights[heights > 1]
+    return float(np.median(heights)) if len(heights) else None
+
+
+def _analysis_copy(image: Image.Image) -> Image.Image:
+    """Grayscale copy with WORK_SIZE long side; JPEGs are decoded at reduced scale"""
+    # draft only applies before the first load, to JPEG: decoder-side downscaling
+    # to the smallest 1/2^n scale still covering the requested size
+    fit = WORK_SIZE / max(image.size)
+    image.draft("L", (round(image.width * fit), round(image.height * fit)))
+    image = ImageOps.exif_transpose(image).convert("L")
+    scale = WORK_SIZE / max(image.size)
+    if scale < 1.0:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.Resampling.BILINEAR)
+    return image
+
+
+def assess_image(image: Image.Image) -> QualityReport:
+    """Measure an image (see module docstring)"""
+    started = time.perf_counter()
+    width, height = image.size
+    small = _analysis_copy(image)
+    pixels = np.asarray(small, dtype=np.uint8)
+    # Analysis pixels per original pixel (exif_transpose may swap the sides)
+    scale = max(small.size) / max(width, height)
+
+    # Receipt region, however small in the frame: a far-away receipt must be
+    # judged on its own text, not on the table around it
+    box = paper_box(pixels > otsu_threshold(pixels))
+    if box is not None and (box[2] - box[0]) * (box[3] - box[1]) >= MIN_REGION_PIXELS:
+        left, top, right, bottom = box
+        region = pixels[top:bottom, left:right]
+    else:
+        region = pixels
+
+    # Contrast between paper and ink: text covers only a few percent of a page,
+    # so the ink level is taken from the ink pixels, not from a low percentile
+    ink = ink_mask(region)
+    brightness = float(np.percentile(region, 99))
+    low = float(np.median(region[ink])) if ink.sum() >= MIN_INK_PIXELS else float(np.percentile(region, 1))
+    contrast = brightness - low
+    # Laplacian variance grows with contrast squared: measured on the stretched range
+    stretched = np.clip((region.astype(np.float32) - low) * (255.0 / max(contrast, 1.0)), 0, 255)
+    blur = laplacian_variance(stretched)
+    line = text_line_height(ink)
+    text_height = None if line is None else line / scale
+
+    problems = []
+    if min(width, height) < QUALITY_MIN_SIDE:
+        problems.append("too_small")
+    if brightness < QUALITY_DARK_LEVEL:
+        problems.append("too_dark")
+    elif contrast < QUALITY_MIN_CONTRAST:
+        problems.append("low_contrast")
+    if blur < QUALITY_MIN_BLUR:
+        problems.append("blurry")
+    # No measurable text line at all: only reported when nothing else explains it
+    if (text_height is not None and text_height < QUALITY_MIN_TEXT_HEIGHT) or (text_height is None and not problems):
+        problems.append("text_too_small")
+
+    return QualityReport(problems, blur, brightness, contrast, text_height, (width, height),
+                         time.perf_counter() - started)
+
+
+def check_image_quality(file_bytes: bytes) -> Optional[QualityReport]:
+    """
+    Quality gate for an uploaded image; None when disabled or not decodable
+    (the decoding error is reported by the OCR path). CPU-bound: run in a thread.
+    """
+    if not QUALITY_GATE_ENABLED:
+        return None
+    try:
+        report = assess_image(Image.open(io.BytesIO(file_bytes)))
+    except Exception:
+        return None
+    metrics.observe("image_quality_seconds", report.seconds)
+    for problem in report.problems:
+        metrics.increment("image_quality_rejections_total", reason=problem)
+    return report
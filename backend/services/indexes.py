@@ -0,0 +1,161 @@
+"""
+Declarative MongoDB index management
+
+Each route module declares the indexes its queries need in an INDEXES list
+next to init_db. The app lifespan reconciles them at startup and logs a
+report of created, updated, missing and conflicting indexes.
+
+INDEX_MANAGEMENT:
+- "create" (default): create missing indexes, fix TTL drift with collMod
+- "report": only report what is missing
+- "off": skip reconciliation
+"""
+
+import os
+import logging
+from typing import Optional, Dict, Any, List, Union, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_MANAGEMENT = os.getenv("INDEX_MANAGEMENT", "create")
+
+# Last reconciliation report (exposed on GET /api/metrics)
+last_report: Dict[str, Any] = {}
+
+
+class IndexSpec:
+    """One index on one collection"""
+
+    def __init__(
+        self,
+        collection: str,
+        keys: List[Union[str, Tuple[str, int]]],
+        unique: bool = False,
+        sparse: bool = False,
+        expire_after_seconds: Optional[int] = None,
+        partial_filter: Optional[Dict[str, Any]] = None,
+        name: Optional[str] = None,
+    ):
+        self.collection = collection
+        # "field" is shorthand for ("field", 1)
+        self.keys = [(k, 1) if isinstance(k, str) else (k[0], k[1]) for k in keys]
+        self.unique = unique
+        self.sparse = sparse
+        self.expire_after_seconds = expire_after_seconds
+        self.partial_filter = partial_filter
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def __repr__(self) -> str:
+        return f"IndexSpec({self.collection}.{self.name})"
+
+    def options(self) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"name": self.name}
+        if self.unique:
+            options["unique"] = True
+        if self.sparse:
+            options["sparse"] = True
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        if self.partial_filter:
+            options["partialFilterExpression"] = self.partial_filter
+        return options
+
+    def same_keys(self, info: Dict[str, Any]) -> bool:
+        return [(k, d) for k, d in info.get("key", [])] == self.keys
+
+    def same_options(self, info: Dict[str, Any]) -> bool:
+        return (
+            bool(info.get("unique")) == self.unique
+            and bool(info.get("sparse")) == self.sparse
+            and info.get("partialFilterExpression") == self.partial_filter
+        )
+
+
+async def reconcile_indexes(db, specs: List[IndexSpec], mode: str = INDEX_MANAGEMENT) -> Dict[str, Any]:
+    """Make the declared indexes exist; return a report of what changed"""
+    report: Dict[str, Any] = {
+        "mode": mode, "ok": [], "created": [], "updated": [],
+        "missing": [], "conflicts": [], "unmanaged": [], "errors": [],
+    }
+    if mode == "off":
+        last_report.clear()
+        last_report.update(report)
+        return report
+
+    try:
+        await db.command("ping")
+    except Exception as e:
+        report["errors"].append(f"database unreachable: {e}")
+        logger.warning(f"Index reconciliation skipped: {e}")
+        last_report.clear()
+        last_report.update(report)
+        return report
+
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection, collection_specs in by_collection.items():
+        try:
+            existing = await db[collection].index_information()
+        except Exception as e:
+            report["errors"].append(f"{collection}: {e}")
+            continue
+
+        declared = {"_id_"}
+        for spec in collection_specs:
+            label = f"{collection}.{spec.name}"
+            current_name, current = next(
+                ((name, info) for name, info in existing.items() if spec.same_keys(info)),
+                (None, None)
+            )
+            declared.add(current_name or spec.name)
+
+            if current is None:
+                if mode != "create":
+                    report["missing"].append(label)
+                    continue
+                try:
+                    await db[collection].create_index(spec.keys, **spec.options())
+                    report["created"].append(label)
+                except Exception as e:
+                    # e.g. duplicate values prevent a unique index
+                    report["missing"].append(f"{label}: {e}")
+                continue
+
+            if not spec.same_options(current):
+                report["conflicts"].append(f"{label}: existing index {current_name} has different options")
+                continue
+
+            if current.get("expireAfterSeconds") != spec.expire_after_seconds:
+                if mode == "create" and spec.expire_after_seconds is not None:
+                    try:
+                        await db.command(
+                            "collMod", collection,
+                            index={"keyPattern": dict(spec.keys), "expireAfterSeconds": spec.expire_after_seconds}
+                        )
+                        report["updated"].append(label)
+                    except Exception as e:
+                        report["conflicts"].append(f"{label}: {e}")
+                else:
+                    report["conflicts"].append(f"{label}: TTL differs from existing index {current_name}")
+                continue
+
+            report["ok"].append(label)
+
+        report["unmanaged"].extend(f"{collection}.{name}" for name in existing if name not in declared)
+
+    for label in report["created"]:
+        logger.info(f"Index created: {label}")
+    for label in report["updated"]:
+        logger.info(f"Index TTL updated: {label}")
+    for label in report["missing"] + report["conflicts"] + report["errors"]:
+        logger.warning(f"Index not reconciled: {label}")
+    logger.info(
+        f"Index reconciliation ({mode}): {len(report['ok'])} ok, {len(report['created'])} created, "
+        f"{len(report['missing'])} missing, {len(report['conflicts'])} conflicts"
+    )
+
+    last_report.clear()
+    last_report.update(report)
+    return report
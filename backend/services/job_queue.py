@@ -0,0 +1,324 @@
+"""
+Mongo-backed job queue with a bounded pool of asyncio workers
+
+submit() stores the payload in GridFS and a "queued" job document, and
+returns the job id at once. Workers claim the oldest job with an atomic
+find_one_and_update that sets a lease; a job whose worker died (process
+restart, crash) is claimed again once its lease has expired, so queued and
+in-flight jobs survive restarts. Clients poll get() or follow
+wait_for_update() (Server-Sent Events).
+
+Job lifecycle: queued -> running -> done | failed. A handler exception
+requeues the job until max_attempts, then marks it failed. Finished jobs
+are removed by a TTL index after retention_hours.
+
+Metrics (labels: queue): job_queue_depth and job_queue_running gauges,
+job_queue_wait_seconds (submit -> start), job_queue_run_seconds and
+job_queue_latency_seconds (submit -> finish) histograms,
+job_queue_jobs_total{status} counter.
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from pymongo import ReturnDocument
+
+from services import metrics
+from services.indexes import IndexSpec
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+# Buckets for wait / latency histograms (jobs take seconds to minutes)
+LATENCY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+Handler = Callable[[bytes, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _seconds_between(start: Optional[datetime], end: datetime) -> Optional[float]:
+    if start is None:
+        return None
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return max(0.0, (end - start).total_seconds())
+
+
+class JobQueue:
+    """One queue: a jobs collection, a GridFS payload bucket and its workers"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Optional[Handler] = None,
+        workers: int = JOB_QUEUE_WORKERS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        retention_hours: int = JOB_RETENTION_HOURS,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.retention_hours = retention_hours
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.db = None
+        self.bucket = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._watchers: Dict[str, List[asyncio.Event]] = {}
+        self._running = 0
+
+    def job_handler(self, fn: Handler) -> Handler:
+        """Decorator registering the coroutine that runs a job: fn(payload, params) -> result"""
+        self.handler = fn
+        return fn
+
+    @property
+    def indexes(self) -> List[IndexSpec]:
+        return [
+            IndexSpec(self.name, [("status", 1), ("createdAt", 1)]),
+            IndexSpec(self.name, ["finishedAt"], expire_after_seconds=self.retention_hours * 60 * 60),
+        ]
+
+    def init_db(self, database):
+        self.db = database
+        self.bucket = None
+
+    @property
+    def collection(self):
+        return self.db[self.name]
+
+    def _payloads(self):
+        if self.bucket is None:
+            # Created lazily so it binds to the running event loop
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            self.bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name=f"{self.name}_payloads")
+        return self.bucket
+
+    # ---- Client side ----
+
+    async def submit(self, payload: bytes, params: Dict[str, Any]) -> str:
+        """Store a job and return its id; a worker picks it up"""
+        job_id = str(uuid.uuid4())
+        payload_id = await self._payloads().upload_from_stream(job_id, payload)
+        now = _utcnow()
+        await self.collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "params": params,
+            "payloadId": payload_id,
+            "size": len(payload),
+            "attempts": 0,
+            "createdAt": now,
+            "updatedAt": now,
+        })
+        metrics.increment("job_queue_jobs_total", queue=self.name, status="queued")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self._refresh_depth()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id}, {"payloadId": 0})
+
+    async def wait_for_update(self, job_id: str, timeout: float) -> bool:
+        """
+        Wait until a local worker changes the job, or timeout (jobs run by
+        another process are only seen by re-reading). True if notified.
+        """
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, []).append(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            watchers = self._watchers.get(job_id, [])
+            if event in watchers:
+                watchers.remove(event)
+            if not watchers:
+                self._watchers.pop(job_id, None)
+
+    def _notify(self, job_id: str):
+        for event in self._watchers.get(job_id, []):
+            event.set()
+
+    # ---- Workers ----
+
+    def start(self):
+        """Start the worker pool (app lifespan startup)"""
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; their in-flight jobs are requeued"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            # Cleared before claiming so a submit in between is not missed
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}: claiming a job failed: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. Mongo unreachable while recording the outcome: the lease expires and the job is retried
+                logger.warning(f"{self.name}: job {job['_id']} could not be completed: {e}")
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = _utcnow()
+        job = await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                # Lease expired: the worker that held it is gone
+                {"status": "running", "leaseUntil": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "startedAt": now,
+                    "leaseUntil": now + timedelta(seconds=self.lease_seconds),
+                    "worker": self.worker_id,
+                    # Identifies this claim: updates from a stale claim match nothing
+                    "claimId": uuid.uuid4().hex,
+                    "updatedAt": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            await self._refresh_depth()
+            self._notify(job["_id"])
+        return job
+
+    async def _process(self, job: Dict[str, Any]):
+        started = _utcnow()
+        wait = _seconds_between(job.get("createdAt"), started)
+        if wait is not None:
+            metrics.observe("job_queue_wait_seconds", wait, LATENCY_BUCKETS, queue=self.name)
+
+        if job["attempts"] > self.max_attempts:
+            await self._finish(job, started, "failed", error=f"Abandoned after {self.max_attempts} attempts")
+            return
+
+        self._running += 1
+        metrics.set_gauge("job_queue_running", self._running, queue=self.name)
+        try:
+            grid_out = await self._payloads().open_download_stream(job["payloadId"])
+            payload = await grid_out.read()
+            # Past the lease another worker may claim the job: never run longer
+            result = await asyncio.wait_for(self.handler(payload, job.get("params") or {}), self.lease_seconds)
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back untouched
+            await asyncio.shield(self._requeue(job, error=None, refund_attempt=True))
+            raise
+        except Exception as e:
+            logger.warning(f"{self.name}: job {job['_id']} attempt {job['attempts']} failed: {e}")
+            if job["attempts"] < self.max_attempts:
+                await self._requeue(job, error=str(e) or type(e).__name__)
+            else:
+                await self._finish(job, started, "failed", error=str(e) or type(e).__name__)
+        else:
+            await self._finish(job, started, "done", result=result)
+        finally:
+            self._running -= 1
+            metrics.set_gauge("job_queue_running", self._running, queue=self.name)
+
+    async def _requeue(self, job: Dict[str, Any], error: Optional[str], refund_attempt: bool = False):
+        update: Dict[str, Any] = {
+            "$set": {"status": "queued", "leaseUntil": None, "updatedAt": _utcnow()},
+        }
+        if error is not None:
+            update["$set"]["error"] = error
+        if refund_attempt:
+            update["$inc"] = {"attempts": -1}
+        try:
+            await self.collection.update_one({"_id": job["_id"], "claimId": job["claimId"]}, update)
+        except Exception as e:
+            logger.warning(f"{self.name}: requeueing job {job['_id']} failed (lease will expire): {e}")
+        self._notify(job["_id"])
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _finish(self, job: Dict[str, Any], started: datetime, status: str,
+                      result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        finished = _utcnow()
+        update: Dict[str, Any] = {
+            "status": status,
+            "finishedAt": finished,
+            "leaseUntil": None,
+            "updatedAt": finished,
+            "result": result,
+        }
+        if error is not None:
+            update["error"] = error
+        outcome = await self.collection.update_one(
+            {"_id": job["_id"], "claimId": job["claimId"]}, {"$set": update}
+        )
+        if outcome.matched_count == 0:
+            # Lease expired and another worker reclaimed the job: its result wins
+            logger.warning(f"{self.name}: job {job['_id']} was reclaimed, result discarded")
+            return
+
+        try:
+            await self._payloads().delete(job["payloadId"])
+        except Exception as e:
+            logger.warning(f"{self.name}: deleting payload of job {job['_id']} failed: {e}")
+
+        metrics.increment("job_queue_jobs_total", queue=self.name, status=status)
+        metrics.observe("job_queue_run_seconds", (finished - started).total_seconds(), LATENCY_BUCKETS,
+                        queue=self.name, status=status)
+        latency = _seconds_between(job.get("createdAt"), finished)
+        if latency is not None:
+            metrics.observe("job_queue_latency_seconds", latency, LATENCY_BUCKETS, queue=self.name, status=status)
+        self._notify(job["_id"])
+
+    async def _refresh_depth(self):
+        try:
+            depth = await self.collection.count_documents({"status": "queued"})
+        except Exception:
+            return
+        metrics.set_gauge("job_queue_depth", depth, queue=self.name)
@@ -0,0 +1,176 @@
+"""
+Shared guard around LLM provider calls (Vision extraction, text extraction,
+quick replies)
+
+- Concurrency: one semaphore for the whole process, so a burst of uploads
+  queues here instead of opening as many provider calls as requests.
+- Retries: exponential backoff with full jitter (random delay between 0
+  and base * 2^attempt, capped), per-attempt timeout.
+- Circuit breaker: after BREAKER_FAILURES consecutive failed attempts the
+  provider is considered down; calls fail at once with CircuitOpenError
+  (callers switch to their fallback) for BREAKER_RESET_SECONDS, then one
+  probe call is let through (half-open): success closes the breaker,
+  failure opens it again.
+
+PermanentLlmError (bad request, authentication) is neither retried nor
+counted against the provider. Metrics: llm_in_flight, llm_waiting and
+llm_breaker_state gauges (0 closed, 1 half-open, 2 open), llm_calls_total
+{operation, result}, llm_retries_total, llm_breaker_transitions_total,
+llm_call_seconds.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """The provider is considered down: fail fast to the fallback"""
+
+
+class PermanentLlmError(Exception):
+    """Error a retry cannot fix (bad request, authentication)"""
+
+
+class LlmGuard:
+    """Concurrency cap, retries and circuit breaker for one provider"""
+
+    def __init__(self, name: str, max_concurrency: int = 8, max_attempts: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, call_timeout: float = 60.0, breaker_failures: int = 5,
+                 breaker_reset_seconds: float = 30.0):
+        prefix = f"LLM_{name.upper()}"
+        self.name = name
+        self.max_concurrency = int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency))
+        self.max_attempts = int(os.getenv(f"{prefix}_MAX_ATTEMPTS", max_attempts))
+        self.backoff_base = float(os.getenv(f"{prefix}_BACKOFF_BASE", backoff_base))
+        self.backoff_max = float(os.getenv(f"{prefix}_BACKOFF_MAX", backoff_max))
+        self.call_timeout = float(os.getenv(f"{prefix}_CALL_TIMEOUT", call_timeout))
+        self.breaker_failures = int(os.getenv(f"{prefix}_BREAKER_FAILURES", breaker_failures))
+        self.breaker_reset_seconds = float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", breaker_reset_seconds))
+        self.clock = time.monotonic
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._waiting = 0
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.breaker_reset_seconds:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning(f"LLM circuit breaker {self.name}: {self._state} -> {state}")
+            metrics.increment("llm_breaker_transitions_total", guard=self.name, state=state)
+        self._state = state
+        metrics.set_gauge("llm_breaker_state", _STATE_GAUGE[state], guard=self.name)
+
+    def _record_success(self):
+        self._failures = 0
+        self._set_state(CLOSED)
+
+    def _record_failure(self):
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.breaker_failures:
+            self._opened_at = self.clock()
+            self._set_state(OPEN)
+
+    def _admit(self, operation: str) -> bool:
+        """Whether a call may go to the provider now; True if it is the half-open probe"""
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        metrics.increment("llm_calls_total", guard=self.name, operation=operation, result="rejected")
+        raise CircuitOpenError(f"{self.name} provider unavailable (circuit {state})")
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max, base * 2^attempt)]"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _gauges(self):
+        metrics.set_gauge("llm_in_flight", self._in_flight, guard=self.name)
+        metrics.set_gauge("llm_waiting", self._waiting, guard=self.name)
+
+    async def _attempt(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self._waiting += 1
+        self._gauges()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        self._gauges()
+        try:
+            return await asyncio.wait_for(fn(*args, **kwargs), self.call_timeout)
+        finally:
+            self._in_flight -= 1
+            self._gauges()
+            self.semaphore.release()
+
+    async def call(self, operation: str, fn: Callable[..., Awaitable[Any]], *args,
+                   attempts: Optional[int] = None, **kwargs) -> Any:
+        """
+        await fn(*args, **kwargs) under the guard, at most attempts times (default max_attempts)
+        Raises CircuitOpenError when the provider is down, else the last error once attempts are exhausted
+        """
+        attempts = attempts or self.max_attempts
+        probe = self._admit(operation)
+        started = time.perf_counter()
+        result = "failure"
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    metrics.increment("llm_retries_total", guard=self.name, operation=operation)
+                    await asyncio.sleep(self.backoff(attempt - 1))
+                    # The breaker may have opened while this call was waiting
+                    if self.state == OPEN:
+                        metrics.increment("llm_calls_total", guard=self.name, operation=operation, result="rejected")
+                        result = None
+                        raise CircuitOpenError(f"{self.name} provider unavailable (circuit open)")
+                try:
+                    value = await self._attempt(fn, *args, **kwargs)
+                except PermanentLlmError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"LLM {operation} attempt {attempt + 1}/{attempts} failed: {e!r}")
+                    self._record_failure()
+                    if probe or attempt + 1 == attempts:
+                        raise
+                    continue
+                self._record_success()
+                result = "success"
+                return value
+        finally:
+            if probe:
+                self._probing = False
+            if result is not None:
+                metrics.increment("llm_calls_total", guard=self.name, operation=operation, result=result)
+            metrics.observe("llm_call_seconds", time.perf_counter() - started, guard=self.name, operation=operation)
+
+
+# One guard for the LLM provider (Emergent key): Vision, text extraction and quick replies
+llm_guard = LlmGuard("provider")
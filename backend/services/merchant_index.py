@@ -0,0 +1,235 @@
+"""
+Learned supplier -> category index
+
+Every category a user saves for a supplier (POST and PUT /api/documents)
+is recorded under the normalized supplier name (lowercase, no accents,
+punctuation or legal form: "Hôtel IBIS S.A.S." -> "hotel ibis"), in two
+scopes:
+
+- the user's own entry: their latest category, plus their spelling of the
+  supplier and its address (the "template" filled into later analyses);
+- a global entry: the users who chose each category. It answers for
+  everyone once MERCHANT_GLOBAL_MIN_USERS users agree, by strict majority.
+
+analyze_document consults the index for the extracted supplier: the
+user's entry wins over the global one, and a known supplier's category
+replaces the keyword guess.
+- Before escalation: when Tesseract's result would go to Vision, a known
+  supplier's category can make it sufficient. That result is the user's
+  own and never goes into the OCR cache (keyed by file, shared by all
+  users); the file-only decision and its cached result are unchanged.
+- After extraction, on every other path including cache hits.
+
+OCR variants of a name ("DECATH1ON", "Decathlon Paris") match by
+character trigrams (Dice coefficient >= MERCHANT_MATCH_THRESHOLD):
+candidates sharing a trigram come from the multikey index on
+(scope, grams). Lookup errors degrade to misses.
+
+Metrics: merchant_index_lookups_total{result=user|global|miss},
+merchant_index_corrections_total.
+"""
+
+import os
+import re
+import logging
+import unicodedata
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from services import metrics
+from services.indexes import IndexSpec
+
+logger = logging.getLogger(__name__)
+
+MERCHANT_INDEX_ENABLED = os.getenv("MERCHANT_INDEX_ENABLED", "1") == "1"
+MERCHANT_MATCH_THRESHOLD = float(os.getenv("MERCHANT_MATCH_THRESHOLD", "0.6"))
+MERCHANT_GLOBAL_MIN_USERS = int(os.getenv("MERCHANT_GLOBAL_MIN_USERS", "2"))
+# Fuzzy candidates read per lookup
+MERCHANT_CANDIDATES = int(os.getenv("MERCHANT_CANDIDATES", "200"))
+
+GLOBAL_SCOPE = "*"
+
+# Document categories: ids (routes/documents.py /documents/categories) and labels (extraction)
+CATEGORY_LABELS = {
+    "travel": "Transport",
+    "accommodation": "Hébergement",
+    "restaurant": "Restauration",
+    "medical": "Médical",
+    "equipment": "Matériel",
+    "services": "Services",
+}
+
+# Dropped from supplier names before matching
+IGNORED_TOKENS = {
+    "sa", "sas", "sasu", "sarl", "eurl", "snc", "sci", "scp", "selarl", "inc", "ltd", "llc", "gmbh", "cie",
+    "le", "la", "les", "l", "de", "du", "des", "d", "et", "the",
+}
+
+# MongoDB reference (will be set by init_db)
+db = None
+
+def init_db(database):
+    global db
+    db = database
+
+
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("merchant_categories", [("scope", 1), ("grams", 1)]),
+]
+
+
+class MerchantMatch:
+    """Index entry matching a supplier name"""
+
+    def __init__(self, scope: str, category: str, score: float, name: Optional[str] = None,
+                 template: Optional[Dict[str, Any]] = None):
+        self.scope = scope
+        self.category = category
+        self.score = score
+        self.name = name
+        self.template = template or {}
+
+    def __repr__(self) -> str:
+        return f"<MerchantMatch {self.scope} {self.name!r} -> {self.category} ({self.score:.2f})>"
+
+
+def normalize_merchant(name: Optional[str]) -> str:
+    """Matching key of a supplier name ("" if nothing is left)"""
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    # "S.A.S." -> "sas" before splitting on punctuation
+    text = re.sub(r"\b(?:[a-z]\.){2,}", lambda m: m.group(0).replace(".", ""), text)
+    return " ".join(t for t in re.findall(r"[a-z0-9]+", text) if t not in IGNORED_TOKENS)
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Dice coefficient of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def category_label(category: Optional[str]) -> Optional[str]:
+    """Extraction label of a document category (id or label); None for Autre / unknown"""
+    if category in CATEGORY_LABELS:
+        return CATEGORY_LABELS[category]
+    if category in CATEGORY_LABELS.values():
+        return category
+    return None
+
+
+def global_category(voters: Dict[str, List[str]]) -> Optional[str]:
+    """Category chosen by a strict majority of at least MERCHANT_GLOBAL_MIN_USERS users"""
+    counts = {label: len(users) for label, users in (voters or {}).items() if users}
+    if not counts:
+        return None
+    label = max(counts, key=counts.get)
+    if counts[label] < MERCHANT_GLOBAL_MIN_USERS or counts[label] * 2 <= sum(counts.values()):
+        return None
+    return label
+
+
+def _entry_match(doc: Dict[str, Any], score: float) -> Optional[MerchantMatch]:
+    if doc["scope"] == GLOBAL_SCOPE:
+        category = global_category(doc.get("voters"))
+        return MerchantMatch(GLOBAL_SCOPE, category, score) if category else None
+    return MerchantMatch("user", doc["category"], score, doc.get("name"), doc.get("template"))
+
+
+async def lookup(user_id: Optional[str], fournisseur: Optional[str]) -> Optional[MerchantMatch]:
+    """Learned category for a supplier: the user's entry, else the global one; None if unknown"""
+    key = normalize_merchant(fournisseur)
+    if not MERCHANT_INDEX_ENABLED or db is None or not key:
+        return None
+    scopes = [user_id, GLOBAL_SCOPE] if user_id else [GLOBAL_SCOPE]
+
+    try:
+        # Exact key first, then suppliers sharing a trigram
+        docs = await db.merchant_categories.find({"_id": {"$in": [f"{scope}:{key}" for scope in scopes]}}).to_list(len(scopes))
+        scored = [(1.0, doc) for doc in docs]
+        if not docs:
+            grams = trigrams(key)
+            candidates = await db.merchant_categories.find(
+                {"scope": {"$in": scopes}, "grams": {"$in": sorted(grams)}}
+            ).limit(MERCHANT_CANDIDATES).to_list(MERCHANT_CANDIDATES)
+            scored = [(similarity(grams, set(doc["grams"])), doc) for doc in candidates]
+    except Exception as e:
+        logger.warning(f"Merchant index lookup failed: {e}")
+        scored = []
+
+    best: Dict[str, MerchantMatch] = {}
+    for score, doc in sorted(scored, key=lambda item: item[0], reverse=True):
+        if score < MERCHANT_MATCH_THRESHOLD:
+            break
+        match = _entry_match(doc, score)
+        if match is not None:
+            best.setdefault(match.scope, match)
+
+    match = best.get("user") or best.get(GLOBAL_SCOPE)
+    metrics.increment("merchant_index_lookups_total", result=match.scope if match else "miss")
+    return match
+
+
+async def apply(data: Dict[str, Any], user_id: Optional[str]) -> Optional[MerchantMatch]:
+    """
+    Learned category (and the user's supplier template) into extracted invoice data
+    Sets data['categorySource'] = 'merchant_index'; None if the supplier is unknown
+    """
+    match = await lookup(user_id, data.get("fournisseur"))
+    if match is None:
+        return None
+    data["categorie"] = match.category
+    data["categorySource"] = "merchant_index"
+    if match.name:
+        data["fournisseur"] = match.name
+    for field, value in match.template.items():
+        if value and not data.get(field):
+            data[field] = value
+    return match
+
+
+async def learn(user_id: Optional[str], fournisseur: Optional[str], category: Optional[str],
+                adresse: Optional[str] = None):
+    """Record the category a user saved for a supplier"""
+    key = normalize_merchant(fournisseur)
+    label = category_label(category)
+    if not MERCHANT_INDEX_ENABLED or db is None or not key or not label or not user_id:
+        return
+    now = datetime.now(timezone.utc)
+    grams = sorted(trigrams(key))
+
+    try:
+        user_entry = {
+            "scope": user_id,
+            "key": key,
+            "grams": grams,
+            "name": fournisseur.strip(),
+            "category": label,
+            "updatedAt": now,
+        }
+        if adresse:
+            user_entry["template"] = {"adresse": adresse}
+        await db.merchant_categories.update_one({"_id": f"{user_id}:{key}"}, {"$set": user_entry}, upsert=True)
+
+        # One vote per user: moved from their previous category, if any
+        others = {f"voters.{other}": user_id for other in CATEGORY_LABELS.values() if other != label}
+        await db.merchant_categories.update_one(
+            {"_id": f"{GLOBAL_SCOPE}:{key}"},
+            {
+                "$set": {"scope": GLOBAL_SCOPE, "key": key, "grams": grams, "updatedAt": now},
+                "$addToSet": {f"voters.{label}": user_id},
+                "$pull": others,
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning(f"Merchant index update failed: {e}")
+        return
+    metrics.increment("merchant_index_corrections_total")
@@ -0,0 +1,95 @@
+"""
+In-process metrics registry (counters, gauges and histograms)
+Exposed as JSON on GET /api/metrics
+"""
+
+import bisect
+import threading
+from typing import Dict, Tuple, List, Any
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], "Histogram"] = {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with count and sum"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": buckets}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Set a gauge to its current value"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+    """Record a value in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def get_counter(name: str, **labels) -> float:
+    """Current value of a counter (0 if never incremented)"""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def snapshot() -> Dict[str, List[Dict[str, Any]]]:
+    """Copy of all metrics, grouped by name"""
+    result: Dict[str, List[Dict[str, Any]]] = {}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), value in _gauges.items():
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in _histograms.items():
+            result.setdefault(name, []).append({"labels": dict(labels), **histogram.to_dict()})
+    return result
+
+
+def reset():
+    """Clear all metrics (tests)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -0,0 +1,169 @@
+"""
+Extraction backends for the invoice analysis (services/ocr_service.py)
+
+The extraction step (image or PDF text layer -> invoice JSON) goes through
+the backend named by OCR_BACKEND, so the documents pipeline can be load
+tested and benchmarked offline, and providers switched without code
+changes:
+
+- emergent (default): GPT-4o through emergentintegrations (Emergent LLM key)
+- local: Tesseract (receipt OCR pool) + the receipt extraction rules
+- stub: deterministic answer derived from the input's SHA-256, after a
+  configurable latency (OCR_STUB_LATENCY_MS +/- OCR_STUB_JITTER_MS), with
+  an optional share of failures (OCR_STUB_ERROR_RATE) to exercise retries
+  and the circuit breaker
+
+A backend returns the model's raw answer (JSON text in the format asked
+by INVOICE_USER_PROMPT); parsing, validation, retries and the circuit
+breaker (services/llm_guard.py) stay in the pipeline. Other providers
+plug in with register_backend(name, factory).
+"""
+
+import os
+import json
+import base64
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "emergent")
+OCR_STUB_LATENCY_MS = float(os.getenv("OCR_STUB_LATENCY_MS", "800"))
+OCR_STUB_JITTER_MS = float(os.getenv("OCR_STUB_JITTER_MS", "0"))
+OCR_STUB_ERROR_RATE = float(os.getenv("OCR_STUB_ERROR_RATE", "0"))
+
+DEFAULT_BACKEND = "emergent"
+
+
+class OcrBackend(ABC):
+    """Turns a document into the model's raw JSON answer"""
+
+    name = "base"
+
+    @abstractmethod
+    async def extract_image(self, image_base64: str) -> str:
+        """Answer for an image (base64 PNG/JPEG)"""
+
+    @abstractmethod
+    async def extract_text(self, text: str) -> str:
+        """Answer for the text layer of a PDF"""
+
+
+class EmergentBackend(OcrBackend):
+    """GPT-4o via emergentintegrations"""
+
+    name = "emergent"
+    model = ("openai", "gpt-4o")
+
+    def _chat(self, session: str):
+        from emergentintegrations.llm.chat import LlmChat
+        from services.ocr_service import EMERGENT_LLM_KEY, INVOICE_SYSTEM_PROMPT
+        return LlmChat(
+            api_key=EMERGENT_LLM_KEY,
+            session_id=f"{session}-{datetime.now().timestamp()}",
+            system_message=INVOICE_SYSTEM_PROMPT
+        ).with_model(*self.model)
+
+    async def extract_image(self, image_base64: str) -> str:
+        from emergentintegrations.llm.chat import UserMessage, ImageContent
+        from services.ocr_service import INVOICE_USER_PROMPT
+        message = UserMessage(text=INVOICE_USER_PROMPT, file_contents=[ImageContent(image_base64=image_base64)])
+        return await self._chat("ocr-invoice").send_message(message)
+
+    async def extract_text(self, text: str) -> str:
+        from emergentintegrations.llm.chat import UserMessage
+        from services.ocr_service import INVOICE_USER_PROMPT, PDF_TEXT_MAX_CHARS
+        # The text is extracted with -layout: columns and alignment are kept
+        message = UserMessage(
+            text=f"{INVOICE_USER_PROMPT}\n\nTEXTE DU DOCUMENT (extrait du PDF, mise en page conservée):\n\n{text[:PDF_TEXT_MAX_CHARS]}"
+        )
+        return await self._chat("ocr-invoice-text").send_message(message)
+
+
+class LocalBackend(OcrBackend):
+    """Tesseract + receipt rules, no network"""
+
+    name = "local"
+
+    async def extract_image(self, image_base64: str) -> str:
+        from services.receipt_ocr import receipt_ocr_pool
+        ocr = await receipt_ocr_pool.run(base64.b64decode(image_base64))
+        if ocr["error"]:
+            raise RuntimeError(f"Local OCR failed: {ocr['error']}")
+        return await self.extract_text(ocr["text"] or "")
+
+    async def extract_text(self, text: str) -> str:
+        from services.ocr_service import build_local_invoice_data
+        return json.dumps(build_local_invoice_data(text), ensure_ascii=False)
+
+
+class StubBackend(OcrBackend):
+    """Deterministic answers after a configurable latency, for load tests"""
+
+    name = "stub"
+    merchants = ("Decathlon", "Taxi G7", "SNCF", "Hôtel Ibis", "Restaurant Le Central", "Pharmacie du Parc")
+    categories = ("Matériel", "Transport", "Transport", "Hébergement", "Restauration", "Médical")
+
+    def __init__(self, latency_ms: Optional[float] = None, jitter_ms: Optional[float] = None,
+                 error_rate: Optional[float] = None):
+        self.latency_ms = OCR_STUB_LATENCY_MS if latency_ms is None else latency_ms
+        self.jitter_ms = OCR_STUB_JITTER_MS if jitter_ms is None else jitter_ms
+        self.error_rate = OCR_STUB_ERROR_RATE if error_rate is None else error_rate
+
+    async def _answer(self, content: str) -> str:
+        seed = int(hashlib.sha256(content.encode("utf-8")).hexdigest()[:16], 16)
+        # Deterministic per input: same document, same latency, same answer
+        fraction = (seed % 10_000) / 10_000
+        await asyncio.sleep(max(0.0, self.latency_ms + self.jitter_ms * (2 * fraction - 1)) / 1000)
+        if fraction < self.error_rate:
+            raise RuntimeError("Stub backend: simulated provider error")
+
+        index = seed % len(self.merchants)
+        total = round(5 + (seed >> 8) % 20_000 / 100, 2)
+        tva = round(total - total / 1.2, 2)
+        return json.dumps({
+            "montantTotal": total,
+            "montantHT": round(total - tva, 2),
+            "montantTVA": tva,
+            "currency": "EUR",
+            "numeroFacture": f"STUB-{seed % 100_000:05d}",
+            "dateFacture": (datetime.now() - timedelta(days=(seed >> 24) % 60)).strftime("%d/%m/%Y"),
+            "fournisseur": self.merchants[index],
+            "adresse": None,
+            "categorie": self.categories[index],
+            "lignes": [],
+            "confidence": 0.95,
+            "needsReview": False,
+            "description": "Réponse simulée (OCR_BACKEND=stub)",
+        }, ensure_ascii=False)
+
+    async def extract_image(self, image_base64: str) -> str:
+        return await self._answer(image_base64)
+
+    async def extract_text(self, text: str) -> str:
+        return await self._answer(text)
+
+
+_FACTORIES: Dict[str, Callable[[], OcrBackend]] = {
+    "emergent": EmergentBackend,
+    "local": LocalBackend,
+    "stub": StubBackend,
+}
+_instances: Dict[str, OcrBackend] = {}
+
+
+def register_backend(name: str, factory: Callable[[], OcrBackend]):
+    """Make a backend selectable with OCR_BACKEND=name"""
+    _FACTORIES[name] = factory
+    _instances.pop(name, None)
+
+
+def get_backend(name: Optional[str] = None) -> OcrBackend:
+    """Configured backend (OCR_BACKEND), created once"""
+    name = name or OCR_BACKEND
+    if name not in _FACTORIES:
+        raise ValueError(f"Unknown OCR_BACKEND '{name}' (available: {', '.join(sorted(_FACTORIES))})")
+    if name not in _instances:
+        _instances[name] = _FACTORIES[name]()
+    return _instances[name]
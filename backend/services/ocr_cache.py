@@ -0,0 +1,157 @@
+"""
+Content-addressed cache for OCR results
+
+Results are keyed by the SHA-256 of the file bytes plus the version of the
+pipeline that produced them: re-analyzing the same file returns the stored
+result without redoing Tesseract or the GPT-4o Vision call, and bumping a
+pipeline version makes its old entries unreachable.
+
+Two tiers: an in-process LRU/TTL in front of the Mongo collection
+ocr_cache (expired by a TTL index after OCR_CACHE_TTL_DAYS). Only
+successful results are stored; Mongo errors degrade to cache misses.
+"""
+
+import os
+import copy
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Union
+
+from services import metrics
+from services.indexes import IndexSpec
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_MEMORY_ENTRIES = int(os.getenv("OCR_CACHE_MEMORY_ENTRIES", "512"))
+OCR_CACHE_MEMORY_TTL_SECONDS = float(os.getenv("OCR_CACHE_MEMORY_TTL_SECONDS", "3600"))
+OCR_CACHE_TTL_DAYS = int(os.getenv("OCR_CACHE_TTL_DAYS", "30"))
+
+# Hash in a thread above this size so large uploads don't stall the event loop
+INLINE_HASH_BYTES = 1024 * 1024
+
+# MongoDB reference (will be set by init_db)
+db = None
+
+def init_db(database):
+    global db
+    db = database
+
+
+# Indexes reconciled at startup (services/indexes.py)
+INDEXES = [
+    IndexSpec("ocr_cache", ["createdAt"], expire_after_seconds=OCR_CACHE_TTL_DAYS * 24 * 60 * 60),
+]
+
+
+class MemoryTier:
+    """LRU + TTL: cache key -> result"""
+
+    def __init__(self, max_entries: int = OCR_CACHE_MEMORY_ENTRIES, ttl_seconds: float = OCR_CACHE_MEMORY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (deadline (monotonic), result)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        deadline, result = entry
+        if deadline <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+memory = MemoryTier()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_digest(source: Union[bytes, str]) -> str:
+    """SHA-256 (hex) of file bytes, or of the file at a path"""
+    if isinstance(source, bytes):
+        if len(source) <= INLINE_HASH_BYTES:
+            return hashlib.sha256(source).hexdigest()
+        return await asyncio.to_thread(lambda: hashlib.sha256(source).hexdigest())
+    return await asyncio.to_thread(_hash_file, source)
+
+
+def cache_key(pipeline: str, digest: str) -> str:
+    return f"{pipeline}:{digest}"
+
+
+async def get(pipeline: str, digest: str) -> Optional[Dict[str, Any]]:
+    """Cached result (a copy) for a file digest and pipeline version, or None"""
+    if not OCR_CACHE_ENABLED:
+        return None
+    key = cache_key(pipeline, digest)
+
+    result = memory.get(key)
+    if result is not None:
+        metrics.increment("ocr_cache_lookups_total", pipeline=pipeline, result="memory_hit")
+        return copy.deepcopy(result)
+
+    doc = None
+    if db is not None:
+        try:
+            doc = await db.ocr_cache.find_one({"_id": key}, {"result": 1})
+        except Exception as e:
+            logger.warning(f"OCR cache lookup failed: {e}")
+    if doc is None:
+        metrics.increment("ocr_cache_lookups_total", pipeline=pipeline, result="miss")
+        return None
+
+    metrics.increment("ocr_cache_lookups_total", pipeline=pipeline, result="mongo_hit")
+    memory.put(key, doc["result"])
+    return copy.deepcopy(doc["result"])
+
+
+async def put(pipeline: str, digest: str, result: Dict[str, Any]):
+    """Store a successful result in both tiers"""
+    if not OCR_CACHE_ENABLED:
+        return
+    key = cache_key(pipeline, digest)
+    result = copy.deepcopy(result)
+    memory.put(key, result)
+    if db is None:
+        return
+    try:
+        await db.ocr_cache.update_one(
+            {"_id": key},
+            {"$set": {
+                "pipeline": pipeline,
+                "sha256": digest,
+                "result": result,
+                "createdAt": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning(f"OCR cache store failed: {e}")
@@ -2,6 +2,8 @@
 OCR Service Ultra-Performant pour Factures et Notes de Frais
 Utilise OpenAI Vision (GPT-4o) pour extraction haute précision
 Supporte images (JPG, PNG, WEBP) et PDF (conversion via pdf2image)
+PDF numériques: extraction depuis la couche texte (pdftotext), sans appel Vision
+Autres documents: Tesseract + regex en local, Vision seulement si le résultat est incomplet
 Taux de réussite cible: >95%
 """
 
@@ -9,16 +11,30 @@ import os
 import json
 import asyncio
 import re
+import time
 import base64
 import tempfile
+import subprocess
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from PIL import Image, ImageEnhance, ImageFilter
 import io
 
+from services import merchant_index, metrics, ocr_cache, timing
+from services.receipt_ocr import receipt_ocr_pool, PIPELINE_VERSION as RECEIPT_PIPELINE_VERSION
+from services.receipt_extractor import extract_receipt_fields
+from services.receipt_crop import crop_receipt
+from services.image_quality import check_image_quality
+from services.llm_guard import llm_guard
+from services.ocr_backends import get_backend, DEFAULT_BACKEND
+from services.vision_payload import VisionPayload, VISION_MAX_LONG_SIDE, fit_vision_resolution, optimize_payload
+
 load_dotenv()
 
+# Version du pipeline (prétraitement + prompt + modèle): la changer invalide le cache OCR
+PIPELINE_VERSION = "invoice-gpt4o-4"
+
 # Clé Emergent LLM pour OpenAI (Universal Key)
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY', 'sk-emergent-56a3f663d91F5Ae936')
 
@@ -62,34 +78,153 @@ CATEGORIES = {
 }
 
 
-def convert_pdf_to_images(pdf_bytes: bytes, dpi: int = 200) -> List[Image.Image]:
+# Pipeline à étages: Tesseract + regex en local d'abord, Vision seulement si nécessaire
+OCR_LOCAL_TIER_ENABLED = os.environ.get('OCR_LOCAL_TIER_ENABLED', '1') == '1'
+OCR_LOCAL_MIN_CONFIDENCE = float(os.environ.get('OCR_LOCAL_MIN_CONFIDENCE', '0.75'))
+OCR_LOCAL_REQUIRED_FIELDS = [f.strip() for f in os.environ.get('OCR_LOCAL_REQUIRED_FIELDS', 'montantTotal,dateFacture').split(',') if f.strip()]
+
+# Poids de chaque champ trouvé dans la confiance de l'extraction locale
+LOCAL_FIELD_WEIGHTS = {
+    'montantTotal': 0.5,
+    'dateFacture': 0.25,
+    'fournisseur': 0.15,
+    'categorie': 0.1,
+}
+
+
+# Rendu PDF: DPI choisi pour que le grand côté de la page fasse ~PDF_TARGET_LONG_SIDE_PX
+PDF_TARGET_LONG_SIDE_PX = int(os.environ.get('PDF_TARGET_LONG_SIDE_PX', '2400'))
+PDF_MIN_DPI = 100
+PDF_MAX_DPI = 300
+PDF_DEFAULT_DPI = 200  # Taille de page absente des métadonnées
+
+_PAGE_SIZE_PATTERN = re.compile(r'([\d.]+)\s*x\s*([\d.]+)\s*pts')
+
+# Couche texte des PDF numériques (pdftotext): évite rastérisation et appel Vision
+PDF_TEXT_LAYER_ENABLED = os.environ.get('PDF_TEXT_LAYER_ENABLED', '1') == '1'
+PDF_TEXT_MAX_PAGES = int(os.environ.get('PDF_TEXT_MAX_PAGES', '5'))
+PDF_TEXT_MIN_CHARS = int(os.environ.get('PDF_TEXT_MIN_CHARS', '80'))
+PDF_TEXT_MAX_CHARS = int(os.environ.get('PDF_TEXT_MAX_CHARS', '12000'))
+PDF_TEXT_TIMEOUT_SECONDS = float(os.environ.get('PDF_TEXT_TIMEOUT_SECONDS', '10'))
+
+# Mode multi-pages (?multipage=true): pages d'un PDF scanné extraites en parallèle
+PDF_MULTIPAGE_MAX_PAGES = int(os.environ.get('PDF_MULTIPAGE_MAX_PAGES', '5'))
+# Écart toléré (EUR) pour HT + TVA = TTC ou somme des lignes = TTC
+TOTAL_TOLERANCE = 0.02
+
+_AMOUNT_PATTERN = re.compile(r'\d[\d\s]*[.,]\d{2}\b')
+_READABLE_CHARS = re.compile(r"[\w\s.,;:!?'\"()/%€$&@#*+=<>°-]")
+
+
+def _parse_page_size(value: Optional[str]) -> Optional[Tuple[float, float]]:
+    """'595.276 x 841.89 pts (A4)' -> (595.276, 841.89)"""
+    match = _PAGE_SIZE_PATTERN.search(value or '')
+    return (float(match.group(1)), float(match.group(2))) if match else None
+
+
+class PdfDocument:
     """
-    Convertit un PDF en liste d'images PIL
-    Utilise pdf2image (poppler)
+    PDF ouvert une seule fois (fichier temporaire partagé par poppler)
+    - Nombre de pages et dimensions lus dans les métadonnées (pdfinfo), sans rastérisation
+    - Pages rendues seulement quand une étape les demande, avec un DPI adapté à leur taille
     """
-    try:
-        from pdf2image import convert_from_bytes
-        
-        # Convertir toutes les pages (limité à 5 pour performance)
-        images = convert_from_bytes(
-            pdf_bytes, 
-            dpi=dpi,
-            first_page=1,
-            last_page=5,  # Max 5 pages
-            fmt='PNG'
-        )
+    
+    def __init__(self, pdf_bytes: bytes):
+        from pdf2image import pdfinfo_from_path
         
-        return images
+        self._images: Dict[int, Image.Image] = {}
+        self._sizes: Dict[int, Optional[Tuple[float, float]]] = {}
+        tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        self.path = tmp.name
+        try:
+            with tmp:
+                tmp.write(pdf_bytes)
+            info = pdfinfo_from_path(self.path)
+        except Exception:
+            self.close()
+            raise
         
-    except Exception as e:
-        print(f"PDF conversion error: {e}")
-        return []
+        self.page_count = int(info['Pages'])
+        # Sans -f/-l, pdfinfo donne la taille de la première page
+        self._sizes[1] = _parse_page_size(info.get('Page size'))
+    
+    def page_size(self, page: int) -> Optional[Tuple[float, float]]:
+        """Dimensions de la page en points (1/72 de pouce)"""
+        if page not in self._sizes:
+            from pdf2image import pdfinfo_from_path
+            info = pdfinfo_from_path(self.path, first_page=page, last_page=page)
+            key = re.compile(rf'Page\s+{page}\s+size')
+            self._sizes[page] = next((_parse_page_size(v) for k, v in info.items() if key.fullmatch(k.strip())), None)
+        return self._sizes[page]
+    
+    def dpi_for(self, page: int) -> int:
+        """DPI donnant ~PDF_TARGET_LONG_SIDE_PX sur le grand côté (borné)"""
+        size = self.page_size(page)
+        if not size or max(size) <= 0:
+            return PDF_DEFAULT_DPI
+        long_side_inches = max(size) / 72
+        return int(max(PDF_MIN_DPI, min(PDF_MAX_DPI, PDF_TARGET_LONG_SIDE_PX / long_side_inches)))
+    
+    def render(self, page: int = 1) -> Image.Image:
+        """Rastérise une page (numérotée à partir de 1), une seule fois"""
+        if page not in self._images:
+            from pdf2image import convert_from_path
+            
+            if not 1 <= page <= self.page_count:
+                raise ValueError(f"Page {page} hors du document ({self.page_count} pages)")
+            images = convert_from_path(self.path, dpi=self.dpi_for(page), first_page=page, last_page=page)
+            if not images:
+                raise ValueError(f"Page {page} non convertie")
+            self._images[page] = images[0]
+        return self._images[page]
+    
+    def text(self, first_page: int = 1, last_page: Optional[int] = None) -> str:
+        """Couche texte des pages demandées (pdftotext -layout), '' si absente ou illisible"""
+        last_page = min(last_page or self.page_count, self.page_count)
+        try:
+            completed = subprocess.run(
+                ['pdftotext', '-layout', '-enc', 'UTF-8', '-f', str(first_page), '-l', str(last_page), self.path, '-'],
+                capture_output=True, timeout=PDF_TEXT_TIMEOUT_SECONDS, check=True
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"pdftotext failed: {e}")
+            return ''
+        return completed.stdout.decode('utf-8', errors='replace')
+    
+    def close(self):
+        self._images.clear()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+    
+    def __enter__(self) -> 'PdfDocument':
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def text_layer_is_usable(text: str) -> bool:
+    """
+    La couche texte suffit-elle pour l'extraction sans image?
+    - Assez de texte (un PDF scanné n'en a pas, ou seulement un en-tête)
+    - Caractères lisibles (polices mal encodées: glyphes de remplacement)
+    - Au moins un montant
+    """
+    compact = ''.join(text.split())
+    if len(compact) < PDF_TEXT_MIN_CHARS:
+        return False
+    readable = len(_READABLE_CHARS.findall(compact))
+    if readable / len(compact) < 0.9:
+        return False
+    return _AMOUNT_PATTERN.search(text) is not None
 
 
 def preprocess_image_for_ocr(image: Image.Image) -> Image.Image:
     """
     Prétraitement avancé de l'image pour améliorer la reconnaissance OCR
-    - Redimensionnement intelligent
+    - Réduction à la résolution utile au modèle (avant les filtres: moins de pixels à traiter)
     - Amélioration du contraste
     - Conversion en niveaux de gris si nécessaire
     - Réduction du bruit
@@ -104,26 +239,11 @@ def preprocess_image_for_ocr(image: Image.Image) -> Image.Image:
                 image = background
             else:
                 image = image.convert('RGB')
-        elif image.mode != 'RGB':
+        elif image.mode not in ('RGB', 'L'):
             image = image.convert('RGB')
         
-        # Redimensionner si trop grande ou trop petite
-        min_dimension = 800
-        max_dimension = 2500
-        
-        width, height = image.size
-        
-        # Agrandir si trop petite
-        if max(width, height) < min_dimension:
-            scale = min_dimension / max(width, height)
-            new_size = (int(width * scale), int(height * scale))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Réduire si trop grande
-        elif max(width, height) > max_dimension:
-            scale = max_dimension / max(width, height)
-            new_size = (int(width * scale), int(height * scale))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
+        # Résolution réellement utilisée par le modèle Vision (jamais d'agrandissement)
+        image = fit_vision_resolution(image)
         
         # Améliorer le contraste
         enhancer = ImageEnhance.Contrast(image)
@@ -158,6 +278,27 @@ def image_to_base64(image: Image.Image, format: str = 'PNG', quality: int = 90)
     return base64.b64encode(buffer.read()).decode('utf-8')
 
 
+def prepare_vision_payload(image: Image.Image) -> VisionPayload:
+    """
+    Image prête pour le modèle Vision: recadrage, prétraitement puis encodage au plus petit format
+    qui tient dans le budget (services/vision_payload.py). À appeler hors de la boucle d'événements.
+    """
+    # Recadrage sur le ticket, redressement et niveaux de gris (services/receipt_crop.py)
+    # Image.open ne lit que l'en-tête: le décodage se fait ici
+    with timing.stage("decode"):
+        image.load()
+    
+    started = time.perf_counter()
+    with timing.stage("crop"):
+        image = crop_receipt(image, max_size=VISION_MAX_LONG_SIDE)
+    metrics.observe("receipt_crop_seconds", time.perf_counter() - started, path="vision")
+    
+    with timing.stage("preprocess"):
+        image = preprocess_image_for_ocr(image)
+    with timing.stage("encode"):
+        return optimize_payload(image)
+
+
 def detect_category_from_text(text: str) -> str:
     """Détecte la catégorie basée sur les mots-clés"""
     text_lower = text.lower()
@@ -179,6 +320,10 @@ def detect_category_from_text(text: str) -> str:
     return 'Autre'
 
 
+# En dessous de cette confiance, le résultat est toujours à vérifier par l'utilisateur
+REVIEW_CONFIDENCE = 0.7
+
+
 def validate_extracted_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Validation et nettoyage des données extraites
@@ -277,7 +422,7 @@ def validate_extracted_data(data: Dict[str, Any]) -> Dict[str, Any]:
             pass
     
     # 5. Confiance faible
-    if data.get('confidence', 0) < 0.7:
+    if data.get('confidence', 0) < REVIEW_CONFIDENCE:
         data['needsReview'] = True
     
     # 6. Validation des lignes de facture
@@ -309,17 +454,8 @@ def validate_extracted_data(data: Dict[str, Any]) -> Dict[str, Any]:
     return data
 
 
-async def extract_invoice_data_with_openai(image_base64: str, filename: str = "") -> Dict[str, Any]:
-    """
-    Extraction haute précision via OpenAI Vision (GPT-4o)
-    Utilise Emergent LLM Key pour l'authentification
-    Prompt ultra-optimisé pour taux de réussite >95%
-    """
-    # Import emergentintegrations
-    from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
-    
-    # Prompt système expert
-    system_prompt = """Tu es un EXPERT COMPTABLE spécialisé dans l'extraction de données de factures, tickets de caisse et notes de frais.
+# Prompt système expert (partagé par les extractions image et texte)
+INVOICE_SYSTEM_PROMPT = """Tu es un EXPERT COMPTABLE spécialisé dans l'extraction de données de factures, tickets de caisse et notes de frais.
 Ta mission est d'extraire TOUTES les informations avec une PRÉCISION MAXIMALE (>95%).
 
 📋 RÈGLES D'EXTRACTION STRICTES:
@@ -377,7 +513,7 @@ Ta mission est d'extraire TOUTES les informations avec une PRÉCISION MAXIMALE (
 - Le montant total est CRITIQUE - vérifie-le 3 fois
 - needsReview = true si confiance < 0.8 ou si des doutes existent"""
 
-    user_prompt = """ANALYSE cette facture/ticket et extrais les données en JSON.
+INVOICE_USER_PROMPT = """ANALYSE cette facture/ticket et extrais les données en JSON.
 
 RÉPONDS UNIQUEMENT avec ce JSON (pas de texte avant ou après):
 
@@ -406,83 +542,119 @@ RÉPONDS UNIQUEMENT avec ce JSON (pas de texte avant ou après):
 
 🔴 CRITIQUE: Le montantTotal doit être exact. C'est la donnée la plus importante!"""
 
-    response = None
+
+def clean_model_response(response: str) -> str:
+    """Objet JSON de la réponse du modèle, sans bloc markdown ni texte autour"""
+    cleaned = response.strip()
     
-    try:
-        print(f"[OCR] Starting GPT-4o Vision analysis...")
-        
-        # Initialiser le chat avec emergentintegrations et la clé Emergent LLM
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"ocr-invoice-{datetime.now().timestamp()}",
-            system_message=system_prompt
-        ).with_model("openai", "gpt-4o")
-        
-        # Créer le contenu image
-        image_content = ImageContent(image_base64=image_base64)
-        
-        # Envoyer le message
-        user_message = UserMessage(
-            text=user_prompt,
-            file_contents=[image_content]
-        )
-        
-        print(f"[OCR] Sending request to GPT-4o Vision...")
-        response = await chat.send_message(user_message)
-        
-        print(f"[OCR] Response received, parsing JSON...")
-        
-        # Parser la réponse JSON
-        cleaned = response.strip()
-        
-        # Nettoyer les blocs markdown
-        if '```json' in cleaned:
-            cleaned = cleaned.split('```json')[1].split('```')[0]
-        elif '```' in cleaned:
-            cleaned = cleaned.split('```')[1].split('```')[0]
-        
-        cleaned = cleaned.strip()
-        
-        # Extraire le JSON
-        json_match = re.search(r'\{[\s\S]*\}', cleaned)
-        if json_match:
-            cleaned = json_match.group(0)
-        
-        result = json.loads(cleaned)
-        
-        print(f"[OCR] Parsed result: montantTotal={result.get('montantTotal')}, fournisseur={result.get('fournisseur')}")
-        
-        # Valider et nettoyer les données
+    # Nettoyer les blocs markdown
+    if '```json' in cleaned:
+        cleaned = cleaned.split('```json')[1].split('```')[0]
+    elif '```' in cleaned:
+        cleaned = cleaned.split('```')[1].split('```')[0]
+    
+    cleaned = cleaned.strip()
+    
+    # Extraire le JSON
+    json_match = re.search(r'\{[\s\S]*\}', cleaned)
+    if json_match:
+        cleaned = json_match.group(0)
+    
+    return cleaned
+
+
+def parse_invoice_response(response: str) -> Dict[str, Any]:
+    """
+    Parse la réponse JSON du modèle, valide les données et complète la catégorie
+    Lève json.JSONDecodeError si la réponse n'est pas du JSON
+    """
+    with timing.stage("parse_json"):
+        result = json.loads(clean_model_response(response))
+    
+    print(f"[OCR] Parsed result: montantTotal={result.get('montantTotal')}, fournisseur={result.get('fournisseur')}")
+    
+    # Valider et nettoyer les données
+    with timing.stage("validate"):
         result = validate_extracted_data(result)
-        
-        # Détecter catégorie automatiquement si non fournie ou "Autre"
-        if not result.get('categorie') or result.get('categorie') == 'Autre':
-            text_to_analyze = f"{result.get('fournisseur', '')} {result.get('description', '')} {filename}"
+    
+    # Détecter catégorie automatiquement si non fournie ou "Autre"
+    if not result.get('categorie') or result.get('categorie') == 'Autre':
+        with timing.stage("category"):
+            text_to_analyze = f"{result.get('fournisseur', '')} {result.get('description', '')}"
             detected = detect_category_from_text(text_to_analyze)
-            if detected != 'Autre':
-                result['categorie'] = detected
+        if detected != 'Autre':
+            result['categorie'] = detected
+    
+    print(f"[OCR] SUCCESS - Final data: {json.dumps(result, ensure_ascii=False)[:200]}...")
+    
+    return {
+        'success': True,
+        'data': result
+    }
+
+
+async def call_and_parse(operation: str, fn, payload: str) -> Dict[str, Any]:
+    """
+    Appel au modèle sous llm_guard, puis parse de sa réponse
+    Réponse qui n'est pas du JSON: extraction de secours sur le texte brut, et nouvel appel
+    (jusqu'à llm_guard.max_attempts) tant qu'elle ne trouve pas de montant
+    Une réponse mal formée n'est pas une panne: elle ne compte pas pour le disjoncteur
+    """
+    fallback = None
+    for attempt in range(llm_guard.max_attempts):
+        with timing.stage("llm_call"):
+            response = await llm_guard.call(operation, fn, payload)
+        try:
+            return parse_invoice_response(response)
+        except json.JSONDecodeError as e:
+            print(f"[OCR] JSON Parse Error ({operation}, attempt {attempt + 1}): {e}")
+            print(f"[OCR] Raw response: {response if response else 'N/A'}")
         
-        print(f"[OCR] SUCCESS - Final data: {json.dumps(result, ensure_ascii=False)[:200]}...")
+        # Tentative d'extraction de secours
+        fallback = extract_fallback_data(response if response else '')
+        if fallback['success']:
+            return fallback
+    return fallback
+
+
+async def extract_invoice_data_with_openai(image_base64: str) -> Dict[str, Any]:
+    """
+    Extraction haute précision via OpenAI Vision (GPT-4o)
+    Utilise Emergent LLM Key pour l'authentification
+    Prompt ultra-optimisé pour taux de réussite >95%
+    """
+    try:
+        backend = get_backend()
+        print(f"[OCR] Starting Vision analysis ({backend.name})...")
+        # Limite de concurrence, retries avec backoff et disjoncteur (services/llm_guard.py)
+        return await call_and_parse("vision", backend.extract_image, image_base64)
         
+    except Exception as e:
+        # Fournisseur indisponible (disjoncteur ouvert ou tentatives épuisées)
+        print(f"[OCR] Error: {e!r}")
         return {
-            'success': True,
-            'data': result
+            'success': False,
+            'error': str(e) or type(e).__name__,
+            'unavailable': True
         }
-        
-    except json.JSONDecodeError as e:
-        print(f"[OCR] JSON Parse Error: {e}")
-        print(f"[OCR] Raw response: {response if response else 'N/A'}")
-        
-        # Tentative d'extraction de secours
-        return extract_fallback_data(response if response else '', filename)
+
+
+async def extract_invoice_data_from_text(text: str) -> Dict[str, Any]:
+    """
+    Extraction à partir de la couche texte d'un PDF numérique
+    Même prompt et même format de sortie que l'extraction Vision, sans image
+    """
+    try:
+        backend = get_backend()
+        print(f"[OCR] Starting text analysis ({backend.name}, {len(text)} chars)...")
+        return await call_and_parse("text", backend.extract_text, text)
         
     except Exception as e:
-        print(f"[OCR] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"[OCR] Text extraction error: {e!r}")
         return {
             'success': False,
-            'error': str(e)
+            'error': str(e) or type(e).__name__,
+            'unavailable': True
         }
 
 
@@ -548,103 +720,441 @@ def extract_fallback_data(text: str, filename: str = "") -> Dict[str, Any]:
     return result
 
 
-async def analyze_document(file_bytes: bytes, filename: str = "", file_type: str = "image") -> Dict[str, Any]:
+def build_local_invoice_data(text: str) -> Dict[str, Any]:
+    """
+    Données facture (même format que l'extraction Vision) depuis le texte Tesseract
+    La confiance reflète les champs trouvés (LOCAL_FIELD_WEIGHTS)
+    """
+    fields = extract_receipt_fields(text)
+    data = {
+        'montantTotal': fields['amount'],
+        'montantHT': None,
+        'montantTVA': None,
+        'currency': 'EUR',
+        'numeroFacture': None,
+        'dateFacture': fields['date'],
+        'fournisseur': fields['merchant'],
+        'adresse': None,
+        'categorie': detect_category_from_text(text),
+        'lignes': [],
+        'description': None,
+    }
+    data['confidence'] = local_confidence(data)
+    data['needsReview'] = False
+    return validate_extracted_data(data)
+
+
+def local_confidence(data: Dict[str, Any]) -> float:
+    """Confiance d'un résultat local: somme des poids (LOCAL_FIELD_WEIGHTS) des champs trouvés"""
+    found = {
+        'montantTotal': data.get('montantTotal') is not None,
+        'dateFacture': data.get('dateFacture') is not None,
+        'fournisseur': data.get('fournisseur') is not None,
+        'categorie': data.get('categorie') not in (None, 'Autre'),
+    }
+    return round(sum(w for field, w in LOCAL_FIELD_WEIGHTS.items() if found[field]), 2)
+
+
+def escalation_reasons(data: Dict[str, Any]) -> List[str]:
+    """Raisons de passer au modèle Vision (liste vide: le résultat local suffit)"""
+    reasons = [f"missing_{field}" for field in OCR_LOCAL_REQUIRED_FIELDS if data.get(field) in (None, '')]
+    if data.get('confidence', 0) < OCR_LOCAL_MIN_CONFIDENCE:
+        reasons.append('low_confidence')
+    if data.get('needsReview') and data.get('confidence', 0) >= REVIEW_CONFIDENCE:
+        # Signalé par validate_extracted_data pour un montant ou une date invraisemblable: probablement mal lu
+        reasons.append('validation')
+    return reasons
+
+
+async def local_ocr_text(file_bytes: bytes, digest: str) -> Optional[str]:
+    """Texte Tesseract du fichier (pool de processus), None si l'OCR local est indisponible"""
+    # Texte OCR partagé avec /api/ocr/analyze-receipt (même fichier, même pipeline Tesseract)
+    cached = await ocr_cache.get(RECEIPT_PIPELINE_VERSION, digest)
+    if cached is not None:
+        return cached['text']
+    try:
+        with timing.stage("local_ocr"):
+            ocr = await receipt_ocr_pool.run(file_bytes)
+    except Exception as e:
+        # Pool saturé, timeout, Tesseract absent...
+        print(f"[OCR] Local OCR unavailable: {e!r}")
+        return None
+    if ocr['error']:
+        print(f"[OCR] Local OCR error: {ocr['error']}")
+        return None
+    text = ocr['text'] or ''
+    await ocr_cache.put(RECEIPT_PIPELINE_VERSION, digest, {'text': text})
+    return text
+
+
+async def resolve_known_merchant(data: Dict[str, Any], user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Résultat local complété par l'index des fournisseurs (services/merchant_index.py), sur une copie
+    Retourné si la catégorie apprise lève les raisons d'escalader, None sinon (fournisseur inconnu,
+    montant ou date manquants...)
+    """
+    resolved = dict(data)
+    with timing.stage("merchant_index"):
+        match = await merchant_index.apply(resolved, user_id)
+    if match is None:
+        return None
+    resolved['confidence'] = max(resolved.get('confidence') or 0.0, local_confidence(resolved))
+    return resolved if not escalation_reasons(resolved) else None
+
+
+async def extract_invoice_data_locally(file_bytes: bytes, digest: str,
+                                      user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Étage local: Tesseract (pool de processus) + regex
+    Retourne le résultat s'il est suffisant, None s'il faut passer au modèle Vision
+    Décision d'abord prise sur le fichier seul: ce résultat est mis en cache par fichier, pour tous
+    À défaut, un fournisseur connu de user_id peut apporter la catégorie qui manquait (pas d'appel Vision):
+    ce résultat-là (categorySource='merchant_index') est propre à l'utilisateur et jamais mis en cache
+    """
+    text = await local_ocr_text(file_bytes, digest)
+    if text is None:
+        # Le modèle Vision prend le relais
+        metrics.increment("invoice_ocr_escalations_total", reason="local_unavailable")
+        return None
+    
+    with timing.stage("local_rules"):
+        data = build_local_invoice_data(text)
+    
+    reasons = escalation_reasons(data)
+    if reasons:
+        known = await resolve_known_merchant(data, user_id)
+        if known is not None:
+            print(f"[OCR] Known supplier, no escalation: {known.get('fournisseur')}")
+            return {
+                'success': True,
+                'data': known
+            }
+        print(f"[OCR] Escalating to Vision: {', '.join(reasons)}")
+        # Une escalade comptée une fois, sous sa première raison
+        metrics.increment("invoice_ocr_escalations_total", reason=reasons[0])
+        return None
+    
+    return {
+        'success': True,
+        'data': data
+    }
+
+
+async def extract_invoice_data_offline(file_bytes: bytes, digest: str,
+                                      text: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Extraction de secours quand le modèle est indisponible (disjoncteur ouvert, tentatives épuisées):
+    regex sur la couche texte du PDF ou sur le texte Tesseract, toujours à vérifier par l'utilisateur
+    None si aucun montant n'est trouvé
+    """
+    if text is None:
+        text = await local_ocr_text(file_bytes, digest)
+    if not text:
+        return None
+    
+    data = build_local_invoice_data(text)
+    if data.get('montantTotal') is None:
+        return None
+    data['needsReview'] = True
+    data['warnings'] = (data.get('warnings') or []) + ["Analyse IA indisponible: données extraites localement, à vérifier"]
+    return {
+        'success': True,
+        'data': data
+    }
+
+
+async def extract_pdf_page(pdf: 'PdfDocument', page: int) -> Dict[str, Any]:
+    """Une page d'un PDF scanné: rendu et payload hors boucle d'événements, puis extraction Vision"""
+    try:
+        with timing.stage("pdf_render"):
+            image = await asyncio.to_thread(pdf.render, page)
+        payload = await asyncio.to_thread(prepare_vision_payload, image)
+    except Exception as e:
+        print(f"PDF page {page} conversion error: {e}")
+        return {'success': False, 'error': f'Page {page} non convertie: {e}'}
+    print(f"[OCR] Vision payload (page {page}): {payload!r} in {payload.encode_seconds * 1000:.0f} ms")
+    with timing.stage("base64_encode"):
+        image_base64 = payload.base64()
+    return await extract_invoice_data_with_openai(image_base64)
+
+
+def total_evidence(data: Dict[str, Any], lines_total: Optional[float] = None) -> float:
+    """
+    Crédit du total d'une page: sa confiance, +1 si HT + TVA = TTC, +0.5 si la somme
+    des lignes de toutes les pages vaut ce total; -1 sans total
+    """
+    total = data.get('montantTotal')
+    if total is None:
+        return -1.0
+    score = data.get('confidence') or 0.0
+    ht, tva = data.get('montantHT'), data.get('montantTVA')
+    if ht is not None and tva is not None and abs(ht + tva - total) <= TOTAL_TOLERANCE:
+        score += 1.0
+    if lines_total is not None and abs(lines_total - total) <= TOTAL_TOLERANCE:
+        score += 0.5
+    return score
+
+
+def merge_page_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fusionne les extractions des pages d'un document (dans l'ordre des pages)
+    - Lignes de toutes les pages, page après page (une même ligne peut revenir: une nuitée par nuit)
+    - Montants de la page dont le total est le mieux étayé (total_evidence; à égalité la dernière)
+    - Fournisseur, numéro, date...: première page qui les donne
+    Échec si aucune page n'a abouti (indisponible si le modèle l'était)
+    """
+    pages = [(page, result['data']) for page, result in enumerate(results, 1) if result.get('success')]
+    if not pages:
+        return next((r for r in results if r.get('unavailable')), results[0])
+    
+    lignes = [ligne for _, data in pages for ligne in data.get('lignes') or []]
+    amounts = [ligne.get('montant') for ligne in lignes if isinstance(ligne, dict)]
+    lines_total = round(sum(amounts), 2) if amounts and all(isinstance(a, (int, float)) for a in amounts) else None
+    
+    total_page, best = max(pages, key=lambda item: (total_evidence(item[1], lines_total), item[0]))
+    merged = dict(best)
+    for field in ('numeroFacture', 'dateFacture', 'fournisseur', 'adresse', 'description'):
+        merged[field] = next((data[field] for _, data in pages if data.get(field)), best.get(field))
+    merged['categorie'] = next((data['categorie'] for _, data in pages if data.get('categorie') not in (None, 'Autre')), 'Autre')
+    merged['lignes'] = lignes
+    
+    warnings = [w for _, data in pages for w in data.get('warnings') or []]
+    totals = sorted({data['montantTotal'] for _, data in pages if data.get('montantTotal') is not None})
+    if len(totals) > 1:
+        warnings.append(f"Totaux différents selon les pages ({', '.join(f'{t:.2f}' for t in totals)}): total de la page {total_page} retenu")
+        merged['needsReview'] = True
+    merged['warnings'] = list(dict.fromkeys(warnings))
+    merged.update(pagesAnalyzed=len(results), totalPage=total_page)
+    return {
+        'success': True,
+        'data': merged
+    }
+
+
+def apply_filename_hint(data: Dict[str, Any], filename: str) -> None:
+    """
+    Catégorie déduite du nom de fichier quand le contenu n'en donne pas ("Autre")
+    Propre à chaque envoi: le résultat en cache, partagé par tous ceux qui envoient le même fichier, n'en dépend pas
+    """
+    if not filename or data.get('categorie') not in (None, '', 'Autre'):
+        return
+    detected = detect_category_from_text(f"{data.get('fournisseur') or ''} {data.get('description') or ''} {filename}")
+    if detected != 'Autre':
+        data['categorie'] = detected
+
+
+def analysis_failure(error: Optional[str], filename: str = "") -> Dict[str, Any]:
+    """Réponse d'échec de analyze_document (données par défaut à compléter par l'utilisateur)"""
+    return {
+        'success': False,
+        'error': error or 'Extraction failed after retries',
+        'data': {
+            'montantTotal': None,
+            'dateFacture': datetime.now().strftime('%d/%m/%Y'),
+            'categorie': detect_category_from_text(filename),
+            'confidence': 0.1,
+            'needsReview': True
+        }
+    }
+
+
+def analysis_outcome(result: Dict[str, Any]) -> str:
+    """Issue d'une analyse, pour pipeline_seconds{outcome}"""
+    if result.get('success'):
+        return (result.get('data') or {}).get('extractionPath') or 'unknown'
+    return 'retake' if result.get('retake') else 'failed'
+
+
+async def analyze_document(file_bytes: bytes, filename: str = "", file_type: str = "image",
+                           debug: bool = False, user_id: Optional[str] = None,
+                           multipage: bool = False) -> Dict[str, Any]:
     """
     Point d'entrée principal pour l'analyse de document
     Supporte images (JPG, PNG, WEBP) et PDF
-    Gère les retries et la validation
+    multipage=True: jusqu'à PDF_MULTIPAGE_MAX_PAGES pages d'un PDF scanné extraites en parallèle puis fusionnées
+    Catégorie apprise des corrections (services/merchant_index.py) pour les fournisseurs connus de user_id
+    Le nom de fichier n'est qu'un indice de catégorie, appliqué à chaque réponse: jamais dans le cache OCR
+    Durée de chaque étape dans pipeline_stage_seconds (services/timing.py); debug=True: aussi dans result['timings']
+    """
+    with timing.trace("analyze_document") as trace:
+        result = await run_document_analysis(file_bytes, filename, file_type, multipage, user_id)
+        if result.get('success'):
+            apply_filename_hint(result['data'], filename)
+        # Après le cache OCR (partagé entre utilisateurs, par fichier): les valeurs apprises de cet utilisateur
+        # ne vont que dans sa réponse, le résultat en cache reste celui de l'extraction
+        # (déjà appliquées si elles ont évité l'appel Vision)
+        if result.get('success') and not result['data'].get('categorySource'):
+            with timing.stage("merchant_index"):
+                await merchant_index.apply(result['data'], user_id)
+        trace.outcome = trace.outcome or analysis_outcome(result)
+    
+    if debug:
+        # Copie: le résultat peut être l'entrée du cache OCR
+        result = {**result, 'timings': trace.to_dict()}
+    return result
+
+
+async def run_document_analysis(file_bytes: bytes, filename: str = "", file_type: str = "image",
+                                multipage: bool = False, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyse d'un document (voir analyze_document)
+    Retries et disjoncteur dans llm_guard; extraction de secours si le modèle est indisponible
     """
-    max_retries = 2
-    last_error = None
     images_to_process = []
+    # Résultat fusionné des pages (mode multi-pages)
+    pages_result = None
+    # Couche texte du PDF, réutilisée par l'extraction de secours
+    pdf_text = None
     
     # Détecter le type de fichier
     is_pdf = file_bytes[:4] == b'%PDF' or file_type.lower() == 'pdf'
     
+    # Même fichier déjà analysé par ce pipeline: pas de nouvel appel Vision
+    # Autre backend (OCR_BACKEND): cache séparé, un résultat simulé ne doit jamais servir en production
+    backend = get_backend().name
+    version = PIPELINE_VERSION if backend == DEFAULT_BACKEND else f"{PIPELINE_VERSION}+{backend}"
+    pipeline = f"{version}/{('pdf-multipage' if multipage else 'pdf') if is_pdf else 'image'}"
+    with timing.stage("cache_lookup"):
+        digest = await ocr_cache.file_digest(file_bytes)
+        cached = await ocr_cache.get(pipeline, digest)
+    if cached is not None:
+        timing.current().outcome = 'cached'
+        return cached
+    
     if is_pdf:
-        # Convertir PDF en images
+        # Seule la première page est envoyée au modèle (sauf mode multi-pages): les autres ne sont pas rastérisées
         print(f"Processing PDF: {filename}")
-        images = convert_pdf_to_images(file_bytes)
+        first_page = None
+        try:
+            with timing.stage("pdf_open"):
+                pdf = await asyncio.to_thread(PdfDocument, file_bytes)
+        except Exception as e:
+            print(f"PDF conversion error: {e}")
+            pdf = None
         
-        if not images:
-            return {
-                'success': False,
-                'error': 'Impossible de convertir le PDF en images. Vérifiez que le fichier n\'est pas corrompu.',
-                'data': {
-                    'montantTotal': None,
-                    'dateFacture': datetime.now().strftime('%d/%m/%Y'),
-                    'categorie': detect_category_from_text(filename),
-                    'confidence': 0.1,
-                    'needsReview': True
-                }
-            }
+        if pdf is not None:
+            try:
+                page_count = pdf.page_count
+                
+                # PDF numérique: extraction depuis la couche texte, sans image ni Vision
+                if PDF_TEXT_LAYER_ENABLED:
+                    with timing.stage("pdf_text"):
+                        text = await asyncio.to_thread(pdf.text, 1, PDF_TEXT_MAX_PAGES)
+                    if text_layer_is_usable(text):
+                        pdf_text = text
+                        result = await extract_invoice_data_from_text(text)
+                        if result.get('success') and result['data'].get('montantTotal') is not None:
+                            result['data'].update(pageCount=page_count, fileType='pdf', extractionPath='text')
+                            metrics.increment("invoice_extraction_path_total", path="text")
+                            await ocr_cache.put(pipeline, digest, result)
+                            return result
+                        print(f"Text layer extraction incomplete, falling back to Vision: {filename}")
+                
+                # Plusieurs pages à lire: le total peut être en page 2 ou 3
+                multipage = multipage and page_count > 1
+                
+                # PDF scanné: Tesseract en local avant le modèle Vision (première page seulement)
+                if OCR_LOCAL_TIER_ENABLED and not multipage:
+                    result = await extract_invoice_data_locally(file_bytes, digest, user_id)
+                    if result is not None:
+                        result['data'].update(pageCount=page_count, fileType='pdf', extractionPath='local')
+                        metrics.increment("invoice_extraction_path_total", path="local")
+                        if not result['data'].get('categorySource'):
+                            await ocr_cache.put(pipeline, digest, result)
+                        return result
+                
+                if multipage:
+                    # Pages en parallèle: les appels au modèle partagent la limite de llm_guard
+                    pages = range(1, min(page_count, PDF_MULTIPAGE_MAX_PAGES) + 1)
+                    page_results = await asyncio.gather(*(extract_pdf_page(pdf, page) for page in pages))
+                    if any(r.get('success') or r.get('unavailable') for r in page_results):
+                        pages_result = merge_page_results(page_results)
+                else:
+                    with timing.stage("pdf_render"):
+                        first_page = await asyncio.to_thread(pdf.render, 1)
+            except Exception as e:
+                print(f"PDF conversion error: {e}")
+            finally:
+                pdf.close()
         
-        # Prétraiter chaque page
-        for img in images:
-            processed = preprocess_image_for_ocr(img)
-            images_to_process.append(processed)
+        if first_page is None and pages_result is None:
+            return analysis_failure('Impossible de convertir le PDF en images. Vérifiez que le fichier n\'est pas corrompu.', filename)
+        
+        if first_page is not None:
+            images_to_process.append(first_page)
     else:
+        # Photo floue, sombre ou prise de trop loin: refusée avant tout OCR
+        with timing.stage("quality_gate"):
+            quality = await asyncio.to_thread(check_image_quality, file_bytes)
+        if quality is not None and not quality.ok:
+            print(f"[OCR] Image rejected: {quality!r} in {quality.seconds * 1000:.0f} ms")
+            result = analysis_failure(f'{quality.message} Reprenez la photo.', filename)
+            result.update(retake=True, quality=quality.to_dict())
+            return result
+        
+        # Ticket ou facture simple: Tesseract en local avant le modèle Vision
+        if OCR_LOCAL_TIER_ENABLED:
+            result = await extract_invoice_data_locally(file_bytes, digest, user_id)
+            if result is not None:
+                result['data'].update(fileType='image', extractionPath='local')
+                metrics.increment("invoice_extraction_path_total", path="local")
+                # Résultat dû à l'index des fournisseurs de cet utilisateur: hors du cache partagé
+                if not result['data'].get('categorySource'):
+                    await ocr_cache.put(pipeline, digest, result)
+                return result
+        
         # Traiter comme image
         try:
             image = Image.open(io.BytesIO(file_bytes))
-            processed = preprocess_image_for_ocr(image)
-            images_to_process.append(processed)
+            images_to_process.append(image)
         except Exception as e:
-            return {
-                'success': False,
-                'error': f'Impossible d\'ouvrir l\'image: {str(e)}',
-                'data': {
-                    'montantTotal': None,
-                    'dateFacture': datetime.now().strftime('%d/%m/%Y'),
-                    'categorie': detect_category_from_text(filename),
-                    'confidence': 0.1,
-                    'needsReview': True
-                }
-            }
+            return analysis_failure(f'Impossible d\'ouvrir l\'image: {str(e)}', filename)
     
     # Analyser la première page (ou image unique)
     if images_to_process:
         primary_image = images_to_process[0]
-        image_base64 = image_to_base64(primary_image)
-        
-        # Retry logic
-        for attempt in range(max_retries + 1):
-            try:
-                result = await extract_invoice_data_with_openai(image_base64, filename)
-                
-                if result.get('success'):
-                    # Ajouter info sur le nombre de pages si PDF
-                    if is_pdf:
-                        result['data']['pageCount'] = len(images_to_process)
-                        result['data']['fileType'] = 'pdf'
-                    else:
-                        result['data']['fileType'] = 'image'
-                    
-                    return result
-                
-                # Si échec mais pas d'exception, continuer
-                if attempt < max_retries:
-                    await asyncio.sleep(1)
-                    
-            except Exception as e:
-                last_error = e
-                print(f"OCR Attempt {attempt + 1} failed: {e}")
-                
-                if attempt < max_retries:
-                    await asyncio.sleep(1)
+        try:
+            payload = await asyncio.to_thread(prepare_vision_payload, primary_image)
+        except Exception as e:
+            # Image.open ne lit que l'en-tête: un fichier tronqué échoue au décodage
+            return analysis_failure(f'Impossible d\'ouvrir l\'image: {str(e)}', filename)
+        print(f"[OCR] Vision payload: {payload!r} in {payload.encode_seconds * 1000:.0f} ms")
+        with timing.stage("base64_encode"):
+            image_base64 = payload.base64()
+        result = await extract_invoice_data_with_openai(image_base64)
+    elif pages_result is not None:
+        result = pages_result
+    else:
+        return analysis_failure(None, filename)
     
-    # Retourner le dernier résultat ou l'erreur
-    return {
-        'success': False,
-        'error': str(last_error) if last_error else 'Extraction failed after retries',
-        'data': {
-            'montantTotal': None,
-            'dateFacture': datetime.now().strftime('%d/%m/%Y'),
-            'categorie': detect_category_from_text(filename),
-            'confidence': 0.1,
-            'needsReview': True
-        }
-    }
+    if result.get('success'):
+        path = 'vision'
+    elif result.get('unavailable'):
+        # Fournisseur indisponible: résultat local à vérifier plutôt qu'une erreur
+        with timing.stage("fallback"):
+            fallback = await extract_invoice_data_offline(file_bytes, digest, pdf_text)
+        if fallback is None:
+            metrics.increment("invoice_extraction_path_total", path="failed")
+            return analysis_failure(result.get('error'), filename)
+        result, path = fallback, 'fallback'
+    else:
+        metrics.increment("invoice_extraction_path_total", path="failed")
+        return analysis_failure(result.get('error'), filename)
+    
+    # Ajouter info sur le nombre de pages si PDF
+    if is_pdf:
+        result['data']['pageCount'] = page_count
+        result['data']['fileType'] = 'pdf'
+    else:
+        result['data']['fileType'] = 'image'
+    result['data']['extractionPath'] = path
+    metrics.increment("invoice_extraction_path_total", path=path)
+    
+    # Résultat de secours non mis en cache: le modèle sera rappelé une fois rétabli
+    if path == 'vision':
+        with timing.stage("cache_store"):
+            await ocr_cache.put(pipeline, digest, result)
+    return result
 
 
 # Fonctions de compatibilité avec l'ancien code
@@ -654,8 +1164,10 @@ async def analyze_document_with_ai(image_base64: str) -> Dict[str, Any]:
     Convertit base64 en bytes et appelle analyze_document
     """
     try:
-        file_bytes = base64.b64decode(image_base64)
-        result = await analyze_document(file_bytes, filename="", file_type="image")
+        with timing.trace("analyze_document"):
+            with timing.stage("base64_decode"):
+                file_bytes = base64.b64decode(image_base64)
+            result = await analyze_document(file_bytes, filename="", file_type="image")
         
         # Adapter la réponse au format attendu par l'ancien endpoint
         if result.get('success'):
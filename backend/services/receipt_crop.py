@@ -0,0 +1,274 @@
+"""
+Receipt auto-crop and deskew, before any OCR (Tesseract or Vision)
+
+Phone photos of receipts are mostly table: the receipt is found as the
+bright paper region of the frame, the frame is rotated so that the
+receipt's outline and text lines are straight, then cropped to the paper
+and returned in grayscale. Analysis runs with NumPy on a downscaled copy
+(WORK_SIZE), then on a copy of the crop alone; only the final crop +
+rotate touch the full-resolution image.
+
+1. Paper mask: Otsu threshold of the grayscale image.
+2. Outline angle: rotation, up to +/-MAX_ROTATION degrees, giving the
+   paper pixels the smallest bounding box (minimum-area rectangle).
+3. Text skew: the angle, within +/-MAX_SKEW degrees, that maximizes the
+   variance of the row profile of dark (ink) pixels. Text lines then fall
+   on as few rows as possible.
+4. Crop: longest run of paper rows / columns, plus a margin. The frame
+   is cropped to the paper's bounding box before rotating, then to the
+   straightened paper.
+
+Frames that are already mostly paper (scans, PDF pages) are deskewed but
+not cropped. If no paper region is found, only the grayscale conversion is
+applied.
+
+Runs inside the OCR worker processes: keep imports light (NumPy, PIL).
+"""
+
+import os
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+# OCR_AUTO_CROP=0: grayscale conversion only (A/B measurements)
+AUTO_CROP_ENABLED = os.getenv("OCR_AUTO_CROP", "1") == "1"
+
+# Long side of the copy used for analysis
+WORK_SIZE = 600
+# Outline rotations searched (larger tilts: sideways photo, left alone)
+MAX_ROTATION = 30.0
+# Residual text skew searched after the outline rotation
+MAX_SKEW = 3.0
+SKEW_STEP = 0.25
+# Paper pixels sampled for the outline search
+OUTLINE_SAMPLE = 20000
+# A frame with more paper than this is already cropped
+MAX_PAPER_SHARE = 0.85
+# Less paper than this: no receipt found
+MIN_PAPER_SHARE = 0.05
+# A row / column belongs to the receipt if it holds this share of the
+# fullest one's paper (low: the corners of a tilted receipt are thin)
+RUN_THRESHOLD = 0.08
+# Margin kept around the paper, as a share of its size
+CROP_MARGIN = 0.02
+# Ink: darker than INK_CONTRAST x the local background (box blur of this radius)
+INK_BLUR_RADIUS = 15
+INK_CONTRAST = 0.8
+# Border of the paper left out of the skew measurement, as a share of its size
+SKEW_INSET = 0.06
+
+
+class ReceiptGeometry:
+    """
+    Where the receipt is in a frame (full-resolution pixel boxes):
+    crop_box in the frame, then a rotation (degrees, counterclockwise) of
+    that crop, then final_box in the rotated crop. None: step skipped.
+    """
+
+    def __init__(self, crop_box: Optional[Tuple[int, int, int, int]], angle: float,
+                 final_box: Optional[Tuple[int, int, int, int]], paper_share: float, fill: int = 255):
+        self.crop_box = crop_box
+        self.angle = angle
+        self.final_box = final_box
+        self.paper_share = paper_share
+        # Gray level for corners uncovered by the rotation
+        self.fill = fill
+
+    def __repr__(self) -> str:
+        return (f"ReceiptGeometry(crop_box={self.crop_box}, angle={self.angle:.2f}, "
+                f"final_box={self.final_box}, paper_share={self.paper_share:.2f})")
+
+
+def _to_gray(image: Image.Image) -> Image.Image:
+    # Phone photos: apply the EXIF orientation before looking at the pixels
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("L")
+
+
+def _small(gray: Image.Image) -> Tuple[np.ndarray, float]:
+    """Downscaled copy as an array, and its scale relative to gray"""
+    scale = min(1.0, WORK_SIZE / max(gray.size))
+    if scale < 1.0:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        # Integer box reduction first (cheap), then the exact size
+        factor = int(1 / scale) // 2
+        small = gray.reduce(factor) if factor > 1 else gray
+        gray = small.resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(gray, dtype=np.uint8), scale
+
+
+def otsu_threshold(pixels: np.ndarray) -> int:
+    """Gray level separating the two classes of a bimodal histogram"""
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    omega = np.cumsum(hist) / pixels.size
+    mu = np.cumsum(hist * np.arange(256)) / pixels.size
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1.0 - omega))
+    # Uniform image: no split, every class boundary is NaN
+    return int(np.argmax(np.nan_to_num(between, nan=-1.0)))
+
+
+def _longest_run(profile: np.ndarray, threshold: float) -> Tuple[int, int]:
+    """[start, end) of the longest run of profile values above threshold x its peak"""
+    above = np.concatenate(([False], profile > threshold * profile.max(), [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    if len(edges) == 0:
+        return 0, 0
+    starts, ends = edges[0::2], edges[1::2]
+    longest = int(np.argmax(ends - starts))
+    return int(starts[longest]), int(ends[longest])
+
+
+def paper_box(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of the main paper region of a mask"""
+    left, right = _longest_run(mask.mean(axis=0), RUN_THRESHOLD)
+    if right <= left:
+        return None
+    top, bottom = _longest_run(mask[:, left:right].mean(axis=1), RUN_THRESHOLD)
+    if bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def _box_area(xs: np.ndarray, ys: np.ndarray, angle: float) -> float:
+    """Area of the axis-aligned box of the points rotated by angle"""
+    theta = math.radians(angle)
+    rx = xs * math.cos(theta) + ys * math.sin(theta)
+    ry = ys * math.cos(theta) - xs * math.sin(theta)
+    return float(np.ptp(rx) * np.ptp(ry))
+
+
+def _outline_angle(mask: np.ndarray) -> float:
+    """Counterclockwise rotation that aligns the paper's outline with the axes"""
+    # Erode first: isolated specks would stretch the box
+    eroded = Image.fromarray((mask * 255).astype(np.uint8)).filter(ImageFilter.MinFilter(5))
+    ys, xs = np.nonzero(np.asarray(eroded))
+    if len(xs) < 100:
+        return 0.0
+    if len(xs) > OUTLINE_SAMPLE:
+        pick = np.random.default_rng(0).choice(len(xs), OUTLINE_SAMPLE, replace=False)
+        xs, ys = xs[pick], ys[pick]
+    xs = xs - xs.mean()
+    ys = ys - ys.mean()
+    # Minimum-area bounding rectangle: coarse search, then around the best angle
+    coarse = min(np.arange(-MAX_ROTATION, MAX_ROTATION + 0.5, 1.0), key=lambda a: _box_area(xs, ys, a))
+    fine = min(np.arange(coarse - 1.0, coarse + 1.0 + SKEW_STEP / 2, SKEW_STEP), key=lambda a: _box_area(xs, ys, a))
+    # y points down: this is also PIL's counterclockwise rotation of the image
+    return float(fine)
+
+
+def ink_mask(small: np.ndarray) -> np.ndarray:
+    """Pixels clearly darker than their surroundings: robust to uneven lighting"""
+    background = Image.fromarray(small).filter(ImageFilter.BoxBlur(INK_BLUR_RADIUS))
+    return small.astype(np.int16) < np.asarray(background, dtype=np.int16) * INK_CONTRAST
+
+
+def _text_skew(small: np.ndarray) -> float:
+    """Residual rotation that puts the ink of the text lines on the fewest rows"""
+    ink = ink_mask(small)
+    if ink.mean() < 0.002:
+        return 0.0
+    ink_image = Image.fromarray((ink * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP):
+        rows = np.asarray(ink_image.rotate(float(angle), Image.Resampling.NEAREST), dtype=np.float64).sum(axis=1)
+        score = float(np.var(rows))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _with_margin(box: Tuple[int, int, int, int], width: int, height: int) -> Tuple[int, int, int, int]:
+    left, top, right, bottom = box
+    margin_x = round((right - left) * CROP_MARGIN)
+    margin_y = round((bottom - top) * CROP_MARGIN)
+    return max(0, left - margin_x), max(0, top - margin_y), min(width, right + margin_x), min(height, bottom + margin_y)
+
+
+def _inset(box: Tuple[int, int, int, int], share: float) -> Tuple[int, int, int, int]:
+    left, top, right, bottom = box
+    dx, dy = round((right - left) * share), round((bottom - top) * share)
+    return left + dx, top + dy, right - dx, bottom - dy
+
+
+def _scaled(box: Tuple[int, int, int, int], scale: float) -> Tuple[int, int, int, int]:
+    left, top, right, bottom = box
+    return math.floor(left / scale), math.floor(top / scale), math.ceil(right / scale), math.ceil(bottom / scale)
+
+
+def detect_receipt(gray: Image.Image) -> ReceiptGeometry:
+    """Crop, rotation and final crop of the receipt in a grayscale frame"""
+    small, scale = _small(gray)
+    threshold = otsu_threshold(small)
+    mask = small > threshold
+    paper_share = float(mask.mean())
+    if paper_share < MIN_PAPER_SHARE:
+        return ReceiptGeometry(None, 0.0, None, paper_share)
+
+    if paper_share > MAX_PAPER_SHARE:
+        # Scan or PDF page: nothing to crop, straighten the text only
+        return ReceiptGeometry(None, _text_skew(small), None, paper_share)
+
+    box = paper_box(mask)
+    if box is None:
+        return ReceiptGeometry(None, 0.0, None, paper_share)
+    left, top, right, bottom = _with_margin(box, small.shape[1], small.shape[0])
+    angle = _outline_angle(mask[top:bottom, left:right])
+    crop_box = _scaled((left, top, right, bottom), scale)
+
+    # Second working copy of the crop only: the receipt itself gets WORK_SIZE pixels
+    detail, detail_scale = _small(gray.crop(crop_box))
+    background = int(np.median(small[~mask]))
+
+    def rotated(by: float) -> np.ndarray:
+        # Uncovered corners filled with background, not paper
+        return np.asarray(Image.fromarray(detail).rotate(by, Image.Resampling.BILINEAR, expand=True,
+                                                         fillcolor=background), dtype=np.uint8)
+
+    straight = rotated(angle)
+    straight_box = paper_box(straight > threshold)
+    if straight_box is None:
+        return ReceiptGeometry(crop_box, angle, None, paper_share, background)
+
+    # Inside of the paper only: its edges against the table would read as ink
+    s_left, s_top, s_right, s_bottom = _inset(straight_box, SKEW_INSET)
+    skew = _text_skew(straight[s_top:s_bottom, s_left:s_right])
+    if skew:
+        angle += skew
+        straight = rotated(angle)
+        straight_box = paper_box(straight > threshold) or straight_box
+
+    final_box = _with_margin(straight_box, straight.shape[1], straight.shape[0])
+    return ReceiptGeometry(crop_box, angle, _scaled(final_box, detail_scale), paper_share, background)
+
+
+def crop_receipt(image: Image.Image, max_size: Optional[int] = None) -> Image.Image:
+    """
+    Grayscale, deskewed image cropped to the receipt (see module docstring)
+    max_size: long side of the crop before rotation; later stages downscale anyway
+    """
+    gray = _to_gray(image)
+    if not AUTO_CROP_ENABLED:
+        return gray
+    geometry = detect_receipt(gray)
+    if geometry.crop_box is not None:
+        gray = gray.crop(geometry.crop_box)
+
+    factor = 1.0
+    if max_size and max(gray.size) > max_size:
+        factor = max_size / max(gray.size)
+        size = (max(1, round(gray.width * factor)), max(1, round(gray.height * factor)))
+        gray = gray.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    if abs(geometry.angle) >= SKEW_STEP / 2:
+        gray = gray.rotate(geometry.angle, Image.Resampling.BILINEAR, expand=True, fillcolor=geometry.fill)
+    if geometry.final_box is not None:
+        left, top, right, bottom = (round(v * factor) for v in geometry.final_box)
+        gray = gray.crop((left, top, min(gray.width, right), min(gray.height, bottom)))
+    return gray
@@ -0,0 +1,209 @@
+"""
+Single-pass receipt field extractor for /api/ocr/analyze-receipt
+
+The OCR text is lowercased once and scanned once with one compiled
+tokenizer: dates, money amounts, total keywords and category keywords are
+alternatives of the same pattern (keyword lists compiled as tries), so each
+token is classified as it is found instead of rescanning the text per field
+and per pattern.
+
+Rules:
+- amount: largest money token (d+[.,]dd) in 0.01..100000 that has 2+
+  integer digits, a $ next to it, or a total keyword before it: the
+  first amount after total, ttc, tva incluse or net on the same line, or
+  an amount right after total, montant, solde, somme or net à payer
+- date: first DD/MM/YYYY with a valid month, else first YYYY-MM-DD, else
+  first "DD month YYYY", else first "DD mon. YYYY"; returned as DD/MM/YYYY
+- merchant: first of the first 5 non-empty lines that is not only
+  digits/separators, has no header word and is 3..50 characters
+- category: travel if any travel keyword appears, else medical, else invoices
+
+These are the rules of the previous per-field regexes, with one
+difference: tokens do not overlap. Each regex used to rescan the whole
+text, so it could match inside text another field had already read: a
+date reusing the digits of an amount or of another date ("154,56 mai
+2028" gave 56/05/2028, "2012/05/2024" gave 12/05/2024), an amount
+starting inside a longer number ("1,234.56" gave 234.56), a keyword
+starting inside another ("netrain" was travel). Here a character belongs
+to the token it starts with, so these give no date / 20/05/2012, no
+amount and invoices. On the sample corpus (scripts/data) both give the
+same results; tests/test_receipt_extractor.py compares them.
+"""
+
+import re
+from typing import Optional, Dict, Any
+
+MIN_AMOUNT = 0.01
+MAX_AMOUNT = 100000
+
+MONTHS = {
+    'janvier': '01', 'février': '02', 'mars': '03', 'avril': '04',
+    'mai': '05', 'juin': '06', 'juillet': '07', 'août': '08',
+    'septembre': '09', 'octobre': '10', 'novembre': '11', 'décembre': '12',
+}
+
+MONTH_ABBREVIATIONS = {
+    'jan': '01', 'fev': '02', 'fév': '02', 'mar': '03', 'avr': '04', 'mai': '05',
+    'jun': '06', 'jui': '07', 'juil': '07', 'aou': '08', 'aoû': '08',
+    'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12', 'déc': '12',
+}
+
+CATEGORY_KEYWORDS = {
+    'travel': [
+        'avion', 'flight', 'airline', 'train', 'sncf', 'hotel', 'hôtel',
+        'taxi', 'uber', 'lyft', 'péage', 'carburant', 'essence', 'parking',
+        'aeroport', 'aéroport', 'airport', 'baggage', 'voyage', 'air france',
+        'booking', 'expedia', 'airbnb',
+    ],
+    'medical': [
+        'pharmacie', 'pharmacy', 'médecin', 'doctor', 'clinique', 'clinic',
+        'hôpital', 'hospital', 'kiné', 'physio', 'dentiste', 'dentist',
+        'ordonnance', 'prescription', 'laboratoire', 'analyse', 'santé',
+    ],
+}
+# Checked in this order; the first category with a keyword wins
+CATEGORY_PRIORITY = ['travel', 'medical']
+DEFAULT_CATEGORY = 'invoices'
+
+MERCHANT_SKIP_WORDS = ['facture', 'reçu', 'ticket', 'date', 'heure', 'www.', 'http']
+MERCHANT_MAX_LINES = 5
+
+
+def _keyword_trie(words) -> str:
+    """
+    Regex for a set of literal keywords, factored as a trie (a(?:ir(?:bnb|port)|vion)|...)
+    so the scanner tries at most one branch per character instead of every keyword
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        branches = [re.escape(ch).replace(r'\ ', ' ') + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ends here but longer ones continue
+        return '(?:' + body + ')?' if '' in node else body
+
+    return emit(trie)
+
+
+_KEYWORD_CATEGORY = {
+    keyword: category
+    for category in reversed(CATEGORY_PRIORITY)
+    for keyword in CATEGORY_KEYWORDS[category]
+}
+
+# One tokenizer for all fields. Dates come before money so "12/05/2024" is
+# never split into numbers; numeric tokens are only tried where a digit or $
+# starts; the rest of the text is skipped by the scanner.
+_TOKENIZER = re.compile(
+    r'(?=[\d$])(?:'
+    r'(?P<dmy>(?P<dmy_d>\d{1,2})[/\-](?P<dmy_m>\d{1,2})[/\-](?P<dmy_y>20\d{2}))'
+    r'|(?P<ymd>(?P<ymd_y>20\d{2})[/\-](?P<ymd_m>\d{1,2})[/\-](?P<ymd_d>\d{1,2}))'
+    r'|(?P<dmonth>(?P<dmonth_d>\d{1,2})\s+(?P<dmonth_m>' + _keyword_trie(MONTHS) + r')\s+(?P<dmonth_y>20\d{2}))'
+    r'|(?P<dmon>(?P<dmon_d>\d{1,2})\s+(?P<dmon_m>' + _keyword_trie(MONTH_ABBREVIATIONS) + r')\.?\s+(?P<dmon_y>20\d{2}))'
+    r'|(?P<dollar>\$\s*)?(?P<money>(?P<money_int>\d+)[.,]\d{2}))'
+    r'|(?P<total>t(?:otal|tc|va\s*incluse)|montant|so(?:lde|mme)|net(?P<payer>\s*[àa]\s*payer)?)'
+    r'|(?P<keyword>' + _keyword_trie(_KEYWORD_CATEGORY) + r')'
+)
+_DOLLAR_AFTER = re.compile(r'\s*\$')
+_TOTAL_GAP = re.compile(r'\s*[:=]?\s*\$?\s*')
+_NON_EMPTY_LINE = re.compile(r'[^\n]*\S[^\n]*')
+_NUMERIC_LINE = re.compile(r'^[\d\s\-/\.]+$')
+_MERCHANT_SKIP = re.compile(_keyword_trie(MERCHANT_SKIP_WORDS))
+
+# Total keywords that qualify any amount later on their line / right after them
+_LINE_TOTALS = ('total', 'ttc', 'tva', 'net')
+_ADJACENT_TOTALS = ('total', 'montant', 'solde', 'somme')
+
+# Date kinds by priority
+_DATE_KINDS = ('dmy', 'ymd', 'dmonth', 'dmon')
+
+
+def _format_date(kind: str, m: re.Match) -> Optional[str]:
+    if kind == 'dmy':
+        month = m.group('dmy_m').zfill(2)
+        if int(month) > 12:
+            return None
+        return f"{m.group('dmy_d').zfill(2)}/{month}/{m.group('dmy_y')}"
+    if kind == 'ymd':
+        return f"{m.group('ymd_d').zfill(2)}/{m.group('ymd_m').zfill(2)}/{m.group('ymd_y')}"
+    if kind == 'dmonth':
+        return f"{m.group('dmonth_d').zfill(2)}/{MONTHS[m.group('dmonth_m')]}/{m.group('dmonth_y')}"
+    return f"{m.group('dmon_d').zfill(2)}/{MONTH_ABBREVIATIONS[m.group('dmon_m')]}/{m.group('dmon_y')}"
+
+
+def extract_merchant(text: str) -> Optional[str]:
+    """Merchant name from the first non-empty lines"""
+    for i, match in enumerate(_NON_EMPTY_LINE.finditer(text)):
+        if i >= MERCHANT_MAX_LINES:
+            break
+        line = match.group().strip()
+        # Skip lines that are just numbers, dates, or common header text
+        if _NUMERIC_LINE.match(line) or _MERCHANT_SKIP.search(line.lower()):
+            continue
+        if 3 <= len(line) <= 50:
+            return line.title()
+    return None
+
+
+def extract_receipt_fields(text: str) -> Dict[str, Any]:
+    """Amount, date, merchant and category of a receipt's OCR text in one scan"""
+    lower = text.lower()
+    best_amount: Optional[float] = None
+    first_dates: Dict[str, re.Match] = {}
+    categories = set()
+    line_total_at = -1      # position of the "total on this line" keyword waiting for its amount
+    adjacent_total_end = -1  # end of the last "total right before" keyword
+
+    for m in _TOKENIZER.finditer(lower):
+        kind = m.lastgroup
+        if kind == 'money':
+            start = m.start('money')
+            qualifies = (
+                len(m.group('money_int')) >= 2
+                or m.group('dollar') is not None
+                or _DOLLAR_AFTER.match(lower, m.end()) is not None
+                or (line_total_at >= 0 and lower.rfind('\n', 0, start) < line_total_at)
+                or (adjacent_total_end >= 0 and _TOTAL_GAP.fullmatch(lower, adjacent_total_end, start) is not None)
+            )
+            # A line keyword only qualifies the first amount after it
+            line_total_at = -1
+            if qualifies:
+                amount = float(m.group('money').replace(',', '.'))
+                if MIN_AMOUNT <= amount <= MAX_AMOUNT and (best_amount is None or amount > best_amount):
+                    best_amount = amount
+        elif kind == 'total':
+            word = m.group('total')
+            if word.startswith(_LINE_TOTALS):
+                line_total_at = m.start()
+            if word.startswith(_ADJACENT_TOTALS) or m.group('payer'):
+                adjacent_total_end = m.end()
+        elif kind == 'keyword':
+            categories.add(_KEYWORD_CATEGORY[m.group('keyword')])
+        elif kind not in first_dates:
+            # Only the first date of each kind is considered
+            first_dates[kind] = m
+
+    date = None
+    for kind in _DATE_KINDS:
+        if kind in first_dates:
+            date = _format_date(kind, first_dates[kind])
+            # An invalid DD/MM/YYYY falls through to the next kind
+            if date:
+                break
+
+    category = next((c for c in CATEGORY_PRIORITY if c in categories), DEFAULT_CATEGORY)
+
+    return {
+        "amount": best_amount,
+        "date": date,
+        "merchant": extract_merchant(text),
+        "category": category,
+    }
+
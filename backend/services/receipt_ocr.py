@@ -0,0 +1,192 @@
+"""
+CPU-bound receipt OCR pipeline for /api/ocr/analyze-receipt, run in a
+bounded ProcessPoolExecutor so image decoding, PDF rasterization, resizing
+and Tesseract never block the event loop.
+
+run_receipt_ocr executes inside the worker processes: keep this module's
+imports light (no app / database imports).
+"""
+
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Union
+
+import pytesseract
+from PIL import Image
+
+from services import metrics, timing
+from services.receipt_crop import crop_receipt
+
+logger = logging.getLogger(__name__)
+
+OCR_POOL_WORKERS = int(os.getenv("OCR_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs admitted at once (running + waiting); beyond that requests are rejected
+OCR_POOL_MAX_QUEUE = int(os.getenv("OCR_POOL_MAX_QUEUE", str(OCR_POOL_WORKERS * 4)))
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "60"))
+MAX_IMAGE_SIZE = 2000
+
+# Bump when decoding/resizing/Tesseract settings change (invalidates cached OCR text)
+PIPELINE_VERSION = "receipt-tesseract-2"
+
+
+def _read_head(source: Union[bytes, str], size: int = 4) -> bytes:
+    if isinstance(source, bytes):
+        return source[:size]
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def run_receipt_ocr(source: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Decode (image or first PDF page), crop, deskew, normalize and OCR a receipt given as
+    bytes or as the path of an uploaded file (opened directly by PIL / pdf2image).
+    Returns {"text", "error", "timings", "started_at"}; runs in a worker process.
+    """
+    started_at = time.time()
+    timings: Dict[str, float] = {}
+    result: Dict[str, Any] = {"text": None, "error": None, "timings": timings, "started_at": started_at}
+
+    stage_start = time.perf_counter()
+    try:
+        is_pdf = _read_head(source) == b'%PDF'
+    except OSError as e:
+        result["error"] = f"Failed to open image: {str(e)}"
+        return result
+
+    if is_pdf:
+        # Handle PDF - convert first page to image
+        try:
+            from pdf2image import convert_from_bytes, convert_from_path
+            if isinstance(source, bytes):
+                pages = convert_from_bytes(source, dpi=150, first_page=1, last_page=1)
+            else:
+                pages = convert_from_path(source, dpi=150, first_page=1, last_page=1)
+            if not pages:
+                result["error"] = "Could not convert PDF to image"
+                return result
+            image = pages[0]
+        except Exception as e:
+            result["error"] = f"Failed to process PDF: {str(e)}"
+            return result
+        timings["rasterize"] = time.perf_counter() - stage_start
+    else:
+        # Handle image
+        try:
+            image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+            image.load()
+        except Exception as e:
+            result["error"] = f"Failed to open image: {str(e)}"
+            return result
+        timings["decode"] = time.perf_counter() - stage_start
+
+    # Crop to the receipt, straighten it and convert to grayscale
+    stage_start = time.perf_counter()
+    image = crop_receipt(image, max_size=MAX_IMAGE_SIZE)
+    timings["crop"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    # Resize if too large
+    if max(image.size) > MAX_IMAGE_SIZE:
+        ratio = MAX_IMAGE_SIZE / max(image.size)
+        new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    timings["resize"] = time.perf_counter() - stage_start
+
+    # Run Tesseract OCR with French language
+    stage_start = time.perf_counter()
+    try:
+        result["text"] = pytesseract.image_to_string(image, lang='fra+eng')
+    except Exception:
+        # Fallback to English only
+        result["text"] = pytesseract.image_to_string(image, lang='eng')
+    timings["tesseract"] = time.perf_counter() - stage_start
+
+    return result
+
+
+class OCRPoolBusy(Exception):
+    """Raised when the OCR queue is full"""
+
+
+class ReceiptOCRPool:
+    """Bounded process pool running run_receipt_ocr"""
+
+    def __init__(self, workers: int = OCR_POOL_WORKERS, max_queue: int = OCR_POOL_MAX_QUEUE,
+                 timeout: float = OCR_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._depth = 0
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def start(self):
+        if self._executor is None:
+            # spawn: never fork a process that holds event-loop and driver threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._depth -= 1
+            metrics.set_gauge("receipt_ocr_queue_depth", self._depth)
+
+    def _submit(self, source: Union[bytes, str]):
+        self.start()
+        try:
+            return self._executor.submit(run_receipt_ocr, source)
+        except BrokenProcessPool:
+            # A worker died: replace the pool and retry once
+            self.shutdown()
+            self.start()
+            return self._executor.submit(run_receipt_ocr, source)
+
+    async def run(self, source: Union[bytes, str]) -> Dict[str, Any]:
+        """Run the pipeline off the event loop; raises OCRPoolBusy or asyncio.TimeoutError"""
+        with self._lock:
+            if self._depth >= self.max_queue:
+                metrics.increment("receipt_ocr_rejected_total")
+                raise OCRPoolBusy(f"OCR queue full ({self._depth} jobs)")
+            self._depth += 1
+            metrics.set_gauge("receipt_ocr_queue_depth", self._depth)
+
+        submitted_at = time.time()
+        try:
+            future = self._submit(source)
+        except Exception:
+            self._release()
+            raise
+        # The slot is freed when the worker finishes, even if we stopped waiting
+        future.add_done_callback(self._release)
+
+        result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+
+        queue_wait = max(0.0, result["started_at"] - submitted_at)
+        metrics.observe("receipt_ocr_stage_seconds", queue_wait, stage="queue_wait")
+        timing.record("ocr.queue_wait", queue_wait)
+        for stage, seconds in result["timings"].items():
+            metrics.observe("receipt_ocr_stage_seconds", seconds, stage=stage)
+            # Stages of the worker process, in the caller's trace (services/timing.py)
+            timing.record(f"ocr.{stage}", seconds)
+        return result
+
+
+receipt_ocr_pool = ReceiptOCRPool()
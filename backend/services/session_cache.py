@@ -0,0 +1,87 @@
+"""
+In-process session cache for get_current_user
+Bounded LRU keyed by session token; entries expire after a TTL and never
+outlive the session's own expires_at.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Set
+
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+
+
+class SessionCache:
+    """LRU + TTL cache: session_token -> user document"""
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES, ttl_seconds: float = SESSION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # token -> (deadline (monotonic), user_doc)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_id -> tokens, so a role change can drop every session of a user
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the cached user document, or None on miss/expiry"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        deadline, user_doc = entry
+        if deadline <= time.monotonic():
+            self.invalidate(token)
+            return None
+        self._entries.move_to_end(token)
+        return user_doc
+
+    def put(self, token: str, user_doc: Dict[str, Any], expires_at: Optional[datetime] = None):
+        """Cache a user document for a token, bounded by the session's expires_at"""
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds
+        if expires_at is not None:
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            ttl = min(ttl, (expires_at - datetime.now(timezone.utc)).total_seconds())
+        if ttl <= 0:
+            return
+
+        self.invalidate(token)
+        self._entries[token] = (time.monotonic() + ttl, user_doc)
+        user_id = user_doc.get("user_id")
+        if user_id:
+            self._tokens_by_user.setdefault(user_id, set()).add(token)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self.invalidate(oldest)
+
+    def invalidate(self, token: str):
+        """Drop a single session"""
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].get("user_id")
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached session belonging to a user"""
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self.invalidate(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+
+session_cache = SessionCache()
@@ -0,0 +1,193 @@
+"""
+Stateless signed session tokens (HMAC-SHA256)
+
+Format: cc1.<base64url(json claims)>.<base64url(signature)>
+Claims: uid, email, name, pic, role, pid (player_id), iat, exp, jti
+
+Validation is CPU-only. Revocations (logout, role changes) are written to the
+`revoked_sessions` collection and mirrored in an in-memory RevocationList
+that every worker keeps in sync with a periodic incremental poll.
+"""
+
+import os
+import hmac
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any
+
+from services.indexes import IndexSpec
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = "cc1."
+# "opaque" (session_<random> looked up in user_sessions) or "signed"
+SESSION_TOKEN_FORMAT = os.getenv("SESSION_TOKEN_FORMAT", "opaque")
+SESSION_TOKEN_SECRET = os.getenv("SESSION_TOKEN_SECRET", "")
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# Longest lifetime of an issued token; user-level revocations are kept this long
+MAX_TOKEN_LIFETIME = timedelta(days=7)
+
+INDEXES = [
+    IndexSpec("revoked_sessions", ["revoked_at"]),
+    IndexSpec("revoked_sessions", ["expires_at"], expire_after_seconds=0),
+]
+
+
+def signing_configured() -> bool:
+    """Signed tokens can be verified (a secret is set)"""
+    return bool(SESSION_TOKEN_SECRET)
+
+
+def signed_tokens_enabled() -> bool:
+    """New sessions are issued as signed tokens"""
+    return SESSION_TOKEN_FORMAT == "signed" and signing_configured()
+
+
+def is_signed_token(token: str) -> bool:
+    return token.startswith(TOKEN_PREFIX)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(SESSION_TOKEN_SECRET.encode(), payload.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def issue_token(user_doc: Dict[str, Any], expires_at: datetime) -> str:
+    """Create a signed token for a user document"""
+    claims = {
+        "uid": user_doc["user_id"],
+        "email": user_doc.get("email"),
+        "name": user_doc.get("name"),
+        "pic": user_doc.get("picture"),
+        "role": user_doc.get("role", "player"),
+        "pid": user_doc.get("player_id"),
+        "iat": time.time(),
+        "exp": int(expires_at.timestamp()),
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{TOKEN_PREFIX}{payload}.{_sign(TOKEN_PREFIX + payload)}"
+
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """Return the claims of a valid, unexpired token, or None"""
+    if not signing_configured() or not is_signed_token(token):
+        return None
+    try:
+        payload, signature = token[len(TOKEN_PREFIX):].split(".")
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(TOKEN_PREFIX + payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, json.JSONDecodeError):
+        return None
+    if claims.get("exp", 0) <= time.time():
+        return None
+    return claims
+
+
+class RevocationList:
+    """In-memory mirror of revoked_sessions"""
+
+    def __init__(self):
+        self._jtis: Dict[str, float] = {}  # jti -> token exp
+        self._not_before: Dict[str, float] = {}  # user_id -> tokens issued before are revoked
+        self.last_sync: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._not_before)
+
+    def add_jti(self, jti: str, exp: float):
+        self._jtis[jti] = exp
+
+    def add_user(self, user_id: str, not_before: float):
+        self._not_before[user_id] = max(not_before, self._not_before.get(user_id, 0))
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        if claims.get("jti") in self._jtis:
+            return True
+        not_before = self._not_before.get(claims.get("uid"))
+        return not_before is not None and claims.get("iat", 0) < not_before
+
+    def prune(self):
+        now = time.time()
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        horizon = now - MAX_TOKEN_LIFETIME.total_seconds()
+        self._not_before = {uid: nb for uid, nb in self._not_before.items() if nb > horizon}
+
+    def apply(self, doc: Dict[str, Any]):
+        if doc.get("jti"):
+            self.add_jti(doc["jti"], doc["exp"])
+        elif doc.get("user_id"):
+            self.add_user(doc["user_id"], doc["not_before"])
+
+
+revocations = RevocationList()
+
+
+async def revoke_token(db, claims: Dict[str, Any]):
+    """Revoke a single token (logout)"""
+    now = datetime.now(timezone.utc)
+    revocations.add_jti(claims["jti"], claims["exp"])
+    await db.revoked_sessions.insert_one({
+        "jti": claims["jti"],
+        "exp": claims["exp"],
+        "revoked_at": now,
+        "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc),
+    })
+
+
+async def revoke_user(db, user_id: str):
+    """Revoke every token issued so far to a user (role or team change)"""
+    if not signing_configured():
+        return
+    now = datetime.now(timezone.utc)
+    not_before = time.time()
+    revocations.add_user(user_id, not_before)
+    await db.revoked_sessions.insert_one({
+        "user_id": user_id,
+        "not_before": not_before,
+        "revoked_at": now,
+        "expires_at": now + MAX_TOKEN_LIFETIME,
+    })
+
+
+async def sync_revocations(db):
+    """Pull revocations written since the last sync (by any worker)"""
+    query = {"expires_at": {"$gt": datetime.now(timezone.utc)}}
+    if revocations.last_sync is not None:
+        # Small overlap so writes racing the previous poll are not missed
+        query["revoked_at"] = {"$gte": revocations.last_sync - timedelta(seconds=1)}
+    started = datetime.now(timezone.utc)
+    async for doc in db.revoked_sessions.find(query, {"_id": 0}):
+        revocations.apply(doc)
+    revocations.last_sync = started
+    revocations.prune()
+
+
+async def run_revocation_sync(db):
+    """Background loop started from the app lifespan"""
+    while True:
+        try:
+            await sync_revocations(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Revocation sync failed: {e}")
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
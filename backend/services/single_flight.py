@@ -0,0 +1,36 @@
+"""
+Single-flight call coalescing
+
+Concurrent callers asking for the same key share one in-flight call and its
+result (or exception). The call runs in its own task, so a caller that is
+cancelled (client disconnect) does not cancel the work the others wait on.
+Coalescing is per process; nothing is cached once the call completes.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from services import metrics
+
+
+class SingleFlight:
+    """Group of coalesced calls, e.g. one per upstream"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per key among concurrent callers"""
+        task = self._calls.get(key)
+        if task is None:
+            metrics.increment("single_flight_calls_total", group=self.name, result="leader")
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            metrics.increment("single_flight_calls_total", group=self.name, result="shared")
+        return await asyncio.shield(task)
@@ -0,0 +1,109 @@
+"""
+Per-stage timing of the document analysis pipelines (analyze_document,
+/api/ocr/analyze-receipt)
+
+    with timing.trace("analyze_document") as trace:
+        with timing.stage("quality_gate"):
+            ...
+        trace.outcome = "vision"
+
+The active trace lives in a context variable: helpers called below it, and
+asyncio.to_thread workers (the context is copied), open stages without an
+extra argument; outside a trace stage() costs two clock reads. A nested
+trace() of the same pipeline joins the active one, so a caller can time
+its own stages (base64 decode) in the same trace. Stages may repeat (their
+durations add up) and nest; nested stage names are dotted ("ocr.tesseract"
+inside "local_ocr").
+
+When the outermost trace ends, each stage is observed in
+pipeline_stage_seconds{pipeline, stage} and the whole run in
+pipeline_seconds{pipeline, outcome}. trace.to_dict() is the optional
+"timings" debug field of the API responses (?debug=true).
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from services import metrics
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("pipeline_trace", default=None)
+
+
+class Trace:
+    """Stage durations of one pipeline run"""
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.outcome: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.seconds: Optional[float] = None
+
+    def add(self, stage: str, seconds: float):
+        # dict updates are atomic under the GIL: stages may end in worker threads
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        for stage, seconds in self.stages.items():
+            metrics.observe("pipeline_stage_seconds", seconds, pipeline=self.pipeline, stage=stage)
+        metrics.observe("pipeline_seconds", self.seconds, pipeline=self.pipeline, outcome=self.outcome or "unknown")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Durations in milliseconds (total so far if the trace is still running)"""
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        return {
+            "pipeline": self.pipeline,
+            "outcome": self.outcome,
+            "totalMs": round(seconds * 1000, 1),
+            "stagesMs": {stage: round(value * 1000, 1) for stage, value in self.stages.items()},
+        }
+
+    def __repr__(self) -> str:
+        stages = ", ".join(f"{stage}={value * 1000:.0f}ms" for stage, value in self.stages.items())
+        return f"<Trace {self.pipeline} {self.outcome}: {stages}>"
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace(pipeline: str) -> Iterator[Trace]:
+    """Trace one run of `pipeline`; joins the active trace of the same pipeline"""
+    active = _current.get()
+    if active is not None and active.pipeline == pipeline:
+        yield active
+        return
+
+    run = Trace(pipeline)
+    token = _current.set(run)
+    try:
+        yield run
+    except BaseException:
+        run.outcome = run.outcome or "error"
+        raise
+    finally:
+        _current.reset(token)
+        run.finish()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the active trace (no-op outside a trace)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        active = _current.get()
+        if active is not None:
+            active.add(name, time.perf_counter() - started)
+
+
+def record(name: str, seconds: float):
+    """Add a stage measured elsewhere (receipt OCR worker process)"""
+    active = _current.get()
+    if active is not None:
+        active.add(name, seconds)
@@ -0,0 +1,176 @@
+"""
+Streaming binary uploads with a size cap
+
+The request body (a multipart "file" field or a raw image/PDF body) is read
+chunk by chunk into a SpooledUpload: kept in memory up to
+UPLOAD_SPOOL_MEMORY_BYTES, then written to a named temporary file that
+decoders (PIL, pdf2image, OCR worker processes) open by path. The size cap
+is enforced while streaming, so an oversized upload is rejected as soon as
+it crosses the limit instead of being buffered first.
+"""
+
+import os
+import tempfile
+from typing import Optional, Union, Dict
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+
+
+class UploadError(Exception):
+    """Malformed upload (bad multipart body, missing file field)"""
+
+
+class UploadTooLarge(UploadError):
+    """Upload exceeded its size cap"""
+
+
+class SpooledUpload:
+    """Upload body in memory up to a threshold, then in a named temporary file"""
+
+    def __init__(self, max_bytes: int, memory_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.memory_bytes = UPLOAD_SPOOL_MEMORY_BYTES if memory_bytes is None else memory_bytes
+        self.size = 0
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._buffer = bytearray()
+        self._file = None
+
+    @property
+    def path(self) -> Optional[str]:
+        """Path of the temporary file, None while the upload is in memory"""
+        return self._file.name if self._file is not None else None
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        if self._file is None and self.size > self.memory_bytes:
+            self._file = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer += data
+
+    def source(self) -> Union[bytes, str]:
+        """The bytes if still in memory, else the path of the flushed temporary file"""
+        if self._file is None:
+            return bytes(self._buffer)
+        self._file.flush()
+        return self._file.name
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except OSError:
+                pass
+            self._file = None
+        self._buffer = bytearray()
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _MultipartFieldWriter:
+    """Streaming multipart parser that writes the data of one field into an upload"""
+
+    def __init__(self, upload: SpooledUpload, boundary: bytes, field: str):
+        self.upload = upload
+        self.field = field
+        self.found = False
+        self._target = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+        })
+
+    def write(self, chunk: bytes):
+        try:
+            self._parser.write(chunk)
+        except UploadError:
+            raise
+        except Exception as e:
+            raise UploadError(f"Malformed multipart body: {e}")
+
+    def finalize(self):
+        self._parser.finalize()
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._target = False
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Only the first part with the expected name is kept
+        if self.found or params.get(b"name", b"").decode("latin-1") != self.field:
+            return
+        self._target = self.found = True
+        filename = params.get(b"filename")
+        self.upload.filename = filename.decode("utf-8", "replace") if filename else None
+        content_type = self._headers.get(b"content-type")
+        self.upload.content_type = content_type.decode("latin-1") if content_type else None
+
+    def _on_part_data(self, data, start, end):
+        if self._target:
+            self.upload.write(data[start:end])
+
+
+async def receive_upload(request: Request, max_bytes: int, field: str = "file") -> SpooledUpload:
+    """
+    Stream a multipart/form-data field, or the raw body for any other content
+    type, into a SpooledUpload. Raises UploadTooLarge past max_bytes and
+    UploadError for a malformed body. The caller closes the upload.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    upload = SpooledUpload(max_bytes)
+    try:
+        if content_type == b"multipart/form-data":
+            boundary = params.get(b"boundary")
+            if not boundary:
+                raise UploadError("Missing multipart boundary")
+            writer = _MultipartFieldWriter(upload, boundary, field)
+            async for chunk in request.stream():
+                writer.write(chunk)
+            writer.finalize()
+            if not writer.found:
+                raise UploadError(f"Missing '{field}' file field")
+        else:
+            # Raw body: refuse early when the declared length is already over the cap
+            declared = request.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            upload.content_type = content_type.decode("latin-1") or None
+            async for chunk in request.stream():
+                upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    return upload
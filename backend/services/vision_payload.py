@@ -0,0 +1,163 @@
+"""
+Image payload encoding for the GPT-4o Vision call
+
+The model never sees more than a 2048px box with a 768px short side (high
+detail images are downscaled to that upstream), so larger images are
+resized here first instead of being uploaded and thrown away. Small images
+are not upscaled.
+
+The format follows the content: a near-grayscale, mostly ink-on-paper page
+(rendered PDF, scan) is sent as grayscale PNG, which keeps text edges
+sharp; photos are sent as JPEG (or WebP when VISION_PAYLOAD_WEBP=1), in
+grayscale when they carry no color. Qualities then resolutions are stepped
+down until the encoded image fits VISION_PAYLOAD_MAX_BYTES; the smallest
+candidate is used if none fits.
+
+CPU-bound: call from a thread (asyncio.to_thread), not on the event loop.
+"""
+
+import io
+import os
+import time
+import base64
+import logging
+from typing import Optional, Tuple, List
+
+import numpy as np
+from PIL import Image
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+VISION_MAX_LONG_SIDE = int(os.getenv("VISION_MAX_LONG_SIDE", "2048"))
+VISION_MAX_SHORT_SIDE = int(os.getenv("VISION_MAX_SHORT_SIDE", "768"))
+VISION_PAYLOAD_MAX_BYTES = int(os.getenv("VISION_PAYLOAD_MAX_BYTES", str(300 * 1024)))
+VISION_PAYLOAD_WEBP = os.getenv("VISION_PAYLOAD_WEBP", "0") == "1"
+
+JPEG_QUALITIES = (85, 70, 55)
+WEBP_QUALITY = 80
+# Resolution steps tried when no format/quality fits the budget
+DOWNSCALE_STEPS = (1.0, 0.8, 0.64, 0.5)
+
+# Tone analysis samples about this many pixels along the long side
+ANALYSIS_SIZE = 256
+# Channel spread (max - min) above which a pixel counts as colored
+COLOR_SPREAD = 40
+# Share of colored pixels still treated as grayscale (stamps, colored logos)
+MAX_COLORED_SHARE = 0.01
+# Share of pixels that must be paper (light) or ink (dark) for a document
+DOCUMENT_SHARE = 0.9
+PAPER_LEVEL = 200
+INK_LEVEL = 80
+
+PAYLOAD_BYTES_BUCKETS = (25_000, 50_000, 100_000, 200_000, 300_000, 500_000, 1_000_000, 2_000_000, 5_000_000)
+
+
+class VisionPayload:
+    """One encoded image ready to be sent to the model"""
+
+    def __init__(self, data: bytes, format: str, quality: Optional[int], size: Tuple[int, int],
+                 grayscale: bool, encode_seconds: float):
+        self.data = data
+        self.format = format
+        self.quality = quality
+        self.size = size
+        self.grayscale = grayscale
+        self.encode_seconds = encode_seconds
+
+    def __repr__(self) -> str:
+        quality = f" q{self.quality}" if self.quality else ""
+        return f"VisionPayload({self.format}{quality} {self.size[0]}x{self.size[1]} {len(self.data)} bytes)"
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format.lower()}"
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
+
+
+def fit_vision_resolution(image: Image.Image) -> Image.Image:
+    """Downscale to the resolution the model actually uses (never upscales)"""
+    width, height = image.size
+    scale = min(1.0, VISION_MAX_LONG_SIDE / max(width, height), VISION_MAX_SHORT_SIDE / min(width, height))
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # reducing_gap: box-reduce first, LANCZOS on the last step (much faster on large photos)
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def analyze_tones(image: Image.Image) -> Tuple[bool, bool]:
+    """(grayscale, document): no meaningful color; mostly paper and ink"""
+    pixels = np.asarray(image.convert("RGB"), dtype=np.int16)
+    # Strided sample, not a thumbnail: averaging would turn noise gray and text strokes mid-tone
+    step = max(1, max(pixels.shape[:2]) // ANALYSIS_SIZE)
+    pixels = pixels[::step, ::step]
+
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    grayscale = float(np.mean(spread > COLOR_SPREAD)) <= MAX_COLORED_SHARE
+
+    # ITU-R 601 luma, as PIL's convert("L")
+    luma = pixels @ np.array([299, 587, 114]) // 1000
+    document = float(np.mean((luma >= PAPER_LEVEL) | (luma <= INK_LEVEL))) >= DOCUMENT_SHARE
+    return grayscale, document
+
+
+def _candidates(grayscale: bool, document: bool) -> List[Tuple[str, Optional[int]]]:
+    """(format, quality) in order of preference"""
+    lossy = [("JPEG", quality) for quality in JPEG_QUALITIES]
+    if VISION_PAYLOAD_WEBP:
+        lossy.insert(0, ("WEBP", WEBP_QUALITY))
+    if grayscale and document:
+        return [("PNG", None)] + lossy
+    return lossy
+
+
+def encode(image: Image.Image, format: str, quality: Optional[int] = None) -> bytes:
+    buffer = io.BytesIO()
+    if format == "JPEG":
+        image.save(buffer, format="JPEG", quality=quality)
+    elif format == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        # zlib level 6, no optimize pass: optimize costs several encodes for a few percent
+        image.save(buffer, format="PNG", compress_level=6)
+    return buffer.getvalue()
+
+
+def _record(payload: VisionPayload) -> VisionPayload:
+    metrics.observe("vision_payload_bytes", len(payload.data), PAYLOAD_BYTES_BUCKETS, format=payload.format)
+    metrics.observe("vision_payload_encode_seconds", payload.encode_seconds, format=payload.format)
+    return payload
+
+
+def optimize_payload(image: Image.Image, max_bytes: Optional[int] = None) -> VisionPayload:
+    """First candidate (format, quality, resolution) that fits max_bytes, else the smallest"""
+    max_bytes = VISION_PAYLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    started = time.perf_counter()
+
+    image = fit_vision_resolution(image)
+    grayscale, document = analyze_tones(image)
+    image = image.convert("L" if grayscale else "RGB")
+    candidates = _candidates(grayscale, document)
+
+    smallest: Optional[VisionPayload] = None
+    for step in DOWNSCALE_STEPS:
+        if step < 1.0:
+            size = (max(1, round(image.width * step)), max(1, round(image.height * step)))
+            scaled = image.resize(size, Image.Resampling.LANCZOS)
+        else:
+            scaled = image
+        for format, quality in candidates:
+            data = encode(scaled, format, quality)
+            if len(data) <= max_bytes:
+                return _record(VisionPayload(data, format, quality, scaled.size, grayscale,
+                                             time.perf_counter() - started))
+            if smallest is None or len(data) < len(smallest.data):
+                smallest = VisionPayload(data, format, quality, scaled.size, grayscale, 0.0)
+
+    smallest.encode_seconds = time.perf_counter() - started
+    logger.warning(f"Vision payload over budget: {smallest!r} > {max_bytes} bytes")
+    return _record(smallest)
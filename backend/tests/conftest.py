@@ -0,0 +1,8 @@
+"""
+Make backend modules (services, routes) importable from the test suite
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
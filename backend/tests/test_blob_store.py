@@ -0,0 +1,407 @@
+"""
+Blob store test suite (services/blob_store.py)
+- Files are stored once per content (SHA-256) and reference-counted
+- The last release deletes the blob; a put waits for a deletion in progress
+- Documents created with fileBase64 keep only fileId / fileSize / fileMimeType
+- migrate_inline_files moves existing fileBase64 records in batches
+- GET /api/documents/{id}/file streams the blob: ETag / 304, Range / 206, 416
+"""
+
+import base64
+import asyncio
+import hashlib
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+from services import blob_store, merchant_index, metrics
+from services.blob_store import LocalBackend
+
+PDF = b"%PDF-1.4 folio hotel du port"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+LARGE_PDF = b"%PDF-1.4\n" + bytes(range(256)) * 64
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        value = doc.get(key)
+        if isinstance(expected, dict):
+            for op, operand in expected.items():
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$exists" and (key in doc) != operand:
+                    return False
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$lte" and not (value is not None and value <= operand):
+                    return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return dict(doc)
+    if all(projection.values()):
+        return {k: v for k, v in doc.items() if k == "_id" or k in projection}
+    return {k: v for k, v in doc.items() if k not in projection}
+
+
+class Result:
+    def __init__(self, matched_count=0, deleted_count=0, inserted_id=None):
+        self.matched_count = matched_count
+        self.deleted_count = deleted_count
+        self.inserted_id = inserted_id
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        return Cursor(sorted(self.docs, key=lambda d: d[field], reverse=direction < 0))
+
+    def limit(self, n):
+        return Cursor(self.docs[:n])
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.queries = []
+
+    def _find(self, query):
+        return next((d for d in self.docs.values() if _matches(d, query)), None)
+
+    def _apply(self, doc, update):
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    def find(self, query, projection=None):
+        self.queries.append((query, projection))
+        return Cursor([_project(d, projection) for d in self.docs.values() if _matches(d, query)])
+
+    async def find_one(self, query, projection=None):
+        doc = self._find(query)
+        return _project(doc, projection) if doc is not None else None
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = dict(doc)
+        return Result(inserted_id=doc["_id"])
+
+    async def update_one(self, query, update):
+        doc = self._find(query)
+        if doc is None:
+            return Result(0)
+        self._apply(doc, update)
+        return Result(1)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return None
+            if query["_id"] in self.docs:
+                raise DuplicateKeyError("E11000 duplicate key")
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+        self._apply(doc, update)
+        return dict(doc)
+
+    async def find_one_and_delete(self, query, projection=None):
+        doc = self._find(query)
+        if doc is not None:
+            del self.docs[doc["_id"]]
+            return _project(doc, projection)
+        return None
+
+    async def delete_one(self, query):
+        doc = self._find(query)
+        if doc is None:
+            return Result(deleted_count=0)
+        del self.docs[doc["_id"]]
+        return Result(deleted_count=1)
+
+
+class FakeDB:
+    def __init__(self):
+        self.blobs = FakeCollection()
+        self.documents = FakeCollection()
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    db = FakeDB()
+    monkeypatch.setattr(blob_store, "db", db)
+    monkeypatch.setattr(blob_store, "_backend", LocalBackend(str(tmp_path)))
+    monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+    metrics.reset()
+    return db
+
+
+def stored_files(tmp_path):
+    return sorted(p.name for p in tmp_path.rglob("*") if p.is_file())
+
+
+class TestBlobStore:
+
+    def test_identical_files_stored_once(self, store, tmp_path):
+        first = run(blob_store.put(PDF))
+        second = run(blob_store.put(PDF))
+
+        digest = hashlib.sha256(PDF).hexdigest()
+        assert first == second == {"fileId": digest, "fileSize": len(PDF), "fileMimeType": "application/pdf"}
+        assert stored_files(tmp_path) == [digest]
+        assert store.blobs.docs[digest]["refCount"] == 2
+        assert run(blob_store.get(digest)) == PDF
+        assert metrics.get_counter("blob_store_puts_total", result="deduplicated") == 1
+
+    def test_last_release_deletes(self, store, tmp_path):
+        file_id = run(blob_store.put(PNG))["fileId"]
+        run(blob_store.put(PNG))
+
+        run(blob_store.release(file_id))
+        assert run(blob_store.get(file_id)) == PNG
+
+        run(blob_store.release(file_id))
+        assert store.blobs.docs == {}
+        assert stored_files(tmp_path) == []
+        assert run(blob_store.get(file_id)) is None
+
+    def test_failed_write_drops_reference(self, store, tmp_path, monkeypatch):
+        async def failing_write(digest, data):
+            raise OSError("disk full")
+
+        kept = run(blob_store.put(PDF))["fileId"]
+        # Bytes lost from the disk while another document still references them
+        run(blob_store.get_backend().delete(kept))
+        monkeypatch.setattr(blob_store.get_backend(), "write", failing_write)
+
+        for data in (PNG, PDF):
+            with pytest.raises(OSError):
+                run(blob_store.put(data))
+        assert list(store.blobs.docs) == [kept]
+        assert store.blobs.docs[kept]["refCount"] == 1
+
+    def test_put_waits_for_deletion_in_progress(self, store, tmp_path):
+        file_id = run(blob_store.put(PNG))["fileId"]
+        store.blobs.docs[file_id].update(refCount=0, deleting=True)
+
+        async def finish_deletion():
+            await asyncio.sleep(0.06)
+            await blob_store.get_backend().delete(file_id)
+            await store.blobs.delete_one({"_id": file_id})
+
+        async def scenario():
+            _, ref = await asyncio.gather(finish_deletion(), blob_store.put(PNG))
+            return ref
+
+        assert run(scenario())["fileId"] == file_id
+        assert store.blobs.docs[file_id]["refCount"] == 1
+        assert run(blob_store.get(file_id)) == PNG
+
+    def test_stream_by_chunks(self):
+        file_id = run(blob_store.put(LARGE_PDF))["fileId"]
+
+        async def chunks(**kwargs):
+            return [chunk async for chunk in blob_store.stream(file_id, chunk_size=4096, **kwargs)]
+
+        whole = run(chunks())
+        assert [len(chunk) for chunk in whole] == [4096, 4096, 4096, 4096, 9]
+        assert b"".join(whole) == LARGE_PDF
+        assert b"".join(run(chunks(start=100, length=5000))) == LARGE_PDF[100:5100]
+
+    @pytest.mark.parametrize("data, file_type, mime_type", [
+        (PDF, "image", "application/pdf"),
+        (PNG, "image", "image/png"),
+        (b"\xff\xd8\xff\xe0 jfif", "image", "image/jpeg"),
+        (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image", "image/webp"),
+        (b"unknown", "pdf", "application/pdf"),
+    ])
+    def test_sniff_mime_type(self, data, file_type, mime_type):
+        assert blob_store.sniff_mime_type(data, file_type) == mime_type
+
+
+class TestMigration:
+
+    def insert(self, store, **fields):
+        document_id = ObjectId()
+        store.documents.docs[document_id] = {"_id": document_id, "name": "ticket", **fields}
+        return document_id
+
+    def test_inline_files_moved_in_batches(self, store, tmp_path):
+        encoded = base64.b64encode(PDF).decode()
+        ids = [self.insert(store, fileType="pdf", fileBase64=encoded) for _ in range(3)]
+        empty = self.insert(store, fileBase64=None)
+        broken = self.insert(store, fileBase64="not base64!")
+        untouched = self.insert(store)
+
+        counts = run(blob_store.migrate_inline_files(batch_size=2))
+
+        assert counts == {"migrated": 3, "empty": 1, "invalid": 1, "skipped": 0}
+        for document_id in ids:
+            doc = store.documents.docs[document_id]
+            assert "fileBase64" not in doc
+            assert (doc["fileSize"], doc["fileMimeType"]) == (len(PDF), "application/pdf")
+        assert store.blobs.docs[hashlib.sha256(PDF).hexdigest()]["refCount"] == 3
+        assert len(stored_files(tmp_path)) == 1
+        assert "fileBase64" not in store.documents.docs[empty]
+        assert store.documents.docs[broken]["fileBase64Invalid"] == "not base64!"
+        assert store.documents.docs[untouched] == {"_id": untouched, "name": "ticket"}
+        assert run(blob_store.migrate_inline_files()) == {"migrated": 0, "empty": 0, "invalid": 0, "skipped": 0}
+
+        # Batches read ids only, each one after the previous batch's last _id
+        queries = store.documents.queries
+        assert all(projection == {"_id": 1} for _, projection in queries)
+        assert "_id" not in queries[0][0]
+        assert queries[1][0]["_id"] == {"$gt": ids[1]}
+
+    def test_document_moved_meanwhile_skipped(self, store, monkeypatch):
+        document_id = self.insert(store, fileBase64=base64.b64encode(PNG).decode())
+        find_one = store.documents.find_one
+
+        async def moved_meanwhile(query, projection=None):
+            store.documents.docs[document_id].pop("fileBase64", None)
+            return await find_one(query, projection)
+
+        monkeypatch.setattr(store.documents, "find_one", moved_meanwhile)
+        assert run(blob_store.migrate_inline_files())["skipped"] == 1
+        assert store.blobs.docs == {}
+
+
+class TestDocumentRoutes:
+
+    @pytest.fixture
+    def client(self, store, monkeypatch):
+        from routes import documents
+
+        monkeypatch.setattr(documents, "db", store)
+        app = FastAPI()
+        app.include_router(documents.router)
+        with TestClient(app) as client:
+            yield client
+
+    def create(self, client, data):
+        return client.post("/api/documents", json={
+            "name": "folio", "fileType": "pdf", "fileBase64": base64.b64encode(data).decode(),
+        }).json()
+
+    def test_create_stores_reference_only(self, client, store):
+        created = self.create(client, PDF)
+
+        doc = store.documents.docs[ObjectId(created["id"])]
+        assert "fileBase64" not in doc
+        assert doc["fileId"] == hashlib.sha256(PDF).hexdigest()
+        assert (created["hasFile"], created["fileSize"], created["fileMimeType"]) == (True, len(PDF), "application/pdf")
+
+        response = client.get(f"/api/documents/{created['id']}/file")
+        assert response.content == PDF
+        assert response.headers["content-type"] == "application/pdf"
+
+    def test_legacy_inline_file_still_served(self, client, store):
+        document_id = ObjectId()
+        store.documents.docs[document_id] = {"_id": document_id, "name": "ticket",
+                                             "fileBase64": base64.b64encode(PNG).decode()}
+        response = client.get(f"/api/documents/{document_id}/file")
+        assert response.content == PNG
+        assert response.headers["content-type"] == "image/png"
+
+    def test_delete_releases_blob(self, client, store, tmp_path):
+        first = self.create(client, PDF)
+        second = self.create(client, PDF)
+
+        client.delete(f"/api/documents/{first['id']}")
+        assert client.get(f"/api/documents/{second['id']}/file").content == PDF
+
+        client.delete(f"/api/documents/{second['id']}")
+        assert store.blobs.docs == {}
+        assert stored_files(tmp_path) == []
+
+    def test_invalid_base64_refused(self, client):
+        response = client.post("/api/documents", json={"name": "folio", "fileBase64": "not base64!"})
+        assert response.status_code == 400
+
+    def test_download_headers_and_revalidation(self, client):
+        created = self.create(client, LARGE_PDF)
+        url = f"/api/documents/{created['id']}/file"
+
+        response = client.get(url)
+        etag = f'"{hashlib.sha256(LARGE_PDF).hexdigest()}"'
+        assert response.status_code == 200 and response.content == LARGE_PDF
+        assert response.headers["etag"] == etag
+        assert response.headers["content-length"] == str(len(LARGE_PDF))
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["cache-control"].startswith("private, max-age=")
+
+        revalidated = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+        assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_range_requests(self, client):
+        created = self.create(client, LARGE_PDF)
+        url = f"/api/documents/{created['id']}/file"
+        size = len(LARGE_PDF)
+
+        partial = client.get(url, headers={"Range": "bytes=100-4195"})
+        assert partial.status_code == 206
+        assert partial.content == LARGE_PDF[100:4196]
+        assert partial.headers["content-range"] == f"bytes 100-4195/{size}"
+        assert partial.headers["content-length"] == "4096"
+
+        suffix = client.get(url, headers={"Range": "bytes=-10"})
+        assert suffix.content == LARGE_PDF[-10:]
+
+        # Stale validator: the whole (new) file instead of a range of it
+        stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+        assert stale.status_code == 200 and stale.content == LARGE_PDF
+
+        outside = client.get(url, headers={"Range": f"bytes={size}-"})
+        assert outside.status_code == 416
+        assert outside.headers["content-range"] == f"bytes */{size}"
+
+    def test_legacy_inline_file_ranges(self, client, store):
+        document_id = ObjectId()
+        store.documents.docs[document_id] = {"_id": document_id, "name": "folio", "fileType": "pdf",
+                                             "fileBase64": base64.b64encode(LARGE_PDF).decode()}
+        response = client.get(f"/api/documents/{document_id}/file", headers={"Range": "bytes=9-"})
+        assert response.status_code == 206 and response.content == LARGE_PDF[9:]
+        assert response.headers["etag"] == f'"{hashlib.sha256(LARGE_PDF).hexdigest()}"'
+
+
+class TestByteRange:
+
+    @pytest.mark.parametrize("header, expected", [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=900-", (900, 999)),
+        ("bytes=990-5000", (990, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=0-9,20-29", None),
+        ("bytes=50-10", None),
+        ("items=0-9", None),
+        ("bytes=abc", None),
+    ])
+    def test_parse(self, header, expected):
+        from routes.documents import parse_byte_range
+        assert parse_byte_range(header, 1000) == expected
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+    def test_unsatisfiable(self, header):
+        from routes.documents import parse_byte_range, RangeNotSatisfiable
+        with pytest.raises(RangeNotSatisfiable):
+            parse_byte_range(header, 1000)
@@ -0,0 +1,55 @@
+"""
+Shared HTTP client test suite (services/http_client.py)
+- Requests go through one client and record per-upstream latency
+- Per-upstream timeouts are applied
+"""
+
+import asyncio
+
+import httpx
+
+from services import http_client, metrics
+
+
+def test_request_uses_shared_client_and_records_latency(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(request.extensions.get("timeout"))
+        return httpx.Response(200, json={"ok": True})
+
+    async def scenario():
+        metrics.reset()
+        monkeypatch.setattr(http_client, "_client", http_client.build_client(transport=httpx.MockTransport(handler)))
+        client = http_client.get_client()
+        for _ in range(3):
+            response = await http_client.request("emergent_auth", "GET", "https://auth.test/session-data")
+            assert response.status_code == 200
+        assert http_client.get_client() is client
+        await http_client.close()
+
+    asyncio.run(scenario())
+
+    assert len(seen) == 3
+    assert seen[0]["read"] == http_client.UPSTREAMS["emergent_auth"].timeout
+    histogram = metrics.snapshot()["upstream_request_seconds"][0]
+    assert histogram["labels"] == {"upstream": "emergent_auth", "status": "200"}
+    assert histogram["count"] == 3
+
+
+def test_error_status_recorded(monkeypatch):
+    def handler(request: httpx.Request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def scenario():
+        metrics.reset()
+        monkeypatch.setattr(http_client, "_client", http_client.build_client(transport=httpx.MockTransport(handler)))
+        try:
+            await http_client.request("openai", "POST", "https://llm.test/v1/chat/completions")
+        except httpx.ConnectError:
+            pass
+        await http_client.close()
+
+    asyncio.run(scenario())
+    histogram = metrics.snapshot()["upstream_request_seconds"][0]
+    assert histogram["labels"] == {"upstream": "openai", "status": "error"}
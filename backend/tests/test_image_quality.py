@@ -0,0 +1,113 @@
+"""
+Image quality gate test suite (services/image_quality.py)
+- Sharp, well exposed receipt photos pass (dim but sharp ones too)
+- Blurry, dark, washed out, tiny and far-away photos are refused with a reason
+- analyze_document answers "retake" without any OCR call
+"""
+
+import io
+import asyncio
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+from services import image_quality, metrics, ocr_cache, ocr_service
+from services.image_quality import check_image_quality, laplacian_variance
+
+TABLE = (120, 86, 60)
+
+
+def receipt_photo(receipt_height=1300, frame=(2000, 1500), seed=0) -> Image.Image:
+    """Receipt on a table, uneven light and sensor noise"""
+    rng = np.random.default_rng(seed)
+    receipt = Image.new("RGB", (440, 510), (246, 243, 236))
+    draw = ImageDraw.Draw(receipt)
+    font = ImageFont.load_default(size=18)
+    for i in range(14):
+        draw.text((30, 40 + i * 30), f"Article {i:02d}   Raquette   {12 + i},50 EUR", fill=(40, 40, 48), font=font)
+    scale = receipt_height / receipt.height
+    receipt = receipt.resize((round(receipt.width * scale), receipt_height), Image.Resampling.BICUBIC)
+
+    photo = Image.new("RGB", frame, TABLE)
+    photo.paste(receipt, ((frame[0] - receipt.width) // 2, (frame[1] - receipt.height) // 2))
+    pixels = np.asarray(photo, dtype=np.float32)
+    light = np.linspace(1.05, 0.8, photo.width, dtype=np.float32)[None, :, None]
+    return Image.fromarray(np.clip(pixels * light + rng.normal(0, 4, pixels.shape), 0, 255).astype(np.uint8))
+
+
+def jpeg(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class TestMeasurements:
+
+    def test_laplacian_variance(self):
+        edges = np.zeros((20, 20), dtype=np.uint8)
+        edges[:, ::2] = 255
+        assert laplacian_variance(np.full((20, 20), 128, dtype=np.uint8)) == 0.0
+        assert laplacian_variance(edges) > laplacian_variance(np.asarray(Image.fromarray(edges).filter(ImageFilter.GaussianBlur(2))))
+
+
+class TestGate:
+
+    def setup_method(self):
+        metrics.reset()
+
+    def test_sharp_photo_passes(self):
+        report = check_image_quality(jpeg(receipt_photo()))
+        assert report.ok, report
+        assert report.message is None
+        assert report.text_height > 10
+
+    def test_dim_but_sharp_photo_passes(self):
+        report = check_image_quality(jpeg(ImageEnhance.Brightness(receipt_photo()).enhance(0.45)))
+        assert report.ok, report
+
+    @pytest.mark.parametrize("transform, problem", [
+        (lambda im: im.filter(ImageFilter.GaussianBlur(6)), "blurry"),
+        (lambda im: ImageEnhance.Brightness(im).enhance(0.2), "too_dark"),
+        (lambda im: ImageEnhance.Contrast(im).enhance(0.15), "low_contrast"),
+        (lambda im: im.resize((300, 225)), "too_small"),
+    ])
+    def test_bad_photo_refused(self, transform, problem):
+        report = check_image_quality(jpeg(transform(receipt_photo())))
+        assert report.problems[0] == problem, report
+        assert "Photo" in report.message or "Image" in report.message
+        assert metrics.get_counter("image_quality_rejections_total", reason=problem) == 1
+
+    def test_receipt_too_far_refused(self):
+        report = check_image_quality(jpeg(receipt_photo(receipt_height=250, frame=(4000, 3000))))
+        assert report.problems == ["text_too_small"], report
+
+    def test_disabled_or_undecodable(self, monkeypatch):
+        assert check_image_quality(b"not an image") is None
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        assert check_image_quality(jpeg(receipt_photo().filter(ImageFilter.GaussianBlur(6)))) is None
+
+
+class TestAnalyzeDocumentGate:
+
+    def test_blurry_photo_refused_before_ocr(self, monkeypatch):
+        calls = []
+
+        async def fake_vision(image_base64):
+            calls.append("vision")
+            return {"success": True, "data": {"montantTotal": 12.0}}
+
+        async def fake_local(file_bytes, digest, user_id=None):
+            calls.append("local")
+
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_locally", fake_local)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+
+        blurry = jpeg(receipt_photo().filter(ImageFilter.GaussianBlur(6)))
+        result = asyncio.run(ocr_service.analyze_document(blurry, "ticket.jpg", "image"))
+
+        assert result["success"] is False and result["retake"] is True
+        assert result["quality"]["problems"] == ["blurry"]
+        assert "floue" in result["error"]
+        assert calls == []
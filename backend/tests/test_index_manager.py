@@ -0,0 +1,101 @@
+"""
+Index manager test suite (services/indexes.py)
+- Missing indexes are created in "create" mode and only reported in "report" mode
+- TTL drift is fixed with collMod
+- Option conflicts and undeclared indexes are reported
+"""
+
+import asyncio
+
+from services.indexes import IndexSpec, reconcile_indexes
+
+
+class FakeCollection:
+    def __init__(self, indexes=None, fail_create=False):
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+        self.indexes.update(indexes or {})
+        self.fail_create = fail_create
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def create_index(self, keys, **options):
+        if self.fail_create:
+            raise Exception("E11000 duplicate key error")
+        info = {"key": list(keys)}
+        info.update({k: v for k, v in options.items() if k != "name"})
+        self.indexes[options["name"]] = info
+
+
+class FakeDB:
+    def __init__(self, collections):
+        self.collections = collections
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+        return {"ok": 1}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestReconcile:
+    """Create / report modes"""
+
+    def test_creates_missing_indexes(self):
+        db = FakeDB({})
+        specs = [
+            IndexSpec("events", ["id"], unique=True),
+            IndexSpec("documents", [("userId", 1), ("createdAt", -1)]),
+        ]
+        report = run(reconcile_indexes(db, specs, mode="create"))
+        assert report["created"] == ["events.id_1", "documents.userId_1_createdAt_-1"]
+        assert db["events"].indexes["id_1"]["unique"] is True
+
+    def test_second_run_is_noop(self):
+        db = FakeDB({})
+        specs = [IndexSpec("events", ["id"], unique=True)]
+        run(reconcile_indexes(db, specs, mode="create"))
+        report = run(reconcile_indexes(db, specs, mode="create"))
+        assert report["created"] == []
+        assert report["ok"] == ["events.id_1"]
+
+    def test_report_mode_does_not_create(self):
+        db = FakeDB({})
+        report = run(reconcile_indexes(db, [IndexSpec("alerts", ["id"])], mode="report"))
+        assert report["missing"] == ["alerts.id_1"]
+        assert "id_1" not in db["alerts"].indexes
+
+    def test_failed_unique_index_reported_missing(self):
+        db = FakeDB({"day_presences": FakeCollection(fail_create=True)})
+        report = run(reconcile_indexes(db, [IndexSpec("day_presences", ["date"], unique=True)], mode="create"))
+        assert report["created"] == []
+        assert report["missing"][0].startswith("day_presences.date_1")
+
+
+class TestReconcileDrift:
+    """Existing indexes that differ from the declaration"""
+
+    def test_ttl_drift_uses_collmod(self):
+        db = FakeDB({"user_sessions": FakeCollection({
+            "expires_at_1": {"key": [("expires_at", 1)], "expireAfterSeconds": 3600}
+        })})
+        spec = IndexSpec("user_sessions", ["expires_at"], expire_after_seconds=0)
+        report = run(reconcile_indexes(db, [spec], mode="create"))
+        assert report["updated"] == ["user_sessions.expires_at_1"]
+        assert any(args[0] == "collMod" for args, _ in db.commands)
+
+    def test_option_conflict_reported(self):
+        db = FakeDB({"events": FakeCollection({"id_1": {"key": [("id", 1)]}})})
+        report = run(reconcile_indexes(db, [IndexSpec("events", ["id"], unique=True)], mode="create"))
+        assert report["conflicts"]
+
+    def test_unmanaged_index_reported(self):
+        db = FakeDB({"events": FakeCollection({"legacy_1": {"key": [("legacy", 1)]}})})
+        report = run(reconcile_indexes(db, [IndexSpec("events", ["id"])], mode="create"))
+        assert report["unmanaged"] == ["events.legacy_1"]
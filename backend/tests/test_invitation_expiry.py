@@ -0,0 +1,102 @@
+"""
+Invitation expiry test suite
+- Lazy effective status (no write pass on read)
+- TTL indexes declared for sessions, invitations and staff tokens
+- Only invitations still pending can be cancelled
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import invitation_routes
+from routes.invitation_routes import effective_invitation_status, INDEXES as INVITATION_INDEXES
+
+
+class TestEffectiveStatus:
+    """effective_invitation_status"""
+
+    def test_pending_past_expiry_is_expired(self):
+        inv = {"status": "pending", "expiresAt": datetime.now(timezone.utc) - timedelta(minutes=1)}
+        assert effective_invitation_status(inv) == "expired"
+
+    def test_pending_not_yet_expired(self):
+        inv = {"status": "pending", "expiresAt": datetime.now(timezone.utc) + timedelta(days=1)}
+        assert effective_invitation_status(inv) == "pending"
+
+    def test_naive_expiry_treated_as_utc(self):
+        inv = {"status": "pending", "expiresAt": datetime.utcnow() - timedelta(minutes=1)}
+        assert effective_invitation_status(inv) == "expired"
+
+    def test_accepted_and_cancelled_unchanged(self):
+        past = datetime.now(timezone.utc) - timedelta(days=1)
+        assert effective_invitation_status({"status": "accepted", "expiresAt": past}) == "accepted"
+        assert effective_invitation_status({"status": "cancelled", "expiresAt": past}) == "cancelled"
+
+
+class TestTTLIndexes:
+    """TTL declarations"""
+
+    def test_invitation_and_staff_token_ttl(self):
+        ttl = {(s.collection, s.keys[0][0]): s.expire_after_seconds for s in INVITATION_INDEXES
+               if s.expire_after_seconds is not None}
+        assert ttl[("staff_tokens", "expiresAt")] == 0
+        assert ttl[("invitations", "expiresAt")] > 0
+
+    def test_invitation_ttl_only_purges_pending(self):
+        spec = next(s for s in INVITATION_INDEXES if s.collection == "invitations" and s.keys == [("expiresAt", 1)])
+        assert spec.options()["partialFilterExpression"] == {"status": "pending"}
+
+    def test_accepted_and_cancelled_invitations_purged(self):
+        ttl = {s.keys[0][0]: s for s in INVITATION_INDEXES if s.collection == "invitations" and s.expire_after_seconds}
+        for field in ("acceptedAt", "cancelledAt"):
+            assert ttl[field].expire_after_seconds == ttl["expiresAt"].expire_after_seconds
+            assert ttl[field].partial_filter is None
+
+
+class FakeInvitations:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            expires_after = query.get("expiresAt", {}).get("$gt")
+            if doc["_id"] == query["_id"] and doc["status"] == query["status"] and \
+                    (expires_after is None or doc["expiresAt"] > expires_after):
+                doc.update(update["$set"])
+                return type("Result", (), {"matched_count": 1})()
+        return type("Result", (), {"matched_count": 0})()
+
+
+class TestCancel:
+
+    @pytest.fixture
+    def invitations(self, monkeypatch):
+        now = datetime.now(timezone.utc)
+        docs = [
+            {"_id": ObjectId(), "status": "pending", "expiresAt": now + timedelta(days=1)},
+            {"_id": ObjectId(), "status": "pending", "expiresAt": now - timedelta(days=1)},
+        ]
+        monkeypatch.setattr(invitation_routes, "db", type("DB", (), {"invitations": FakeInvitations(docs)})())
+        return docs
+
+    @pytest.fixture
+    def client(self, invitations):
+        app = FastAPI()
+        app.include_router(invitation_routes.router)
+        with TestClient(app) as client:
+            yield client
+
+    def test_pending_cancelled_with_date(self, client, invitations):
+        live = invitations[0]
+        assert client.post(f"/api/invitations/{live['_id']}/cancel").status_code == 200
+        assert live["status"] == "cancelled"
+        assert isinstance(live["cancelledAt"], datetime)
+
+    def test_expired_not_cancelled(self, client, invitations):
+        expired = invitations[1]
+        assert client.post(f"/api/invitations/{expired['_id']}/cancel").status_code == 404
+        assert expired["status"] == "pending" and "cancelledAt" not in expired
@@ -0,0 +1,240 @@
+"""
+Typed invoice date test suite (routes/documents.py)
+- dateFacture is stored as invoiceDate (UTC midnight) on create and update
+- startDate / endDate filter invoiceDate, in DD/MM/YYYY or YYYY-MM-DD, across months and years
+- backfill_invoice_dates types the documents saved before invoiceDate existed
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import merchant_index
+from routes import documents
+from routes.documents import parse_invoice_date
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def utc(year, month, day):
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        value = doc.get(key)
+        if isinstance(expected, dict):
+            for op, operand in expected.items():
+                if op == "$exists" and (key in doc) != operand:
+                    return False
+                if op == "$gt" and (value is None or value <= operand):
+                    return False
+                if op == "$gte" and (value is None or value < operand):
+                    return False
+                if op == "$lte" and (value is None or value > operand):
+                    return False
+        elif value != expected:
+            return False
+    return True
+
+
+class Result:
+    def __init__(self, matched_count=0, inserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.inserted_id = inserted_id
+
+
+class Cursor:
+    def __init__(self, docs, sorts=None):
+        self.docs = docs
+        self.sorts = sorts if sorts is not None else []
+
+    def sort(self, field, direction):
+        self.sorts.append((field, direction))
+        return Cursor(sorted(self.docs, key=lambda d: d.get(field) or utc(1, 1, 1), reverse=direction < 0), self.sorts)
+
+    def skip(self, n):
+        return Cursor(self.docs[n:], self.sorts)
+
+    def limit(self, n):
+        return Cursor(self.docs[:n], self.sorts)
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.pipelines = []
+        self.queries = []
+        self.sorts = []
+        self.bulk_writes = 0
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return Cursor([dict(d) for d in self.docs.values() if _matches(d, query)], self.sorts)
+
+    async def find_one(self, query, projection=None):
+        return next((dict(d) for d in self.docs.values() if _matches(d, query)), None)
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = dict(doc)
+        return Result(inserted_id=doc["_id"])
+
+    async def update_one(self, query, update):
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        if doc is None:
+            return Result(0)
+        doc.update(update.get("$set", {}))
+        return Result(1)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        modified = 0
+        for op in operations:
+            modified += (await self.update_one(op._filter, op._doc)).matched_count
+        return Result(modified)
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        matched = [d for d in self.docs.values() if _matches(d, pipeline[0]["$match"])]
+        groups = {}
+        for doc in matched:
+            group = groups.setdefault(doc.get("category"), {"_id": doc.get("category"), "count": 0, "total": 0})
+            group["count"] += 1
+            group["total"] += doc.get("montantTotal") or 0
+        return Cursor(list(groups.values()))
+
+
+class FakeDB:
+    def __init__(self):
+        self.documents = FakeCollection()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(documents, "db", fake)
+    monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+    return fake
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(documents.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def create(client, date, **fields):
+    return client.post("/api/documents", json={"name": f"facture {date}", "dateFacture": date, **fields}).json()
+
+
+class TestParse:
+
+    @pytest.mark.parametrize("value, expected", [
+        ("14/03/2024", utc(2024, 3, 14)),
+        ("14-03-2024", utc(2024, 3, 14)),
+        ("14.03.2024", utc(2024, 3, 14)),
+        ("2024-03-14", utc(2024, 3, 14)),
+        ("14/03/24", utc(2024, 3, 14)),
+        (" 01/12/2023 ", utc(2023, 12, 1)),
+        ("31/02/2024", None),
+        ("mars 2024", None),
+        ("", None),
+        (None, None),
+    ])
+    def test_parse_invoice_date(self, value, expected):
+        assert parse_invoice_date(value) == expected
+
+
+class TestDocuments:
+
+    def test_create_and_update_write_invoice_date(self, client, db):
+        created = create(client, "14/03/2024")
+        assert created["invoiceDate"] == "2024-03-14"
+        assert db.documents.docs[ObjectId(created["id"])]["invoiceDate"] == utc(2024, 3, 14)
+
+        updated = client.put(f"/api/documents/{created['id']}", json={"dateFacture": "02/01/2025"}).json()
+        assert updated["invoiceDate"] == "2025-01-02"
+
+        untyped = create(client, "date illisible")
+        assert untyped["invoiceDate"] is None
+        assert db.documents.docs[ObjectId(untyped["id"])]["invoiceDate"] is None
+
+    def test_range_across_months_and_years(self, client):
+        for date in ("10/12/2023", "15/01/2024", "28/02/2024", "05/03/2024", "02/04/2024"):
+            create(client, date)
+
+        # As strings, "10/12/2023" sorted between "01/02/2024" and "31/03/2024"
+        for start, end in (("01/02/2024", "31/03/2024"), ("2024-02-01", "2024-03-31")):
+            found = client.get("/api/documents", params={"startDate": start, "endDate": end}).json()
+            assert sorted(doc["dateFacture"] for doc in found) == ["05/03/2024", "28/02/2024"]
+
+        since = client.get("/api/documents", params={"startDate": "01/01/2024"}).json()
+        assert len(since) == 4
+
+    def test_stats_filter_on_invoice_date(self, client, db):
+        create(client, "10/12/2023", userId="u1", category="travel", montantTotal=50.0)
+        create(client, "15/01/2024", userId="u1", category="travel", montantTotal=20.0)
+
+        stats = client.get("/api/documents/stats", params={"userId": "u1", "startDate": "01/01/2024",
+                                                           "endDate": "31/12/2024"}).json()
+        assert (stats["totalCount"], stats["totalAmount"]) == (1, 20.0)
+        assert db.documents.pipelines[-1][0]["$match"] == {
+            "userId": "u1", "invoiceDate": {"$gte": utc(2024, 1, 1), "$lte": utc(2024, 12, 31)}
+        }
+
+    def test_listing_uses_indexed_fields(self, client, db):
+        create(client, "10/12/2023", userId="u1", category="travel")
+        create(client, "15/01/2024", userId="u1", category="travel")
+        create(client, "15/01/2024", userId="u1", category="meals")
+        create(client, "15/01/2024", userId="u2", category="travel")
+
+        found = client.get("/api/documents", params={"userId": "u1", "category": "travel"}).json()
+        assert [doc["dateFacture"] for doc in found] == ["15/01/2024", "10/12/2023"]
+        # Equality on userId and category, then the sort: the (userId, category, createdAt) index
+        assert db.documents.queries[-1] == {"userId": "u1", "category": "travel"}
+        assert db.documents.sorts[-1] == ("createdAt", -1)
+        keys = [spec.keys for spec in documents.INDEXES]
+        assert [("userId", 1), ("category", 1), ("createdAt", -1)] in keys
+        assert [("userId", 1), ("createdAt", -1)] in keys
+
+    def test_invalid_date_refused(self, client):
+        response = client.get("/api/documents", params={"startDate": "2024-13-01"})
+        assert response.status_code == 400
+
+    def test_compound_index_declared(self):
+        assert [("userId", 1), ("invoiceDate", -1)] in [spec.keys for spec in documents.INDEXES]
+
+
+class TestBackfill:
+
+    def test_backfill_in_batches(self, db):
+        legacy = {}
+        for date in ("14/03/2024", "2023-11-30", None, "??"):
+            document_id = ObjectId()
+            db.documents.docs[document_id] = {"_id": document_id, "dateFacture": date}
+            legacy[document_id] = date
+        typed = ObjectId()
+        db.documents.docs[typed] = {"_id": typed, "dateFacture": "01/01/2020", "invoiceDate": utc(2020, 1, 1)}
+
+        assert run(documents.backfill_invoice_dates(batch_size=3)) == 4
+        assert [db.documents.docs[document_id]["invoiceDate"] for document_id in legacy] == [
+            utc(2024, 3, 14), utc(2023, 11, 30), None, None
+        ]
+        # One bulk write per batch; each batch resumes after the previous one's last _id
+        assert db.documents.bulk_writes == 2
+        assert "_id" not in db.documents.queries[0]
+        assert db.documents.queries[1]["_id"] == {"$gt": list(legacy)[2]}
+        assert run(documents.backfill_invoice_dates()) == 0
@@ -0,0 +1,263 @@
+"""
+Job queue test suite (services/job_queue.py, invoice async mode in routes/documents.py)
+- Submitted jobs are processed by the workers; payloads are removed once done
+- Failing jobs are retried up to max_attempts, then marked failed
+- Jobs left running by a dead worker are reclaimed after their lease
+- A stale claim cannot overwrite the result of the job's new claim
+- ?async=true returns a job id; the result is served by polling and SSE
+"""
+
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import metrics
+from services.job_queue import JobQueue
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in expected):
+                return False
+        elif isinstance(expected, dict) and "$lt" in expected:
+            value = doc.get(key)
+            if value is None or not value < expected["$lt"]:
+                return False
+        elif doc.get(key) != expected:
+            return False
+    return True
+
+
+class UpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def find_one(self, query, projection=None):
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                return dict(doc)
+        return None
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        candidates = sorted((d for d in self.docs.values() if _matches(d, query)), key=lambda d: d["createdAt"])
+        if not candidates:
+            return None
+        self._apply(candidates[0], update)
+        return dict(candidates[0])
+
+    async def update_one(self, query, update):
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                self._apply(doc, update)
+                return UpdateResult(1)
+        return UpdateResult(0)
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.docs.values() if _matches(d, query))
+
+
+class FakeGridOut:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+
+class FakeBucket:
+    def __init__(self):
+        self.files = {}
+        self.ids = itertools.count(1)
+
+    async def upload_from_stream(self, filename, data):
+        file_id = next(self.ids)
+        self.files[file_id] = data
+        return file_id
+
+    async def open_download_stream(self, file_id):
+        return FakeGridOut(self.files[file_id])
+
+    async def delete(self, file_id):
+        del self.files[file_id]
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def make_queue(handler, **kwargs) -> JobQueue:
+    queue = JobQueue("jobs", handler, poll_seconds=0.05, **kwargs)
+    queue.init_db(FakeDB())
+    queue.bucket = FakeBucket()
+    return queue
+
+
+async def wait_for_status(queue, job_id, statuses, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        job = await queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await queue.wait_for_update(job_id, 0.05)
+    raise AssertionError(f"job still {job['status']}")
+
+
+class TestJobQueue:
+
+    def setup_method(self):
+        metrics.reset()
+
+    def test_job_processed(self):
+        async def handler(payload, params):
+            return {"size": len(payload), "name": params["filename"]}
+
+        async def scenario():
+            queue = make_queue(handler, workers=2)
+            queue.start()
+            try:
+                job_id = await queue.submit(b"invoice", {"filename": "a.pdf"})
+                return queue, await wait_for_status(queue, job_id, ("done", "failed"))
+            finally:
+                await queue.stop()
+
+        queue, job = asyncio.run(scenario())
+        assert job["status"] == "done"
+        assert job["result"] == {"size": 7, "name": "a.pdf"}
+        assert job["attempts"] == 1
+        assert queue.bucket.files == {}
+        snapshot = metrics.snapshot()
+        assert snapshot["job_queue_latency_seconds"][0]["count"] == 1
+        assert snapshot["job_queue_depth"][0]["value"] == 0
+        assert metrics.get_counter("job_queue_jobs_total", queue="jobs", status="done") == 1
+
+    def test_failing_job_retried_then_failed(self):
+        calls = []
+
+        async def handler(payload, params):
+            calls.append(1)
+            raise RuntimeError("vision API down")
+
+        async def scenario():
+            queue = make_queue(handler, workers=1, max_attempts=2)
+            queue.start()
+            try:
+                job_id = await queue.submit(b"invoice", {})
+                return await wait_for_status(queue, job_id, ("failed",))
+            finally:
+                await queue.stop()
+
+        job = asyncio.run(scenario())
+        assert len(calls) == 2
+        assert job["attempts"] == 2
+        assert job["error"] == "vision API down"
+
+    def test_expired_lease_reclaimed_after_restart(self):
+        async def handler(payload, params):
+            return {"ok": True}
+
+        async def scenario():
+            queue = make_queue(handler, workers=1)
+            job_id = await queue.submit(b"invoice", {})
+            # Claimed by a worker of a process that then died
+            claimed = await queue._claim()
+            jobs = queue.collection.docs
+            jobs[job_id]["leaseUntil"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+            queue.start()
+            try:
+                job = await wait_for_status(queue, job_id, ("done",))
+            finally:
+                await queue.stop()
+            return claimed, job
+
+        claimed, job = asyncio.run(scenario())
+        assert claimed["status"] == "running"
+        assert job["status"] == "done"
+        assert job["attempts"] == 2
+
+    def test_stale_claim_result_discarded(self):
+        async def handler(payload, params):
+            return {"ok": True}
+
+        async def scenario():
+            queue = make_queue(handler, workers=1)
+            job_id = await queue.submit(b"invoice", {})
+            stale = await queue._claim()
+            queue.collection.docs[job_id]["leaseUntil"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+            current = await queue._claim()
+            await queue._process(stale)
+            job = await queue.get(job_id)
+            return current, job, queue
+
+        current, job, queue = asyncio.run(scenario())
+        assert job["status"] == "running"
+        assert job["claimId"] == current["claimId"]
+        # The payload is still there for the current claim
+        assert len(queue.bucket.files) == 1
+
+
+class TestInvoiceAsyncMode:
+
+    def test_submit_poll_and_stream(self, monkeypatch):
+        from routes import documents
+
+        async def fake_analyze(file_bytes, filename="", file_type="image", debug=False, user_id=None,
+                               multipage=False):
+            return {"success": True, "data": {"montantTotal": 12.5, "categorie": "Transport", "fileType": file_type}}
+
+        monkeypatch.setattr(documents, "analyze_document", fake_analyze)
+        monkeypatch.setattr(documents.invoice_jobs, "poll_seconds", 0.05)
+        monkeypatch.setattr(documents.invoice_jobs, "db", FakeDB())
+        monkeypatch.setattr(documents.invoice_jobs, "bucket", FakeBucket())
+
+        @asynccontextmanager
+        async def lifespan(app):
+            documents.invoice_jobs.start()
+            yield
+            await documents.invoice_jobs.stop()
+
+        app = FastAPI(lifespan=lifespan)
+        app.include_router(documents.router)
+
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/invoices/upload?async=true",
+                files={"file": ("taxi.png", b"fake image", "image/png")},
+            )
+            assert response.status_code == 202
+            body = response.json()
+            assert body["success"] is True and body["status"] == "queued"
+            job_id = body["jobId"]
+
+            with client.stream("GET", f"/api/invoices/jobs/{job_id}/events") as stream:
+                text = "".join(stream.iter_text())
+            assert "event: status" in text
+            assert '"status":"done"' in text
+
+            job = client.get(f"/api/invoices/jobs/{job_id}").json()
+            assert job["status"] == "done"
+            assert job["result"]["data"]["montantTotal"] == 12.5
+
+            assert client.get("/api/invoices/jobs/unknown").status_code == 404
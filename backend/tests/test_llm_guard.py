@@ -0,0 +1,281 @@
+"""
+LLM guard test suite (services/llm_guard.py)
+- Concurrent calls are capped by one semaphore, with in-flight / waiting gauges
+- Failures are retried with jittered exponential backoff; permanent errors are not
+- Consecutive failures open the circuit breaker: calls fail fast, then one
+  probe after the reset delay closes it again (or reopens it)
+- A malformed (non-JSON) answer is asked again, without counting against the breaker
+- analyze_document falls back to the local extraction while the provider is down
+"""
+
+import io
+import asyncio
+
+import pytest
+from PIL import Image
+
+from services import image_quality, merchant_index, metrics, ocr_cache, ocr_service
+from services.llm_guard import LlmGuard, CircuitOpenError, PermanentLlmError, CLOSED, HALF_OPEN, OPEN
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Flaky:
+    """Fails the first `failures` calls, then answers"""
+
+    def __init__(self, failures=0, exc=RuntimeError("503")):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    async def __call__(self, value="ok"):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc
+        return value
+
+
+def guard(**kwargs) -> LlmGuard:
+    kwargs.setdefault("backoff_base", 0.0)
+    g = LlmGuard("test", **kwargs)
+    g.clock = Clock()
+    return g
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+
+
+class TestRetries:
+
+    def test_success_passes_through(self):
+        g = guard()
+        assert run(g.call("vision", Flaky(), "answer")) == "answer"
+        assert metrics.get_counter("llm_calls_total", guard="test", operation="vision", result="success") == 1
+
+    def test_transient_failures_retried(self):
+        g, fn = guard(max_attempts=3), Flaky(failures=2)
+        assert run(g.call("vision", fn)) == "ok"
+        assert fn.calls == 3
+        assert metrics.get_counter("llm_retries_total", guard="test", operation="vision") == 2
+        assert g.state == CLOSED
+
+    def test_last_error_raised_when_exhausted(self):
+        g, fn = guard(max_attempts=2), Flaky(failures=5)
+        with pytest.raises(RuntimeError):
+            run(g.call("vision", fn))
+        assert fn.calls == 2
+        assert metrics.get_counter("llm_calls_total", guard="test", operation="vision", result="failure") == 1
+
+    def test_attempts_override(self):
+        g, fn = guard(max_attempts=3), Flaky(failures=5)
+        with pytest.raises(RuntimeError):
+            run(g.call("quick_replies", fn, attempts=1))
+        assert fn.calls == 1
+
+    def test_permanent_error_not_retried_nor_counted(self):
+        g, fn = guard(max_attempts=3, breaker_failures=1), Flaky(failures=5, exc=PermanentLlmError("401"))
+        with pytest.raises(PermanentLlmError):
+            run(g.call("vision", fn))
+        assert fn.calls == 1
+        assert g.state == CLOSED
+
+    def test_timeout_is_a_failure(self):
+        async def slow():
+            await asyncio.sleep(1)
+
+        g = guard(max_attempts=1, call_timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            run(g.call("vision", slow))
+
+    def test_backoff_has_full_jitter_and_cap(self):
+        g = LlmGuard("test", backoff_base=0.5, backoff_max=4.0)
+        delays = [g.backoff(3) for _ in range(200)]
+        assert all(0 <= d <= 4.0 for d in delays)
+        assert min(delays) < 1.0 < max(delays)
+        assert all(0 <= g.backoff(10) <= 4.0 for _ in range(50))
+
+
+class TestConcurrency:
+
+    def test_calls_capped_by_semaphore(self):
+        g = guard(max_concurrency=2)
+        active, peak = [0], [0]
+
+        async def call():
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+            return True
+
+        async def burst():
+            return await asyncio.gather(*(g.call("vision", call) for _ in range(6)))
+
+        assert run(burst()) == [True] * 6
+        assert peak[0] == 2
+        gauges = {entry["labels"]["guard"]: entry["value"] for entry in metrics.snapshot()["llm_in_flight"]}
+        assert gauges["test"] == 0
+
+
+class TestCircuitBreaker:
+
+    def open_breaker(self, g):
+        for _ in range(g.breaker_failures):
+            with pytest.raises(RuntimeError):
+                run(g.call("vision", Flaky(failures=1), attempts=1))
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        g = guard(breaker_failures=3)
+        self.open_breaker(g)
+        assert g.state == OPEN
+
+        fn = Flaky()
+        with pytest.raises(CircuitOpenError):
+            run(g.call("vision", fn))
+        assert fn.calls == 0
+        assert metrics.get_counter("llm_calls_total", guard="test", operation="vision", result="rejected") == 1
+
+    def test_success_resets_the_failure_count(self):
+        g = guard(breaker_failures=2)
+        with pytest.raises(RuntimeError):
+            run(g.call("vision", Flaky(failures=1), attempts=1))
+        run(g.call("vision", Flaky()))
+        with pytest.raises(RuntimeError):
+            run(g.call("vision", Flaky(failures=1), attempts=1))
+        assert g.state == CLOSED
+
+    def test_probe_after_reset_closes(self):
+        g = guard(breaker_failures=2, breaker_reset_seconds=30)
+        self.open_breaker(g)
+        g.clock.now += 31
+        assert g.state == HALF_OPEN
+        assert run(g.call("vision", Flaky())) == "ok"
+        assert g.state == CLOSED
+        assert metrics.get_counter("llm_breaker_transitions_total", guard="test", state="closed") == 1
+
+    def test_failed_probe_reopens_without_retry(self):
+        g = guard(breaker_failures=2, breaker_reset_seconds=30)
+        self.open_breaker(g)
+        g.clock.now += 31
+        fn = Flaky(failures=5)
+        with pytest.raises(RuntimeError):
+            run(g.call("vision", fn))
+        assert fn.calls == 1
+        assert g.state == OPEN
+
+
+class Answers:
+    """Vision backend answering the given responses in order"""
+    name = "test"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def extract_image(self, image_base64):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+class TestMalformedAnswer:
+
+    def test_malformed_answer_asked_again(self, monkeypatch):
+        g, backend = guard(breaker_failures=1), Answers("Désolé, je ne peux pas.", '{"montantTotal": 42.3}')
+        monkeypatch.setattr(ocr_service, "llm_guard", g)
+        monkeypatch.setattr(ocr_service, "get_backend", lambda: backend)
+
+        result = run(ocr_service.extract_invoice_data_with_openai("aW1n"))
+
+        assert result["success"] is True
+        assert result["data"]["montantTotal"] == 42.3
+        assert backend.calls == 2
+        assert g.state == CLOSED
+
+    def test_gives_up_after_max_attempts(self, monkeypatch):
+        g, backend = guard(max_attempts=3), Answers("pas du json", "toujours pas", "non")
+        monkeypatch.setattr(ocr_service, "llm_guard", g)
+        monkeypatch.setattr(ocr_service, "get_backend", lambda: backend)
+
+        result = run(ocr_service.extract_invoice_data_with_openai("aW1n"))
+
+        assert result["success"] is False
+        assert "unavailable" not in result
+        assert backend.calls == 3
+
+    def test_fallback_amount_returned_without_new_call(self, monkeypatch):
+        g, backend = guard(), Answers("Total: 42,30 EUR (pas de JSON)")
+        monkeypatch.setattr(ocr_service, "llm_guard", g)
+        monkeypatch.setattr(ocr_service, "get_backend", lambda: backend)
+
+        result = run(ocr_service.extract_invoice_data_with_openai("aW1n"))
+
+        assert result["success"] is True
+        assert backend.calls == 1
+
+
+class TestAnalyzeDocumentFallback:
+
+    def test_local_result_when_provider_down(self, monkeypatch):
+        g = guard(breaker_failures=1)
+        g._state = OPEN
+        g._opened_at = g.clock()
+
+        async def local_text(file_bytes, digest):
+            return "TAXI G7\nTOTAL TTC 42,30 EUR\n"
+
+        monkeypatch.setattr(ocr_service, "llm_guard", g)
+        monkeypatch.setattr(ocr_service, "local_ocr_text", local_text)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        result = run(ocr_service.analyze_document(buffer.getvalue(), "taxi.png", "image"))
+
+        assert result["success"] is True
+        assert result["data"]["extractionPath"] == "fallback"
+        assert result["data"]["montantTotal"] == 42.3
+        assert result["data"]["needsReview"] is True
+        assert metrics.get_counter("invoice_extraction_path_total", path="fallback") == 1
+
+
+class TestQuickReplies:
+
+    def test_provider_errors_fall_back_to_canned_replies(self, monkeypatch):
+        import httpx
+        import server
+
+        calls = []
+
+        async def failing_request(upstream, method, url, **kwargs):
+            calls.append(url)
+            return httpx.Response(503)
+
+        g = guard(breaker_failures=2)
+        monkeypatch.setenv("EMERGENT_LLM_KEY", "test-key")
+        monkeypatch.setattr(server, "llm_guard", g)
+        monkeypatch.setattr(server.http_client, "request", failing_request)
+        context = server.QuickReplyContext(channelType="coach", lastMessages=["On s'entraîne demain ?"], senderRole="coach")
+
+        first = run(server.generate_quick_replies(context))
+        assert first["replies"] == server.get_fallback_replies(context)
+        assert len(calls) == server.QUICK_REPLY_ATTEMPTS
+        assert g.state == OPEN
+
+        # Breaker open: canned replies at once, no provider call
+        run(server.generate_quick_replies(context))
+        assert len(calls) == server.QUICK_REPLY_ATTEMPTS
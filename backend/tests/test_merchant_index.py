@@ -0,0 +1,288 @@
+"""
+Merchant index test suite (services/merchant_index.py)
+- Supplier names are normalized (case, accents, punctuation, legal forms)
+- A saved category is found again for the same supplier and its OCR variants
+- The user's own entry wins; the global one needs several agreeing users
+- analyze_document applies the learned category, after the OCR cache shared
+  by all users; PUT /api/documents teaches it
+"""
+
+import io
+import asyncio
+from datetime import date
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from services import image_quality, merchant_index, metrics, ocr_cache, ocr_service
+from services.ocr_cache import MemoryTier
+from services.merchant_index import normalize_merchant, trigrams, similarity
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        value = doc.get(key)
+        if isinstance(expected, dict) and "$in" in expected:
+            values = value if isinstance(value, list) else [value]
+            if not set(values) & set(expected["$in"]):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class UpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, n):
+        return Cursor(self.docs[:n])
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        return Cursor([dict(d) for d in self.docs.values() if _matches(d, query)])
+
+    async def find_one(self, query, projection=None):
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                return dict(doc)
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        if doc is None:
+            if not upsert:
+                return UpdateResult(0)
+            doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        doc.update(update.get("$set", {}))
+        for path, value in update.get("$addToSet", {}).items():
+            field, label = path.split(".")
+            members = doc.setdefault(field, {}).setdefault(label, [])
+            if value not in members:
+                members.append(value)
+        for path, value in update.get("$pull", {}).items():
+            field, label = path.split(".")
+            members = doc.get(field, {}).get(label, [])
+            if value in members:
+                members.remove(value)
+        return UpdateResult(1)
+
+
+class FakeDB:
+    def __init__(self):
+        self.merchant_categories = FakeCollection()
+        self.documents = FakeCollection()
+
+
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(merchant_index, "db", db)
+    metrics.reset()
+    return db
+
+
+class TestNormalization:
+
+    @pytest.mark.parametrize("name, key", [
+        ("Hôtel IBIS S.A.S.", "hotel ibis"),
+        ("  DECATHLON - Paris 15 ", "decathlon paris 15"),
+        ("Le Café de la Gare SARL", "cafe gare"),
+        ("S.A.", ""),
+        (None, ""),
+    ])
+    def test_normalize(self, name, key):
+        assert normalize_merchant(name) == key
+
+    def test_similarity(self):
+        assert similarity(trigrams("decathlon"), trigrams("decathlon")) == 1.0
+        assert similarity(trigrams("decathlon"), trigrams("decath1on")) > 0.6
+        assert similarity(trigrams("decathlon"), trigrams("pharmacie parc")) < 0.2
+
+
+class TestLearnAndLookup:
+
+    def test_user_category_found_exactly_and_fuzzily(self):
+        run(merchant_index.learn("u1", "Cordages Pro SARL", "equipment", "12 rue du Tennis"))
+
+        exact = run(merchant_index.lookup("u1", "CORDAGES PRO"))
+        assert (exact.scope, exact.category, exact.score) == ("user", "Matériel", 1.0)
+        assert exact.template == {"adresse": "12 rue du Tennis"}
+
+        fuzzy = run(merchant_index.lookup("u1", "C0RDAGES PR0 "))
+        assert fuzzy is not None and fuzzy.category == "Matériel" and fuzzy.score < 1.0
+        assert run(merchant_index.lookup("u1", "Pharmacie du Parc")) is None
+        assert metrics.get_counter("merchant_index_lookups_total", result="miss") == 1
+
+    def test_latest_user_correction_wins(self):
+        run(merchant_index.learn("u1", "Stringer Lab", "services"))
+        run(merchant_index.learn("u1", "Stringer Lab", "equipment"))
+        assert run(merchant_index.lookup("u1", "Stringer Lab")).category == "Matériel"
+
+    def test_global_needs_agreeing_users(self):
+        run(merchant_index.learn("u1", "Hôtel Ibis", "Hébergement"))
+        # One user only: not shared
+        assert run(merchant_index.lookup("u9", "Hotel Ibis")) is None
+
+        run(merchant_index.learn("u2", "HOTEL IBIS", "accommodation"))
+        match = run(merchant_index.lookup("u9", "Hotel Ibis"))
+        assert (match.scope, match.category, match.name) == ("*", "Hébergement", None)
+
+        # u2 changes their mind: no majority left
+        run(merchant_index.learn("u2", "Hotel Ibis", "travel"))
+        assert run(merchant_index.lookup("u9", "Hotel Ibis")) is None
+
+    def test_user_entry_beats_global(self):
+        for user in ("u1", "u2", "u3"):
+            run(merchant_index.learn(user, "Air France", "travel"))
+        run(merchant_index.learn("u4", "Air France", "services"))
+        assert run(merchant_index.lookup("u4", "AIR FRANCE")).category == "Services"
+        assert run(merchant_index.lookup("u5", "AIR FRANCE")).category == "Transport"
+
+    def test_nothing_learned_for_other_or_anonymous(self, fake_db):
+        run(merchant_index.learn("u1", "Boulangerie", "other"))
+        run(merchant_index.learn(None, "Boulangerie", "restaurant"))
+        run(merchant_index.learn("u1", "", "restaurant"))
+        assert fake_db.merchant_categories.docs == {}
+
+    def test_disabled(self, monkeypatch):
+        run(merchant_index.learn("u1", "Stringer Lab", "equipment"))
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+        assert run(merchant_index.lookup("u1", "Stringer Lab")) is None
+
+
+class TestAnalyzeDocument:
+
+    def test_learned_category_replaces_model_guess(self, monkeypatch):
+        async def fake_vision(image_base64):
+            return {"success": True, "data": {"montantTotal": 80.0, "fournisseur": "CORDAGES PRO", "categorie": "Services"}}
+
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        run(merchant_index.learn("u1", "Cordages Pro", "equipment", "12 rue du Tennis"))
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        learned = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u1"))
+        unknown_user = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u2"))
+
+        assert learned["data"]["categorie"] == "Matériel"
+        assert learned["data"]["categorySource"] == "merchant_index"
+        assert learned["data"]["fournisseur"] == "Cordages Pro"
+        assert learned["data"]["adresse"] == "12 rue du Tennis"
+        assert unknown_user["data"]["categorie"] == "Services"
+        assert "categorySource" not in unknown_user["data"]
+
+    def test_known_supplier_skips_vision_without_caching(self, monkeypatch):
+        # 0.9 < 0.95 escalates; u1's learned category (+0.1) keeps it local, for u1 only
+        text = f"ATELIER DUBOIS\n{date.today():%d/%m/%Y}\nTOTAL 24,00\n"
+        vision_calls = []
+
+        class Pool:
+            async def run(self, source):
+                return {"text": text, "error": None, "timings": {}, "started_at": 0.0}
+
+        async def fake_vision(image_base64):
+            vision_calls.append(image_base64)
+            return {"success": True, "data": {"montantTotal": 24.0, "fournisseur": "ATELIER DUBOIS", "categorie": "Autre"}}
+
+        memory = MemoryTier()
+        monkeypatch.setattr(ocr_service, "receipt_ocr_pool", Pool())
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_MIN_CONFIDENCE", 0.95)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", True)
+        monkeypatch.setattr(ocr_cache, "memory", memory)
+        monkeypatch.setattr(ocr_cache, "db", None)
+        run(merchant_index.learn("u1", "Atelier Dubois", "equipment"))
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        known = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u1"))
+        assert vision_calls == []
+        assert (known["data"]["extractionPath"], known["data"]["categorie"]) == ("local", "Matériel")
+        assert known["data"]["categorySource"] == "merchant_index"
+        # Only the Tesseract text is cached, not u1's result
+        assert len(memory) == 1
+
+        other = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u2"))
+        assert len(vision_calls) == 1
+        assert (other["data"]["extractionPath"], other["data"]["categorie"]) == ("vision", "Autre")
+
+        # The cached Vision result, with u1's category applied on top
+        again = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u1"))
+        assert len(vision_calls) == 1
+        assert (again["data"]["extractionPath"], again["data"]["categorie"]) == ("vision", "Matériel")
+
+    def test_same_file_two_users(self, monkeypatch):
+        text = "ATELIER DUBOIS\n12/03/2024\nTOTAL 24,00\n"
+        ocr_calls = []
+
+        class Pool:
+            async def run(self, source):
+                ocr_calls.append(source)
+                return {"text": text, "error": None, "timings": {}, "started_at": 0.0}
+
+        monkeypatch.setattr(ocr_service, "receipt_ocr_pool", Pool())
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", True)
+        monkeypatch.setattr(ocr_cache, "memory", MemoryTier())
+        monkeypatch.setattr(ocr_cache, "db", None)
+        run(merchant_index.learn("u1", "Atelier Dubois SARL", "equipment", "3 rue des Lices"))
+        run(merchant_index.learn("u2", "ATELIER DUBOIS", "services"))
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        first = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u1"))
+        second = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image", user_id="u2"))
+        anonymous = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image"))
+
+        assert len(ocr_calls) == 1
+        assert (first["data"]["categorie"], first["data"]["fournisseur"], first["data"]["adresse"]) == \
+            ("Matériel", "Atelier Dubois SARL", "3 rue des Lices")
+        assert (second["data"]["categorie"], second["data"]["fournisseur"]) == ("Services", "ATELIER DUBOIS")
+        assert not second["data"].get("adresse")
+        assert anonymous["data"]["categorie"] == "Autre"
+        assert "categorySource" not in anonymous["data"]
+        assert anonymous["data"]["fournisseur"] != "Atelier Dubois SARL"
+
+
+class TestCorrections:
+
+    def test_put_category_teaches_the_index(self, fake_db, monkeypatch):
+        from routes import documents
+
+        monkeypatch.setattr(documents, "db", fake_db)
+        document_id = ObjectId()
+        fake_db.documents.docs[document_id] = {"_id": document_id, "name": "ticket", "category": "other",
+                                               "fournisseur": "Stringer Lab", "userId": "u1"}
+
+        app = FastAPI()
+        app.include_router(documents.router)
+        with TestClient(app) as client:
+            response = client.put(f"/api/documents/{document_id}", json={"category": "equipment"})
+
+        assert response.status_code == 200
+        assert run(merchant_index.lookup("u1", "stringer lab")).category == "Matériel"
+        assert metrics.get_counter("merchant_index_corrections_total") == 1
@@ -0,0 +1,129 @@
+"""
+OCR backend test suite (services/ocr_backends.py)
+- OCR_BACKEND selects the backend; unknown names are refused, others can be registered
+- The stub answers deterministically, after its latency, with its error rate
+- The local backend answers in the Vision JSON format
+- analyze_document goes through the configured backend, under its own cache namespace
+"""
+
+import io
+import json
+import time
+import asyncio
+
+import pytest
+from PIL import Image
+
+from services import image_quality, merchant_index, metrics, ocr_backends, ocr_cache, ocr_service
+from services.ocr_backends import OcrBackend, StubBackend, get_backend, register_backend
+from services.llm_guard import LlmGuard
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fresh_backends(monkeypatch):
+    monkeypatch.setattr(ocr_backends, "_instances", {})
+    monkeypatch.setattr(ocr_backends, "_FACTORIES", dict(ocr_backends._FACTORIES))
+    metrics.reset()
+
+
+class TestSelection:
+
+    def test_configured_backend_created_once(self, monkeypatch):
+        monkeypatch.setattr(ocr_backends, "OCR_BACKEND", "stub")
+        assert isinstance(get_backend(), StubBackend)
+        assert get_backend() is get_backend()
+        assert get_backend("local").name == "local"
+
+    def test_unknown_backend_refused(self, monkeypatch):
+        monkeypatch.setattr(ocr_backends, "OCR_BACKEND", "tesla")
+        with pytest.raises(ValueError, match="tesla"):
+            get_backend()
+
+    def test_register_backend(self):
+        class Echo(OcrBackend):
+            name = "echo"
+
+            async def extract_image(self, image_base64):
+                return image_base64
+
+            async def extract_text(self, text):
+                return text
+
+        register_backend("echo", Echo)
+        assert run(get_backend("echo").extract_text("{}")) == "{}"
+
+    def test_incomplete_backend_refused(self):
+        class TextOnly(OcrBackend):
+            async def extract_text(self, text):
+                return text
+
+        with pytest.raises(TypeError, match="extract_image"):
+            TextOnly()
+
+
+class TestStub:
+
+    def test_deterministic_answer(self):
+        stub = StubBackend(latency_ms=0)
+        first = json.loads(run(stub.extract_image("aGVsbG8=")))
+        assert first == json.loads(run(stub.extract_image("aGVsbG8=")))
+        assert first != json.loads(run(stub.extract_image("d29ybGQ=")))
+        assert first["fournisseur"] in StubBackend.merchants
+        assert first["montantTotal"] == pytest.approx(first["montantHT"] + first["montantTVA"])
+
+    def test_latency_and_jitter(self):
+        stub = StubBackend(latency_ms=50, jitter_ms=20)
+        started = time.perf_counter()
+        run(stub.extract_text("ticket"))
+        assert 0.03 <= time.perf_counter() - started < 0.5
+
+    def test_error_rate(self):
+        async def answers(stub):
+            outcomes = await asyncio.gather(*(stub.extract_text(f"ticket {i}") for i in range(200)),
+                                            return_exceptions=True)
+            return sum(isinstance(o, RuntimeError) for o in outcomes)
+
+        assert run(answers(StubBackend(latency_ms=0, error_rate=0))) == 0
+        assert 40 <= run(answers(StubBackend(latency_ms=0, error_rate=0.3))) <= 80
+        assert run(answers(StubBackend(latency_ms=0, error_rate=1))) == 200
+
+
+class TestLocal:
+
+    def test_text_answer_in_vision_format(self):
+        answer = json.loads(run(get_backend("local").extract_text("TAXI G7\n12/03/2024\nTOTAL TTC 42,30 EUR\n")))
+        assert answer["montantTotal"] == 42.3
+        assert answer["dateFacture"] == "12/03/2024"
+        assert set(answer) >= {"fournisseur", "categorie", "lignes", "confidence"}
+
+
+class TestAnalyzeDocument:
+
+    def test_stub_backend_result_and_cache_namespace(self, monkeypatch):
+        pipelines = []
+
+        async def cache_get(pipeline, digest):
+            pipelines.append(pipeline)
+
+        monkeypatch.setattr(ocr_backends, "OCR_BACKEND", "stub")
+        monkeypatch.setattr(ocr_backends, "OCR_STUB_LATENCY_MS", 0)
+        monkeypatch.setattr(ocr_service, "llm_guard", LlmGuard("test"))
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "get", cache_get)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        result = run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image"))
+
+        assert result["success"] is True
+        assert result["data"]["extractionPath"] == "vision"
+        assert result["data"]["fournisseur"] in StubBackend.merchants
+        assert pipelines == [f"{ocr_service.PIPELINE_VERSION}+stub/image"]
+        assert metrics.get_counter("llm_calls_total", guard="test", operation="vision", result="success") == 1
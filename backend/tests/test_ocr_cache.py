@@ -0,0 +1,149 @@
+"""
+OCR result cache test suite (services/ocr_cache.py)
+- Keys are the file's SHA-256 plus the pipeline version
+- Memory tier is LRU-bounded; Mongo hits refill it
+- Returned results are copies; Mongo errors degrade to misses
+- analyze_document serves repeats from the cache without a Vision call
+- The filename category hint applies per upload, never to the cached result
+"""
+
+import asyncio
+import hashlib
+
+import pytest
+
+from services import image_quality, merchant_index, metrics, ocr_cache, ocr_service
+from services.ocr_cache import MemoryTier
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.docs = {}
+        self.fail = fail
+
+    async def find_one(self, query, projection=None):
+        if self.fail:
+            raise Exception("connection refused")
+        return self.docs.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        if self.fail:
+            raise Exception("connection refused")
+        self.docs[query["_id"]] = dict(update["$set"])
+
+
+class FakeDB:
+    def __init__(self, fail=False):
+        self.ocr_cache = FakeCollection(fail)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr(ocr_cache, "memory", MemoryTier(max_entries=2, ttl_seconds=60))
+    monkeypatch.setattr(ocr_cache, "db", FakeDB())
+    yield
+
+
+class TestOCRCache:
+
+    def test_digest(self):
+        assert run(ocr_cache.file_digest(b"receipt")) == hashlib.sha256(b"receipt").hexdigest()
+
+    def test_digest_of_path(self, tmp_path):
+        path = tmp_path / "receipt.png"
+        path.write_bytes(b"receipt")
+        assert run(ocr_cache.file_digest(str(path))) == hashlib.sha256(b"receipt").hexdigest()
+
+    def test_put_then_get(self):
+        run(ocr_cache.put("p1", "abc", {"text": "TOTAL 12,00"}))
+        assert run(ocr_cache.get("p1", "abc")) == {"text": "TOTAL 12,00"}
+        assert metrics.get_counter("ocr_cache_lookups_total", pipeline="p1", result="memory_hit") == 1
+
+    def test_pipeline_version_is_part_of_key(self):
+        run(ocr_cache.put("p1", "abc", {"text": "x"}))
+        assert run(ocr_cache.get("p2", "abc")) is None
+
+    def test_mongo_hit_refills_memory(self):
+        run(ocr_cache.put("p1", "abc", {"text": "x"}))
+        ocr_cache.memory.clear()
+        assert run(ocr_cache.get("p1", "abc")) == {"text": "x"}
+        assert metrics.get_counter("ocr_cache_lookups_total", pipeline="p1", result="mongo_hit") == 1
+        assert len(ocr_cache.memory) == 1
+
+    def test_memory_tier_is_lru_bounded(self):
+        for digest in ("a", "b", "c"):
+            run(ocr_cache.put("p1", digest, {"text": digest}))
+        assert len(ocr_cache.memory) == 2
+        assert ocr_cache.memory.get("p1:a") is None
+
+    def test_results_are_copies(self):
+        run(ocr_cache.put("p1", "abc", {"data": {"categorie": "Autre"}}))
+        first = run(ocr_cache.get("p1", "abc"))
+        first["data"]["categorie"] = "Transport"
+        assert run(ocr_cache.get("p1", "abc")) == {"data": {"categorie": "Autre"}}
+
+    def test_mongo_errors_are_misses(self, monkeypatch):
+        monkeypatch.setattr(ocr_cache, "db", FakeDB(fail=True))
+        run(ocr_cache.put("p1", "abc", {"text": "x"}))
+        ocr_cache.memory.clear()
+        assert run(ocr_cache.get("p1", "abc")) is None
+
+
+class TestAnalyzeDocumentCache:
+
+    def test_repeat_analysis_skips_vision_call(self, monkeypatch):
+        calls = []
+
+        async def fake_vision(image_base64):
+            calls.append(image_base64)
+            return {"success": True, "data": {"montantTotal": 42.0, "categorie": "Autre", "fournisseur": "Boutique"}}
+
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+        png = _png_bytes()
+
+        first = run(ocr_service.analyze_document(png, "facture.png", "image"))
+        second = run(ocr_service.analyze_document(png, "taxi.png", "image"))
+
+        assert len(calls) == 1
+        assert first["data"]["montantTotal"] == second["data"]["montantTotal"] == 42.0
+        # The filename still hints the category of a cached result
+        assert second["data"]["categorie"] == "Transport"
+
+    def test_filename_hint_not_cached(self, monkeypatch):
+        class Backend:
+            name = "test"
+
+            async def extract_image(self, image_base64):
+                return '{"montantTotal": 42.0, "categorie": "Autre", "fournisseur": "Boutique"}'
+
+        monkeypatch.setattr(ocr_service, "get_backend", Backend)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+        png = _png_bytes()
+
+        first = run(ocr_service.analyze_document(png, "hotel.png", "image"))
+        second = run(ocr_service.analyze_document(png, "ticket.png", "image"))
+
+        assert first["data"]["categorie"] == "Hébergement"
+        # The first uploader's filename does not follow the file into the cache
+        assert second["data"]["extractionPath"] == "vision"
+        assert second["data"]["categorie"] == "Autre"
+        cached = run(ocr_cache.get(f"{ocr_service.PIPELINE_VERSION}+test/image", hashlib.sha256(png).hexdigest()))
+        assert cached["data"]["categorie"] == "Autre"
+
+
+def _png_bytes() -> bytes:
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
@@ -0,0 +1,285 @@
+"""
+Lazy PDF rendering test suite (services/ocr_service.PdfDocument)
+- Page count and sizes come from pdfinfo metadata, nothing is rasterized up front
+- Only requested pages are rendered, once, at a DPI adapted to the page size
+- analyze_document renders only the first page and reports the real page count
+- ?multipage=true extracts the pages concurrently, merges their lines and takes
+  the total from the page that supports it best
+- Digital PDFs are extracted from their text layer, without rendering or Vision call
+"""
+
+import asyncio
+import base64
+import io
+import os
+import time
+
+import pdf2image
+import pytest
+from PIL import Image
+
+from services import merchant_index, metrics, ocr_cache, ocr_service
+from services.ocr_service import PdfDocument, text_layer_is_usable
+
+A4 = "595.276 x 841.89 pts (A4)"
+A3 = "841.89 x 1190.55 pts (A3)"
+RECEIPT = "226.77 x 566.93 pts"
+
+INVOICE_TEXT = """
+    DECATHLON PRO                                   Facture N° F-2024-0117
+    12 rue du Sport, 75011 Paris                    Date : 14/03/2024
+
+    Désignation                      Qté     PU HT       Montant HT
+    Raquette Pure Aero                 1    166,58           166,58
+    Cordage RPM Blast 12m              2     12,50            25,00
+
+                                             Total HT         191,58
+                                             TVA 20%           38,32
+                                             Total TTC        229,90
+"""
+
+
+class FakePoppler:
+    """pdfinfo / pdftoppm stand-ins recording what was asked"""
+
+    def __init__(self, pages, sizes):
+        self.pages = pages
+        self.sizes = sizes
+        self.rendered = []
+        self.paths = []
+        self.text = ""
+
+    def pdfinfo_from_path(self, path, first_page=None, last_page=None, **kwargs):
+        self.paths.append(path)
+        info = {"Pages": self.pages}
+        if first_page is None:
+            info["Page size"] = self.sizes[1]
+        else:
+            for page in range(first_page, last_page + 1):
+                info[f"Page{page:5d} size"] = self.sizes[page]
+        return info
+
+    def convert_from_path(self, path, dpi=200, first_page=None, last_page=None, **kwargs):
+        self.rendered.append((first_page, dpi))
+        # Page number readable back from the image width
+        return [Image.new("RGB", (10 * first_page, 10), "white")]
+
+
+@pytest.fixture
+def poppler(monkeypatch):
+    fake = FakePoppler(pages=12, sizes={1: A4, 2: A3, 3: RECEIPT})
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_path", fake.pdfinfo_from_path)
+    monkeypatch.setattr(pdf2image, "convert_from_path", fake.convert_from_path)
+    monkeypatch.setattr(PdfDocument, "text", lambda self, first_page=1, last_page=None: fake.text)
+    return fake
+
+
+class TestPdfDocument:
+
+    def test_page_count_without_rendering(self, poppler):
+        with PdfDocument(b"%PDF-1.4") as pdf:
+            assert pdf.page_count == 12
+        assert poppler.rendered == []
+
+    def test_renders_requested_page_once(self, poppler):
+        with PdfDocument(b"%PDF-1.4") as pdf:
+            first = pdf.render(1)
+            assert pdf.render(1) is first
+        assert poppler.rendered == [(1, 205)]
+
+    def test_dpi_adapts_to_page_size(self, poppler):
+        with PdfDocument(b"%PDF-1.4") as pdf:
+            assert pdf.dpi_for(1) == 205  # A4: ~2400px long side
+            assert pdf.dpi_for(2) == 145  # A3 rendered at lower DPI
+            assert pdf.dpi_for(3) == 300  # Small receipt page, capped
+
+    def test_page_out_of_range(self, poppler):
+        with PdfDocument(b"%PDF-1.4") as pdf:
+            with pytest.raises(ValueError):
+                pdf.render(13)
+
+    def test_temp_file_removed(self, poppler):
+        with PdfDocument(b"%PDF-1.4") as pdf:
+            assert os.path.exists(pdf.path)
+        assert not os.path.exists(pdf.path)
+
+
+class TestTextLayer:
+
+    def test_digital_invoice_is_usable(self):
+        assert text_layer_is_usable(INVOICE_TEXT)
+
+    def test_scanned_pdf_is_not_usable(self):
+        assert not text_layer_is_usable("")
+        assert not text_layer_is_usable("  \f\n  Page 1  \f")
+
+    def test_text_without_amount_is_not_usable(self):
+        assert not text_layer_is_usable("Conditions générales de vente. " * 10)
+
+    def test_broken_font_encoding_is_not_usable(self):
+        assert not text_layer_is_usable("\ufffd\x07\x08" * 60 + " 12,00")
+
+
+class TestAnalyzeDocumentPdf:
+
+    @pytest.fixture
+    def extractors(self, monkeypatch):
+        calls = {"vision": 0, "text": []}
+
+        async def fake_vision(image_base64):
+            calls["vision"] += 1
+            return {"success": True, "data": {"montantTotal": 99.0, "categorie": "Services"}}
+
+        async def fake_text(text):
+            calls["text"].append(text)
+            return {"success": True, "data": {"montantTotal": 229.9 if "229,90" in text else None, "categorie": "Matériel"}}
+
+        metrics.reset()
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_from_text", fake_text)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        return calls
+
+    def analyze(self):
+        return asyncio.run(ocr_service.analyze_document(b"%PDF-1.4 invoice", "facture.pdf", "pdf"))
+
+    def test_only_first_page_rendered(self, poppler, extractors):
+        result = self.analyze()
+
+        assert result["data"]["pageCount"] == 12
+        assert result["data"]["fileType"] == "pdf"
+        assert result["data"]["extractionPath"] == "vision"
+        assert [page for page, _ in poppler.rendered] == [1]
+
+    def test_text_layer_skips_rendering_and_vision(self, poppler, extractors):
+        poppler.text = INVOICE_TEXT
+
+        result = self.analyze()
+
+        assert result["data"]["montantTotal"] == 229.9
+        assert result["data"]["extractionPath"] == "text"
+        assert result["data"]["pageCount"] == 12
+        assert poppler.rendered == []
+        assert extractors["vision"] == 0
+        assert metrics.get_counter("invoice_extraction_path_total", path="text") == 1
+
+    def test_incomplete_text_extraction_falls_back_to_vision(self, poppler, extractors):
+        poppler.text = INVOICE_TEXT.replace("229,90", "")
+
+        result = self.analyze()
+
+        assert len(extractors["text"]) == 1
+        assert extractors["vision"] == 1
+        assert result["data"]["extractionPath"] == "vision"
+
+    def test_scanned_pdf_goes_to_vision(self, poppler, extractors):
+        result = self.analyze()
+
+        assert extractors["text"] == []
+        assert extractors["vision"] == 1
+        assert metrics.get_counter("invoice_extraction_path_total", path="vision") == 1
+
+
+class TestMultipage:
+
+    PAGES = {
+        1: {"fournisseur": "Hôtel du Port", "numeroFacture": "F-881", "dateFacture": "02/05/2024",
+            "montantTotal": 120.0, "categorie": "Hébergement", "confidence": 0.6,
+            "lignes": [{"description": "Nuit 1", "montant": 120.0}]},
+        2: {"montantTotal": 262.0, "montantHT": 238.18, "montantTVA": 23.82, "confidence": 0.6,
+            "lignes": [{"description": "Nuit 2", "montant": 120.0}, {"description": "Petit-déjeuner", "montant": 22.0}]},
+        3: {"categorie": "Autre", "confidence": 0.3, "lignes": []},
+    }
+
+    @pytest.fixture
+    def vision(self, monkeypatch):
+        calls = []
+
+        async def fake_vision(image_base64):
+            page = Image.open(io.BytesIO(base64.b64decode(image_base64))).width // 10
+            calls.append(page)
+            await asyncio.sleep(0.2)
+            if self.PAGES[page] is None:
+                return {"success": False, "error": "Réponse JSON invalide"}
+            return {"success": True, "data": dict(self.PAGES[page])}
+
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        return calls
+
+    def analyze(self, multipage=True):
+        return asyncio.run(ocr_service.analyze_document(b"%PDF-1.4 folio", "folio.pdf", "pdf", multipage=multipage))
+
+    def test_pages_merged(self, poppler, vision):
+        poppler.pages = 3
+
+        started = time.perf_counter()
+        data = self.analyze()["data"]
+        elapsed = time.perf_counter() - started
+
+        assert sorted(vision) == [1, 2, 3]
+        assert sorted(page for page, _ in poppler.rendered) == [1, 2, 3]
+        # Concurrent calls: about one page of latency, not three
+        assert elapsed < 0.5
+        assert (data["montantTotal"], data["montantHT"], data["totalPage"]) == (262.0, 238.18, 2)
+        assert (data["fournisseur"], data["numeroFacture"], data["categorie"]) == ("Hôtel du Port", "F-881", "Hébergement")
+        assert [ligne["description"] for ligne in data["lignes"]] == ["Nuit 1", "Nuit 2", "Petit-déjeuner"]
+        assert (data["pageCount"], data["pagesAnalyzed"]) == (3, 3)
+        assert data["needsReview"] is True
+        assert any("page 2" in warning for warning in data["warnings"])
+
+    def test_pages_capped(self, poppler, vision, monkeypatch):
+        monkeypatch.setattr(ocr_service, "PDF_MULTIPAGE_MAX_PAGES", 2)
+        data = self.analyze()["data"]
+        assert sorted(vision) == [1, 2]
+        assert (data["pageCount"], data["pagesAnalyzed"]) == (12, 2)
+
+    def test_failed_page_ignored(self, poppler, vision, monkeypatch):
+        poppler.pages = 3
+        monkeypatch.setitem(self.PAGES, 3, None)
+        data = self.analyze()["data"]
+        assert data["montantTotal"] == 262.0 and data["pagesAnalyzed"] == 3
+
+    def test_off_by_default(self, poppler, vision):
+        data = self.analyze(multipage=False)["data"]
+        assert vision == [1]
+        assert "pagesAnalyzed" not in data
+
+
+class TestMergePageResults:
+
+    def page(self, **data):
+        return {"success": True, "data": data}
+
+    def test_consistent_total_wins(self):
+        merged = ocr_service.merge_page_results([
+            self.page(montantTotal=50.0, confidence=0.9),
+            self.page(montantTotal=60.0, montantHT=50.0, montantTVA=10.0, confidence=0.5),
+        ])["data"]
+        assert (merged["montantTotal"], merged["totalPage"]) == (60.0, 2)
+
+    def test_lines_sum_supports_total(self):
+        lignes = [{"description": "Repas", "montant": 30.0}, {"description": "Vin", "montant": 12.0}]
+        merged = ocr_service.merge_page_results([
+            self.page(montantTotal=42.0, lignes=lignes[:1], confidence=0.5),
+            self.page(montantTotal=30.0, lignes=lignes[1:], confidence=0.5),
+        ])["data"]
+        assert merged["montantTotal"] == 42.0
+
+    def test_repeated_lines_kept(self):
+        # 3-night folio: the same nightly line once on page 1, twice on page 2
+        nuitee = {"description": "Nuitée chambre double", "quantite": 1, "prixUnitaire": 120.0, "montant": 120.0}
+        merged = ocr_service.merge_page_results([
+            self.page(montantTotal=120.0, lignes=[dict(nuitee)], confidence=0.5),
+            self.page(montantTotal=360.0, lignes=[dict(nuitee), dict(nuitee)], confidence=0.5),
+        ])["data"]
+        assert len(merged["lignes"]) == 3
+        assert sum(ligne["montant"] for ligne in merged["lignes"]) == merged["montantTotal"] == 360.0
+
+    def test_all_pages_failed(self):
+        unavailable = {"success": False, "unavailable": True, "error": "Service indisponible"}
+        assert ocr_service.merge_page_results([{"success": False, "error": "x"}, unavailable]) is unavailable
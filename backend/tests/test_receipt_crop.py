@@ -0,0 +1,98 @@
+"""
+Receipt auto-crop and deskew test suite (services/receipt_crop.py)
+- The receipt is found on the table, straightened and cropped, in grayscale
+- Rotation is recovered within half a degree
+- Scans / PDF pages are deskewed but not cropped
+- Frames without paper are only converted to grayscale
+"""
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from services import receipt_crop
+from services.receipt_crop import crop_receipt, detect_receipt, otsu_threshold
+
+TABLE = (120, 86, 60)
+PAPER = (246, 243, 236)
+
+
+def receipt(lines=14) -> Image.Image:
+    image = Image.new("RGB", (440, 90 + 30 * lines), PAPER)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=18)
+    for i in range(lines):
+        draw.text((30, 40 + i * 30), f"Article {i:02d}   Raquette   {12 + i},50 EUR", fill=(40, 40, 48), font=font)
+    return image
+
+
+def photo(angle=0.0, seed=0) -> Image.Image:
+    """Receipt rotated by angle (counterclockwise) on a table, uneven light and noise"""
+    rng = np.random.default_rng(seed)
+    paper = receipt().rotate(angle, Image.Resampling.BICUBIC, expand=True, fillcolor=TABLE)
+    frame = Image.new("RGB", (1600, 1200), TABLE)
+    frame.paste(paper, ((1600 - paper.width) // 2, (1200 - paper.height) // 2))
+    pixels = np.asarray(frame, dtype=np.float32)
+    light = np.linspace(1.05, 0.75, frame.width, dtype=np.float32)[None, :, None]
+    noisy = pixels * light + rng.normal(0, 5, pixels.shape)
+    return Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+
+
+class TestOtsu:
+
+    def test_separates_two_levels(self):
+        pixels = np.array([30] * 100 + [220] * 100, dtype=np.uint8)
+        assert 30 <= otsu_threshold(pixels) < 220
+
+
+class TestDetectReceipt:
+
+    @pytest.mark.parametrize("angle", [0.0, 2.0, -5.0, 12.0, -20.0])
+    def test_rotation_recovered(self, angle):
+        geometry = detect_receipt(photo(angle).convert("L"))
+        assert geometry.angle == pytest.approx(-angle, abs=0.5)
+        assert geometry.crop_box is not None
+
+    def test_scan_is_deskewed_not_cropped(self):
+        page = Image.new("RGB", (1240, 1754), "white")
+        page.paste(receipt(30).resize((1100, 1600)), (70, 77))
+        skewed = page.rotate(2.0, Image.Resampling.BICUBIC, fillcolor="white")
+        geometry = detect_receipt(skewed.convert("L"))
+        assert geometry.crop_box is None and geometry.final_box is None
+        assert geometry.angle == pytest.approx(-2.0, abs=0.5)
+
+    def test_no_paper_found(self):
+        geometry = detect_receipt(Image.new("L", (800, 600), 20))
+        assert geometry.crop_box is None and geometry.angle == 0.0
+
+
+class TestCropReceipt:
+
+    def test_cropped_to_receipt_in_grayscale(self):
+        frame = photo(7.0)
+        cropped = crop_receipt(frame)
+        assert cropped.mode == "L"
+        # Receipt is 440x510 on a 1600x1200 frame
+        assert 400 <= cropped.width <= 520 and 470 <= cropped.height <= 600
+        # Mostly paper once cropped
+        assert np.mean(np.asarray(cropped) > 150) > 0.8
+
+    def test_max_size(self):
+        cropped = crop_receipt(photo(-5.0), max_size=300)
+        assert max(cropped.size) <= 310
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(receipt_crop, "AUTO_CROP_ENABLED", False)
+        cropped = crop_receipt(photo(7.0))
+        assert cropped.size == (1600, 1200) and cropped.mode == "L"
+
+    def test_exif_orientation_applied(self):
+        import io
+        frame = photo().transpose(Image.Transpose.ROTATE_90)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotate 90 CW to display
+        buffer = io.BytesIO()
+        frame.save(buffer, format="JPEG", exif=exif)
+        cropped = crop_receipt(Image.open(io.BytesIO(buffer.getvalue())))
+        # Displayed upright: the receipt is taller than wide again
+        assert cropped.height > cropped.width
@@ -0,0 +1,130 @@
+"""
+Receipt field extractor test suite (services/receipt_extractor.py)
+- Amount: largest qualifying money token (2+ integer digits, $, total keyword)
+- Date: priority DD/MM/YYYY > YYYY-MM-DD > DD month YYYY > DD mon. YYYY
+- Merchant: first usable line among the first 5
+- Category: travel > medical > invoices
+- Same results as the previous per-field functions, except where their matches overlapped
+"""
+
+import os
+import sys
+
+import pytest
+
+from services.receipt_extractor import extract_receipt_fields, extract_merchant
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+# Verbatim copy of the previous server.py functions, kept by the benchmark
+from bench_receipt_extractor import DEFAULT_CORPUS, load_corpus, previous_extract  # noqa: E402
+
+
+class TestAmount:
+
+    def test_largest_amount_wins(self):
+        text = "MONOPRIX\nLait 1,15\nSous total 10,04\nTOTAL 9,04\nEspeces 10,00"
+        assert extract_receipt_fields(text)["amount"] == 10.04
+
+    def test_single_digit_amount_needs_context(self):
+        assert extract_receipt_fields("Boulangerie\nbaguette 1,30")["amount"] is None
+        assert extract_receipt_fields("Boulangerie\nTotal 3,70")["amount"] == 3.70
+        assert extract_receipt_fields("Boulangerie\n3.70 $")["amount"] == 3.70
+        assert extract_receipt_fields("Boulangerie\n$ 3.70")["amount"] == 3.70
+
+    def test_total_keyword_before_amount_on_next_line(self):
+        assert extract_receipt_fields("Laverie\nSolde\n8,50")["amount"] == 8.50
+
+    def test_line_keyword_does_not_leak_to_next_line(self):
+        assert extract_receipt_fields("Cafe\nTTC\nrendu 4,20")["amount"] is None
+
+    def test_line_keyword_qualifies_only_the_next_amount(self):
+        assert extract_receipt_fields("solde net à payer 0,00 100000,01 3.70 total 0,00")["amount"] is None
+        assert extract_receipt_fields("tva incluse totaux 1,15 lait 3.70 0,00")["amount"] == 1.15
+
+    def test_out_of_range_ignored(self):
+        assert extract_receipt_fields("Garage\nTotal 250000,00")["amount"] is None
+
+
+class TestDate:
+
+    def test_dmy(self):
+        assert extract_receipt_fields("Taxi\nCourse du 2/5/2024")["date"] == "02/05/2024"
+
+    def test_invalid_dmy_falls_back_to_iso(self):
+        text = "Chez Marcel\n32/13/2024\nTotal 22.50\n2024-09-30"
+        assert extract_receipt_fields(text)["date"] == "30/09/2024"
+
+    def test_dmy_has_priority_over_earlier_iso(self):
+        text = "Hotel\nArrivee 2024-04-10\nLe 12/04/2024"
+        assert extract_receipt_fields(text)["date"] == "12/04/2024"
+
+    def test_month_names(self):
+        assert extract_receipt_fields("Amazon\nle 12 septembre 2024")["date"] == "12/09/2024"
+        assert extract_receipt_fields("Cabinet\nLe 4 oct. 2024")["date"] == "04/10/2024"
+        assert extract_receipt_fields("SNCF\ndepart 15 juil 2024")["date"] == "15/07/2024"
+
+    def test_no_date(self):
+        assert extract_receipt_fields("Boulangerie\nTotal 3,70")["date"] is None
+
+
+class TestMerchantAndCategory:
+
+    def test_merchant_skips_header_lines(self):
+        text = "12/05/2024\nTicket de caisse\nle petit bistrot\nTotal 12,00"
+        assert extract_merchant(text) == "Le Petit Bistrot"
+
+    def test_merchant_only_first_five_lines(self):
+        assert extract_merchant("1\n2\n3\n4\n5\nDecathlon") is None
+
+    def test_travel_has_priority(self):
+        text = "Pharmacie de l'aeroport\nTotal 12,00"
+        assert extract_receipt_fields(text)["category"] == "travel"
+
+    def test_medical(self):
+        assert extract_receipt_fields("PHARMACIE CENTRALE\nTotal 2,36")["category"] == "medical"
+
+    def test_keyword_inside_word(self):
+        # Substring match, as before: "entrainement" contains "train"
+        assert extract_receipt_fields("Club\nentrainement 20,00")["category"] == "travel"
+
+    def test_default_category(self):
+        assert extract_receipt_fields("Decathlon\nTotal 179,88")["category"] == "invoices"
+
+
+class TestPreviousFunctions:
+
+    def test_same_results_on_corpus(self):
+        corpus = load_corpus(DEFAULT_CORPUS)
+        assert corpus
+        for text in corpus:
+            assert extract_receipt_fields(text) == previous_extract(text)
+
+    @pytest.mark.parametrize("text", [
+        "solde net à payer 0,00 100000,01 3.70 total 0,00",
+        "tva incluse totaux 1,15 lait 3.70 0,00",
+        "TOTAL 12,50 net 3,20 4,10",
+        "Sous total : 4,10\nTOTAL = $ 3,20\nnet a payer 2.05",
+        "Montant: 4.99$\nRendu 0,01",
+        "TTC\nrendu 4,20",
+        "Taxi\nle 12 mars 2024\nTotal 18,00",
+        "Cabinet\n32/13/2024\nle 4 oct. 2024",
+        "air france\npharmacie\n2024-09-30",
+    ])
+    def test_same_results(self, text):
+        assert extract_receipt_fields(text) == previous_extract(text)
+
+    @pytest.mark.parametrize("text, field, previous, single_pass", [
+        # A date reusing the digits of an amount or of another date
+        ("154,56 mai\n2028", "date", "56/05/2028", None),
+        ("2012/05/2024", "date", "12/05/2024", "20/05/2012"),
+        ("32/13/2024-12/05/2024", "date", "05/12/2024", None),
+        # An amount starting inside a longer number
+        ("facture 1,234.56", "amount", 234.56, None),
+        # A keyword starting inside another
+        ("netrain", "category", "travel", "invoices"),
+    ])
+    def test_overlapping_matches_differ(self, text, field, previous, single_pass):
+        assert previous_extract(text)[field] == previous
+        assert extract_receipt_fields(text)[field] == single_pass
@@ -0,0 +1,58 @@
+"""
+Receipt OCR pool test suite (services/receipt_ocr.py)
+- Jobs run in worker processes and report per-stage timings
+- Decode errors keep the original error messages
+- A full queue is rejected immediately (OCRPoolBusy)
+"""
+
+import asyncio
+
+import pytest
+
+from services import metrics
+from services.receipt_ocr import ReceiptOCRPool, OCRPoolBusy, run_receipt_ocr
+
+
+class TestRunReceiptOCR:
+
+    def test_invalid_image_reports_error(self):
+        result = run_receipt_ocr(b"definitely not an image")
+        assert result["text"] is None
+        assert result["error"].startswith("Failed to open image")
+
+    def test_invalid_pdf_reports_error(self):
+        result = run_receipt_ocr(b"%PDF-1.4 truncated")
+        assert result["text"] is None
+        assert "PDF" in result["error"]
+
+
+class TestReceiptOCRPool:
+
+    def setup_method(self):
+        metrics.reset()
+
+    def test_job_runs_in_worker(self):
+        pool = ReceiptOCRPool(workers=1, max_queue=2, timeout=60)
+
+        async def scenario():
+            try:
+                return await pool.run(b"not an image")
+            finally:
+                pool.shutdown()
+
+        result = asyncio.run(scenario())
+        assert result["error"].startswith("Failed to open image")
+        assert pool.depth == 0
+        stages = {entry["labels"]["stage"] for entry in metrics.snapshot()["receipt_ocr_stage_seconds"]}
+        assert "queue_wait" in stages
+
+    def test_full_queue_rejected(self):
+        pool = ReceiptOCRPool(workers=1, max_queue=0, timeout=60)
+
+        async def scenario():
+            await pool.run(b"not an image")
+
+        with pytest.raises(OCRPoolBusy):
+            asyncio.run(scenario())
+        assert metrics.get_counter("receipt_ocr_rejected_total") == 1
+        assert pool.depth == 0
@@ -0,0 +1,143 @@
+"""
+Session cache test suite (services/session_cache.py)
+- LRU bound
+- TTL expiry, never later than the session expires_at
+- Invalidation by token (logout), by user (team removal) and on user updates (routes/user_routes.py)
+"""
+
+import time
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import user_routes
+from services.session_cache import SessionCache
+
+
+def make_user(user_id: str) -> dict:
+    return {"user_id": user_id, "email": f"{user_id}@test.com", "name": user_id, "role": "player"}
+
+
+class TestSessionCacheLookup:
+    """Hit / miss behaviour"""
+
+    def test_miss_then_hit(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=60)
+        assert cache.get("session_a") is None
+        cache.put("session_a", make_user("user_a"))
+        assert cache.get("session_a")["user_id"] == "user_a"
+
+    def test_lru_eviction(self):
+        cache = SessionCache(max_entries=2, ttl_seconds=60)
+        cache.put("s1", make_user("u1"))
+        cache.put("s2", make_user("u2"))
+        cache.get("s1")  # s2 becomes least recently used
+        cache.put("s3", make_user("u3"))
+        assert len(cache) == 2
+        assert cache.get("s2") is None
+        assert cache.get("s1") is not None
+        assert cache.get("s3") is not None
+
+
+class TestSessionCacheExpiry:
+    """TTL and expires_at bounds"""
+
+    def test_ttl_expiry(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=0.05)
+        cache.put("s1", make_user("u1"))
+        time.sleep(0.1)
+        assert cache.get("s1") is None
+        assert len(cache) == 0
+
+    def test_expires_at_caps_ttl(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=3600)
+        cache.put("s1", make_user("u1"), datetime.now(timezone.utc) + timedelta(milliseconds=50))
+        assert cache.get("s1") is not None
+        time.sleep(0.1)
+        assert cache.get("s1") is None
+
+    def test_already_expired_session_not_cached(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=3600)
+        cache.put("s1", make_user("u1"), datetime.now(timezone.utc) - timedelta(seconds=1))
+        assert len(cache) == 0
+
+    def test_naive_expires_at_treated_as_utc(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=3600)
+        naive = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=1)
+        cache.put("s1", make_user("u1"), naive)
+        assert cache.get("s1") is not None
+
+
+class TestSessionCacheInvalidation:
+    """Logout and team-member removal"""
+
+    def test_invalidate_token(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=60)
+        cache.put("s1", make_user("u1"))
+        cache.invalidate("s1")
+        assert cache.get("s1") is None
+
+    def test_invalidate_user_drops_all_sessions(self):
+        cache = SessionCache(max_entries=10, ttl_seconds=60)
+        cache.put("s1", make_user("u1"))
+        cache.put("s2", make_user("u1"))
+        cache.put("s3", make_user("u2"))
+        cache.invalidate_user("u1")
+        assert cache.get("s1") is None
+        assert cache.get("s2") is None
+        assert cache.get("s3") is not None
+
+
+class FakeUsers:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc) if all(self.doc.get(k) == v for k, v in query.items()) else None
+
+    async def update_one(self, query, update):
+        matched = await self.find_one(query) is not None
+        if matched:
+            self.doc.update(update["$set"])
+        return type("Result", (), {"matched_count": int(matched)})()
+
+    async def find_one_and_update(self, query, update, projection=None):
+        if (await self.update_one(query, update)).matched_count == 0:
+            return None
+        return dict(self.doc)
+
+
+class TestUserRoutesInvalidation:
+    """Profile and onboarding updates drop the user's cached sessions"""
+
+    @pytest.fixture
+    def setup(self, monkeypatch):
+        cache = SessionCache(max_entries=10, ttl_seconds=60)
+        user_id = ObjectId()
+        users = FakeUsers({"_id": user_id, "user_id": "user_a", "email": "user_a@test.com", "prenom": "A"})
+        monkeypatch.setattr(user_routes, "session_cache", cache)
+        monkeypatch.setattr(user_routes, "db", type("DB", (), {"users": users})())
+        app = FastAPI()
+        app.include_router(user_routes.router)
+        with TestClient(app) as client:
+            yield client, cache, str(user_id)
+
+    @pytest.mark.parametrize("method, path, body", [
+        ("put", "/api/users/profile/{id}", {"prenom": "B"}),
+        ("put", "/api/users/onboarding/{id}", {"onboardingStep": 3}),
+        ("post", "/api/users/onboarding/complete/{id}", None),
+        ("post", "/api/users/onboarding/step/{id}?step=3", None),
+        ("post", "/api/users/onboarding", {"prenom": "B", "email": "user_a@test.com"}),
+    ])
+    def test_update_invalidates_sessions(self, setup, method, path, body):
+        client, cache, user_id = setup
+        cache.put("s1", make_user("user_a"))
+        cache.put("s2", make_user("user_b"))
+
+        response = client.request(method, path.format(id=user_id), json=body)
+        assert response.status_code == 200
+        assert cache.get("s1") is None
+        assert cache.get("s2") is not None
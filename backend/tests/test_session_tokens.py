@@ -0,0 +1,85 @@
+"""
+Signed session tokens test suite (services/session_tokens.py)
+- HMAC signature and expiry checks
+- Revocation list: single token (logout) and per-user (role change)
+"""
+
+import time
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from services import session_tokens
+from services.session_tokens import RevocationList, issue_token, verify_token
+
+
+USER = {
+    "user_id": "user_abc123",
+    "email": "player@test.com",
+    "name": "Test Player",
+    "picture": None,
+    "role": "agent",
+    "player_id": "user_player1",
+}
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(session_tokens, "SESSION_TOKEN_SECRET", "test-secret")
+
+
+class TestSignedTokens:
+    """Issue / verify"""
+
+    def test_roundtrip_claims(self):
+        token = issue_token(USER, datetime.now(timezone.utc) + timedelta(days=7))
+        assert token.startswith("cc1.")
+        claims = verify_token(token)
+        assert claims["uid"] == "user_abc123"
+        assert claims["role"] == "agent"
+        assert claims["pid"] == "user_player1"
+        assert claims["jti"]
+
+    def test_tampered_payload_rejected(self):
+        token = issue_token(USER, datetime.now(timezone.utc) + timedelta(days=7))
+        prefix, payload, signature = token.split(".")
+        tampered = f"{prefix}.{payload[:-2]}AA.{signature}"
+        assert verify_token(tampered) is None
+
+    def test_wrong_secret_rejected(self, monkeypatch):
+        token = issue_token(USER, datetime.now(timezone.utc) + timedelta(days=7))
+        monkeypatch.setattr(session_tokens, "SESSION_TOKEN_SECRET", "other-secret")
+        assert verify_token(token) is None
+
+    def test_expired_token_rejected(self):
+        token = issue_token(USER, datetime.now(timezone.utc) - timedelta(seconds=1))
+        assert verify_token(token) is None
+
+    def test_opaque_token_not_verified(self):
+        assert verify_token("session_abcdef") is None
+
+
+class TestRevocationList:
+    """In-memory revocation set"""
+
+    def test_revoke_single_token(self):
+        revocations = RevocationList()
+        claims = verify_token(issue_token(USER, datetime.now(timezone.utc) + timedelta(days=1)))
+        assert not revocations.is_revoked(claims)
+        revocations.add_jti(claims["jti"], claims["exp"])
+        assert revocations.is_revoked(claims)
+
+    def test_revoke_user_only_affects_older_tokens(self):
+        revocations = RevocationList()
+        old = verify_token(issue_token(USER, datetime.now(timezone.utc) + timedelta(days=1)))
+        revocations.add_user(USER["user_id"], time.time())
+        new = verify_token(issue_token(USER, datetime.now(timezone.utc) + timedelta(days=1)))
+        assert revocations.is_revoked(old)
+        assert not revocations.is_revoked(new)
+
+    def test_prune_drops_expired_jtis(self):
+        revocations = RevocationList()
+        revocations.add_jti("expired", time.time() - 1)
+        revocations.add_jti("live", time.time() + 3600)
+        revocations.prune()
+        assert len(revocations) == 1
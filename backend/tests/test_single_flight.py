@@ -0,0 +1,94 @@
+"""
+Single-flight test suite (services/single_flight.py)
+- Concurrent callers with the same key share one call
+- Different keys run independently
+- Exceptions are shared; a cancelled caller does not cancel the shared call
+"""
+
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+
+    def test_concurrent_same_key_share_one_call(self):
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.05)
+            return f"result-{key}"
+
+        async def scenario():
+            flight = SingleFlight("test")
+            results = await asyncio.gather(*(flight.do("s1", fetch, "s1") for _ in range(5)))
+            assert flight.in_flight() == 0
+            return results
+
+        results = asyncio.run(scenario())
+        assert results == ["result-s1"] * 5
+        assert calls == ["s1"]
+
+    def test_different_keys_not_coalesced(self):
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key
+
+        async def scenario():
+            flight = SingleFlight("test")
+            return await asyncio.gather(flight.do("a", fetch, "a"), flight.do("b", fetch, "b"))
+
+        assert asyncio.run(scenario()) == ["a", "b"]
+        assert sorted(calls) == ["a", "b"]
+
+    def test_sequential_calls_not_cached(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return len(calls)
+
+        async def scenario():
+            flight = SingleFlight("test")
+            return [await flight.do("k", fetch), await flight.do("k", fetch)]
+
+        assert asyncio.run(scenario()) == [1, 2]
+
+    def test_exception_shared(self):
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        async def scenario():
+            flight = SingleFlight("test")
+            return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(calls) == 1
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            flight = SingleFlight("test")
+            first = asyncio.ensure_future(flight.do("k", slow))
+            second = asyncio.ensure_future(flight.do("k", slow))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            return await second
+
+        assert asyncio.run(scenario()) == "done"
@@ -0,0 +1,141 @@
+"""
+Tiered invoice OCR test suite (services/ocr_service.py local tier)
+- Tesseract text is mapped to the InvoiceData shape with a field-based confidence
+- Easy receipts are answered locally, without a Vision call
+- Missing required fields, low confidence or implausible values escalate to Vision
+- Escalations are counted by reason
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import image_quality, merchant_index, metrics, ocr_cache, ocr_service
+from services.ocr_service import build_local_invoice_data, escalation_reasons
+
+RECENT = (datetime.now() - timedelta(days=10)).strftime("%d/%m/%Y")
+
+TAXI_RECEIPT = f"""TAXI G7
+Course Paris - Orly
+Date: {RECENT}
+TOTAL TTC 42,30 EUR
+Merci de votre confiance
+"""
+
+UNDATED_RECEIPT = """BOULANGERIE DU MARCHE
+2 croissants
+TOTAL 3,40
+"""
+
+
+class FakePool:
+    def __init__(self, text="", error=None, exc=None):
+        self.text = text
+        self.error = error
+        self.exc = exc
+        self.calls = 0
+
+    async def run(self, source):
+        self.calls += 1
+        if self.exc is not None:
+            raise self.exc
+        return {"text": self.text, "error": self.error, "timings": {}, "started_at": 0.0}
+
+
+@pytest.fixture
+def vision(monkeypatch):
+    calls = []
+
+    async def fake_vision(image_base64):
+        calls.append(image_base64)
+        return {"success": True, "data": {"montantTotal": 3.4, "dateFacture": RECENT, "categorie": "Restauration"}}
+
+    metrics.reset()
+    monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+    monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+    return calls
+
+
+def analyze(monkeypatch, pool):
+    monkeypatch.setattr(ocr_service, "receipt_ocr_pool", pool)
+    # Blank placeholder image: the quality gate would refuse it
+    monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+    return asyncio.run(ocr_service.analyze_document(_png_bytes(), "ticket.png", "image"))
+
+
+class TestLocalExtraction:
+
+    def test_invoice_shape(self):
+        data = build_local_invoice_data(TAXI_RECEIPT)
+        assert data["montantTotal"] == 42.3
+        assert data["dateFacture"] == RECENT
+        assert data["fournisseur"] == "Taxi G7"
+        assert data["categorie"] == "Transport"
+        assert data["lignes"] == [] and data["currency"] == "EUR"
+        assert data["confidence"] == 1.0
+        assert data["needsReview"] is False
+
+    def test_confidence_reflects_missing_fields(self):
+        data = build_local_invoice_data(UNDATED_RECEIPT)
+        assert data["dateFacture"] is None
+        assert data["confidence"] == 0.65
+
+    def test_complete_result_is_not_escalated(self):
+        assert escalation_reasons(build_local_invoice_data(TAXI_RECEIPT)) == []
+
+    def test_missing_field_and_low_confidence(self):
+        reasons = escalation_reasons(build_local_invoice_data(UNDATED_RECEIPT))
+        assert reasons == ["missing_dateFacture", "low_confidence"]
+
+    def test_thresholds_are_configurable(self, monkeypatch):
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_REQUIRED_FIELDS", ["montantTotal"])
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_MIN_CONFIDENCE", 0.6)
+        assert escalation_reasons(build_local_invoice_data(UNDATED_RECEIPT)) == []
+
+    def test_implausible_amount_escalates(self):
+        data = build_local_invoice_data(TAXI_RECEIPT.replace("42,30", "99999,00"))
+        assert "validation" in escalation_reasons(data)
+
+
+class TestTieredAnalyzeDocument:
+
+    def test_easy_receipt_answered_locally(self, monkeypatch, vision):
+        pool = FakePool(TAXI_RECEIPT)
+        result = analyze(monkeypatch, pool)
+
+        assert result["data"]["extractionPath"] == "local"
+        assert result["data"]["montantTotal"] == 42.3
+        assert result["data"]["fileType"] == "image"
+        assert vision == []
+        assert metrics.get_counter("invoice_extraction_path_total", path="local") == 1
+
+    def test_incomplete_receipt_escalates(self, monkeypatch, vision):
+        result = analyze(monkeypatch, FakePool(UNDATED_RECEIPT))
+
+        assert result["data"]["extractionPath"] == "vision"
+        assert len(vision) == 1
+        assert metrics.get_counter("invoice_ocr_escalations_total", reason="missing_dateFacture") == 1
+
+    def test_busy_pool_escalates(self, monkeypatch, vision):
+        result = analyze(monkeypatch, FakePool(exc=asyncio.TimeoutError()))
+
+        assert result["data"]["extractionPath"] == "vision"
+        assert metrics.get_counter("invoice_ocr_escalations_total", reason="local_unavailable") == 1
+
+    def test_local_tier_can_be_disabled(self, monkeypatch, vision):
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        pool = FakePool(TAXI_RECEIPT)
+        result = analyze(monkeypatch, pool)
+
+        assert pool.calls == 0
+        assert result["data"]["extractionPath"] == "vision"
+
+
+def _png_bytes() -> bytes:
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
@@ -0,0 +1,163 @@
+"""
+Pipeline timing test suite (services/timing.py)
+- Stages of the active trace are recorded (repeats add up, worker threads
+  included) and observed as pipeline_stage_seconds / pipeline_seconds
+- stage() is a no-op outside a trace; a nested trace of the same pipeline joins it
+- analyze_document and the receipt analysis time their stages; ?debug=true
+  returns them in "timings"
+"""
+
+import io
+import time
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from services import image_quality, merchant_index, metrics, ocr_backends, ocr_cache, ocr_service, timing
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def histogram(name, **labels):
+    for entry in metrics.snapshot().get(name, []):
+        if entry["labels"] == labels:
+            return entry
+    return None
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    monkeypatch.setattr(ocr_backends, "OCR_BACKEND", "stub")
+    monkeypatch.setattr(ocr_backends, "OCR_STUB_LATENCY_MS", 0)
+    monkeypatch.setattr(ocr_backends, "_instances", {})
+    monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+    monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+    monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+
+class TestTrace:
+
+    def test_stages_recorded_and_observed(self):
+        with timing.trace("test") as trace:
+            with timing.stage("a"):
+                time.sleep(0.01)
+            with timing.stage("b"):
+                pass
+            with timing.stage("a"):
+                time.sleep(0.01)
+            trace.outcome = "done"
+
+        assert list(trace.stages) == ["a", "b"]
+        assert trace.stages["a"] >= 0.02
+        assert histogram("pipeline_stage_seconds", pipeline="test", stage="a")["count"] == 1
+        assert histogram("pipeline_seconds", pipeline="test", outcome="done")["count"] == 1
+        summary = trace.to_dict()
+        assert summary["totalMs"] >= summary["stagesMs"]["a"] >= 20
+
+    def test_stage_outside_trace_is_noop(self):
+        with timing.stage("orphan"):
+            pass
+        timing.record("orphan", 1.0)
+        assert timing.current() is None
+        assert metrics.snapshot() == {}
+
+    def test_nested_trace_joins(self):
+        with timing.trace("test") as outer:
+            with timing.trace("test") as inner:
+                timing.record("ocr.tesseract", 0.5)
+            assert inner is outer
+            assert histogram("pipeline_seconds", pipeline="test", outcome="unknown") is None
+        assert outer.stages == {"ocr.tesseract": 0.5}
+        assert histogram("pipeline_seconds", pipeline="test", outcome="unknown")["count"] == 1
+
+    def test_error_outcome(self):
+        with pytest.raises(ValueError):
+            with timing.trace("test"):
+                raise ValueError()
+        assert histogram("pipeline_seconds", pipeline="test", outcome="error")["count"] == 1
+
+    def test_stages_from_worker_threads(self):
+        def work():
+            with timing.stage("thread"):
+                time.sleep(0.01)
+
+        async def traced():
+            with timing.trace("test") as trace:
+                await asyncio.gather(asyncio.to_thread(work), asyncio.to_thread(work))
+            return trace
+
+        assert run(traced()).stages["thread"] >= 0.02
+
+
+class TestAnalyzeDocument:
+
+    def test_stages_and_debug_field(self, stub_backend):
+        result = run(ocr_service.analyze_document(png_bytes(), "ticket.png", "image", debug=True))
+
+        timings = result["timings"]
+        assert timings["pipeline"] == "analyze_document" and timings["outcome"] == "vision"
+        for stage in ("cache_lookup", "quality_gate", "decode", "crop", "preprocess", "encode",
+                      "base64_encode", "llm_call", "parse_json", "validate"):
+            assert stage in timings["stagesMs"], stage
+        assert histogram("pipeline_stage_seconds", pipeline="analyze_document", stage="llm_call")["count"] == 1
+        assert histogram("pipeline_seconds", pipeline="analyze_document", outcome="vision")["count"] == 1
+
+    def test_no_timings_without_debug(self, stub_backend):
+        result = run(ocr_service.analyze_document(png_bytes(), "ticket.png", "image"))
+        assert "timings" not in result
+
+    def test_upload_endpoint_debug(self, stub_backend):
+        from routes import documents
+
+        app = FastAPI()
+        app.include_router(documents.router)
+        with TestClient(app) as client:
+            files = {"file": ("ticket.png", png_bytes(), "image/png")}
+            debug = client.post("/api/invoices/upload?debug=true", files=files).json()
+            plain = client.post("/api/invoices/upload", files=files).json()
+
+        assert debug["success"] is True
+        assert "llm_call" in debug["timings"]["stagesMs"]
+        assert plain["timings"] is None
+
+
+class TestReceiptAnalysis:
+
+    def test_stages_and_debug_field(self, monkeypatch):
+        import server
+
+        class FakePool:
+            async def run(self, source):
+                timing.record("ocr.tesseract", 0.25)
+                return {"text": "TAXI G7\n12/03/2024\nTOTAL TTC 42,30 EUR\n", "error": None}
+
+        monkeypatch.setattr(server, "receipt_ocr_pool", FakePool())
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+        request = server.OCRRequest(image_base64="dGlja2V0")
+        result = run(server.analyze_receipt(request, debug=True))
+
+        assert result.success is True and result.amount == 42.3
+        stages = result.timings["stagesMs"]
+        assert {"base64_decode", "cache_lookup", "ocr", "extract_fields"} <= set(stages)
+        assert stages["ocr.tesseract"] == 250.0
+        assert histogram("pipeline_seconds", pipeline="analyze_receipt", outcome="success")["count"] == 1
+        assert run(server.analyze_receipt(request)).timings is None
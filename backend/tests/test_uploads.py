@@ -0,0 +1,93 @@
+"""
+Streaming upload test suite (services/uploads.py)
+- Multipart "file" field and raw bodies are spooled with their metadata
+- Small uploads stay in memory, large ones go to a temporary file that is removed on close
+- The size cap rejects oversized uploads
+"""
+
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services import uploads
+from services.uploads import UploadError, UploadTooLarge, receive_upload
+
+MAX_BYTES = 64 * 1024
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    seen = {}
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        try:
+            received = await receive_upload(request, MAX_BYTES)
+        except UploadTooLarge:
+            return {"error": "too large"}
+        except UploadError as e:
+            return {"error": str(e)}
+        with received:
+            source = received.source()
+            seen["path"] = received.path
+            data = source if isinstance(source, bytes) else open(source, "rb").read()
+            return {
+                "size": received.size,
+                "on_disk": received.path is not None,
+                "filename": received.filename,
+                "content_type": received.content_type,
+                "ok": data == b"x" * received.size,
+            }
+
+    client = TestClient(app)
+    client.seen = seen
+    return client
+
+
+@pytest.fixture(autouse=True)
+def small_spool(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_SPOOL_MEMORY_BYTES", 1024)
+
+
+class TestReceiveUpload:
+
+    def test_multipart_field(self):
+        client = make_client()
+        response = client.post(
+            "/upload",
+            data={"note": "ignored"},
+            files={"file": ("receipt.png", b"x" * 100, "image/png")},
+        )
+        assert response.json() == {
+            "size": 100, "on_disk": False, "filename": "receipt.png",
+            "content_type": "image/png", "ok": True,
+        }
+
+    def test_raw_body(self):
+        client = make_client()
+        response = client.post("/upload", content=b"x" * 10, headers={"content-type": "application/pdf"})
+        body = response.json()
+        assert body["size"] == 10
+        assert body["content_type"] == "application/pdf"
+
+    def test_large_upload_spooled_to_disk_and_removed(self):
+        client = make_client()
+        response = client.post("/upload", files={"file": ("big.jpg", b"x" * 5000, "image/jpeg")})
+        body = response.json()
+        assert body["on_disk"] is True
+        assert body["ok"] is True
+        assert not os.path.exists(client.seen["path"])
+
+    def test_size_cap(self):
+        client = make_client()
+        response = client.post("/upload", files={"file": ("huge.jpg", b"x" * (MAX_BYTES + 1), "image/jpeg")})
+        assert response.json() == {"error": "too large"}
+        response = client.post("/upload", content=b"x" * (MAX_BYTES + 1))
+        assert response.json() == {"error": "too large"}
+
+    def test_missing_field(self):
+        client = make_client()
+        response = client.post("/upload", files={"other": ("a.png", b"x", "image/png")})
+        assert "Missing 'file'" in response.json()["error"]
@@ -0,0 +1,136 @@
+"""
+Vision payload test suite (services/vision_payload.py)
+- Images are reduced to the model's working resolution, never upscaled
+- Ink-on-paper pages are sent as grayscale PNG, photos as JPEG
+- Quality then resolution are lowered until the byte budget is met
+- analyze_document sends the optimized payload
+"""
+
+import io
+import asyncio
+import base64
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from services import image_quality, merchant_index, metrics, ocr_cache, ocr_service, vision_payload
+from services.vision_payload import fit_vision_resolution, analyze_tones, optimize_payload
+
+
+def document_page(size=(2480, 3508)) -> Image.Image:
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    for i in range(40):
+        draw.rectangle((200, 300 + i * 70, 1600 + (i * 37) % 600, 330 + i * 70), fill="black")
+    return page
+
+
+def photo(size=(1600, 1200), seed=0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+def decoded(payload) -> Image.Image:
+    return Image.open(io.BytesIO(payload.data))
+
+
+class TestResolution:
+
+    def test_fits_model_resolution(self):
+        assert fit_vision_resolution(document_page()).size == (768, 1086)
+        assert fit_vision_resolution(photo((4032, 3024))).size == (1024, 768)
+
+    def test_long_receipt_bounded_by_long_side(self):
+        assert fit_vision_resolution(Image.new("RGB", (600, 4000))).size == (307, 2048)
+
+    def test_small_image_not_upscaled(self):
+        image = Image.new("RGB", (400, 300))
+        assert fit_vision_resolution(image) is image
+
+
+class TestFormat:
+
+    def setup_method(self):
+        metrics.reset()
+
+    def test_tones(self):
+        assert analyze_tones(document_page()) == (True, True)
+        assert analyze_tones(photo()) == (False, False)
+        assert analyze_tones(photo().convert("L")) == (True, False)
+
+    def test_document_sent_as_grayscale_png(self):
+        payload = optimize_payload(document_page())
+        assert payload.format == "PNG" and payload.grayscale
+        assert decoded(payload).mode == "L"
+        assert decoded(payload).size == (768, 1086)
+
+    def test_photo_sent_as_jpeg(self):
+        payload = optimize_payload(photo())
+        assert payload.format == "JPEG"
+        assert payload.mime_type == "image/jpeg"
+        assert decoded(payload).mode == "RGB"
+
+    def test_webp_when_enabled(self, monkeypatch):
+        monkeypatch.setattr(vision_payload, "VISION_PAYLOAD_WEBP", True)
+        assert optimize_payload(photo(), max_bytes=10_000_000).format == "WEBP"
+
+    def test_metrics_recorded(self):
+        optimize_payload(photo())
+        snapshot = metrics.snapshot()
+        assert snapshot["vision_payload_bytes"][0]["labels"] == {"format": "JPEG"}
+
+
+class TestBudget:
+
+    def test_quality_lowered_to_fit(self):
+        full = optimize_payload(photo(), max_bytes=10_000_000)
+        payload = optimize_payload(photo(), max_bytes=int(len(full.data) * 0.8))
+        assert payload.quality < full.quality
+        assert payload.size == full.size
+
+    def test_resolution_lowered_to_fit(self):
+        payload = optimize_payload(photo(), max_bytes=200_000)
+        assert len(payload.data) <= 200_000
+        assert payload.size[0] < 1024
+
+    def test_smallest_returned_when_nothing_fits(self):
+        payload = optimize_payload(photo(), max_bytes=1_000)
+        assert payload.quality == 55
+        assert payload.size == (512, 384)
+
+
+class TestAnalyzeDocumentPayload:
+
+    def test_optimized_payload_sent(self, monkeypatch):
+        sent = []
+
+        async def fake_vision(image_base64):
+            sent.append(base64.b64decode(image_base64))
+            return {"success": True, "data": {"montantTotal": 12.0, "categorie": "Autre"}}
+
+        monkeypatch.setattr(ocr_service, "extract_invoice_data_with_openai", fake_vision)
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(image_quality, "QUALITY_GATE_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+        buffer = io.BytesIO()
+        photo((3000, 2000)).save(buffer, format="PNG")
+        result = asyncio.run(ocr_service.analyze_document(buffer.getvalue(), "ticket.png", "image"))
+
+        assert result["success"]
+        image = Image.open(io.BytesIO(sent[0]))
+        assert image.format == "JPEG"
+        assert max(image.size) <= 2048 and min(image.size) <= 768
+
+    def test_truncated_image_is_an_error(self, monkeypatch):
+        monkeypatch.setattr(ocr_service, "OCR_LOCAL_TIER_ENABLED", False)
+        monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+        monkeypatch.setattr(merchant_index, "MERCHANT_INDEX_ENABLED", False)
+
+        buffer = io.BytesIO()
+        photo().save(buffer, format="PNG")
+        result = asyncio.run(ocr_service.analyze_document(buffer.getvalue()[:2000], "ticket.png", "image"))
+
+        assert result["success"] is False
+        assert "Impossible d'ouvrir l'image" in result["error"]
@@ -313,6 +313,7 @@ export default function DocumentsScreen() {
         file_base64: base64,
         file_type: type,
         file_name: name,
+        userId: 'default-user',
       });
 
       if (response.data.success && response.data.data) {
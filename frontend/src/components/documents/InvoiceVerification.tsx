@@ -43,6 +43,10 @@ export interface InvoiceData {
   description?: string | null;
   fileType?: string;
   pageCount?: number;
+  pagesAnalyzed?: number;
+  totalPage?: number;
+  extractionPath?: 'text' | 'local' | 'vision' | 'fallback';
+  categorySource?: 'merchant_index';
   warnings?: string[];
 }
 